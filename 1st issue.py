@@ -1,57 +1,466 @@
-class Table:
-    def select_rows(self, where_clause):
-        # select rows based on the given where_clause
-        selected_rows = []
-        for row in self.rows:
-            if self._where_clause_eval(row, where_clause):
-                selected_rows.append(row)
-        return selected_rows
-
-    def _where_clause_eval(self, row, where_clause):
-        # evaluate the where_clause for a single row
-        if where_clause is None:
-            return True
-        if isinstance(where_clause, tuple):
-            # handle nested where clauses
-            left = self._where_clause_eval(row, where_clause[0])
-            right = self._where_clause_eval(row, where_clause[2])
-            if where_clause[1] == 'AND':
-                return left and right
-            elif where_clause[1] == 'OR':
-                return left or right
-        else:
-            column_name, operator, value = where_clause
-            column = self.get_column(column_name)
-            if column.data_type == 'int':
-                value = int(value)
-            elif column.data_type == 'float':
-                value = float(value)
-            elif column.data_type == 'bool':
-                value = bool(value)
-            row_value = row[column_name]
-            if operator == '=':
-                return row_value == value
-            elif operator == '<':
-                return row_value < value
-            elif operator == '>':
-                return row_value > value
-            elif operator == '<=':
-                return row_value <= value
-            elif operator == '>=':
-                return row_value >= value
-            elif operator == '<>':
-                return row_value != value
-            elif operator == 'NOT':
-                return not self._where_clause_eval(row, value)
-            elif operator == 'BETWEEN':
-                return row_value >= value[0] and row_value <= value[1]
-        return False
-      # Added functionality for the keywords "NOT" and "BETWEEN"
-    
-
-class MiniDB:
-    def execute_select(self, table_name, where_clause=None):
-        # execute a SELECT statement and return the selected rows
-        table = self.tables[table_name]
-        selected_rows = table.select_rows(where_clause)
-        return selected_rows
+import array
+from itertools import compress, islice, repeat
+from operator import eq, ge, gt, le, lt, ne
+
+from mvcc import ColumnView
+from parallel import aggregate_partitions, clause_columns, scan_partitions
+
+try:
+    import numpy
+except ImportError:  # masks fall back to bytes objects, e.g. for the partitions of row tables
+    numpy = None
+
+# casts applied to a where_clause value according to the column's data_type
+VALUE_CASTS = {
+    'int': int,
+    'float': float,
+    'bool': bool,
+}
+
+
+def _cast_value(column, value):
+    # cast a where_clause value to the data type of the column it is compared with
+    cast = VALUE_CASTS.get(column.data_type)
+    if cast is None:
+        return value
+    return cast(value)
+
+
+def _compile_comparison(column_name, operator, value):
+    # build one specialized predicate for a single column comparison, so the
+    # per-row work is just a dict lookup and one comparison
+    if operator == '=':
+        return lambda row: row[column_name] == value
+    elif operator == '<':
+        return lambda row: row[column_name] < value
+    elif operator == '>':
+        return lambda row: row[column_name] > value
+    elif operator == '<=':
+        return lambda row: row[column_name] <= value
+    elif operator == '>=':
+        return lambda row: row[column_name] >= value
+    elif operator == '<>':
+        return lambda row: row[column_name] != value
+    elif operator == 'BETWEEN':
+        low, high = value
+        return lambda row: low <= row[column_name] <= high
+    print(f"Error: Operator {operator} not supported in where clause")
+    return lambda row: False
+
+
+def compile_where_clause(table, where_clause):
+    # compile a where_clause tuple into a single predicate function
+    # the column is resolved and the value is cast once here instead of for every row
+    if where_clause is None:
+        return None
+    left, operator, right = where_clause
+    if operator == 'AND':
+        left_func = compile_where_clause(table, left)
+        right_func = compile_where_clause(table, right)
+        if left_func is None:
+            return right_func
+        if right_func is None:
+            return left_func
+        return lambda row: left_func(row) and right_func(row)
+    elif operator == 'OR':
+        left_func = compile_where_clause(table, left)
+        right_func = compile_where_clause(table, right)
+        if left_func is None or right_func is None:
+            return None
+        return lambda row: left_func(row) or right_func(row)
+    elif operator == 'NOT':
+        # the nested clause to negate is the third element of the tuple
+        func = compile_where_clause(table, right)
+        if func is None:
+            return lambda row: False
+        return lambda row: not func(row)
+    column = table.get_column(left)
+    if operator == 'BETWEEN':
+        value = (_cast_value(column, right[0]), _cast_value(column, right[1]))
+    else:
+        value = _cast_value(column, right)
+    return _compile_comparison(column.name, operator, value)
+
+
+def normalize_where_clause(table, where_clause):
+    # canonical form of a where_clause used as a result cache key: values are cast as the
+    # comparisons cast them and the operands of AND/OR chains are flattened, deduplicated
+    # and sorted, so clauses selecting the same rows in the same way share one key
+    # raises KeyError for an unknown column and TypeError for an unhashable value
+    if where_clause is None:
+        return None
+    left, operator, right = where_clause
+    if operator in ('AND', 'OR'):
+        operands = set()
+        for clause in (left, right):
+            key = normalize_where_clause(table, clause)
+            if key is None:
+                if operator == 'OR':
+                    return None  # OR with a missing side matches every row
+                continue  # AND ignores a missing side
+            if key[0] == operator:
+                operands.update(key[1])
+            else:
+                operands.add(key)
+        if not operands:
+            return None
+        if len(operands) == 1:
+            return operands.pop()
+        return (operator, tuple(sorted(operands, key=repr)))
+    elif operator == 'NOT':
+        return ('NOT', normalize_where_clause(table, right))
+    column = next((column for column in table.columns if column.name == left), None)
+    if column is None:
+        raise KeyError(left)
+    if operator == 'BETWEEN':
+        value = (_cast_value(column, right[0]), _cast_value(column, right[1]))
+    else:
+        value = _cast_value(column, right)
+    key = (operator, column.name, value)
+    hash(key)
+    return key
+
+
+# comparison functions used to build the boolean masks of columnar tables
+MASK_OPERATORS = {
+    '=': eq,
+    '<': lt,
+    '>': gt,
+    '<=': le,
+    '>=': ge,
+    '<>': ne,
+}
+
+
+def _column_mask(data, compare, value):
+    # compare every value of a column with value at once
+    # typed arrays are compared as zero-copy NumPy views when NumPy is installed,
+    # otherwise the mask is a bytes object holding one 0/1 byte per row
+    if numpy is not None:
+        if isinstance(data, ColumnView) and isinstance(data.data, array.array):
+            # a column of a snapshot: NumPy gets a copy of its rows, a view exporting the
+            # buffer of the live array would make the appends of writers fail
+            data = data.copy()
+        if isinstance(data, array.array):
+            return compare(numpy.frombuffer(data, dtype=data.typecode), value)
+        return numpy.fromiter(map(compare, data, repeat(value)), dtype=bool, count=len(data))
+    return bytes(map(compare, data, repeat(value)))
+
+
+def _empty_mask(size):
+    # mask that selects no rows
+    if numpy is not None:
+        return numpy.zeros(size, dtype=bool)
+    return bytes(size)
+
+
+def _mask_and(left_mask, right_mask):
+    if numpy is not None and isinstance(left_mask, numpy.ndarray):
+        return left_mask & right_mask
+    size = len(left_mask)
+    # AND every byte of the two masks in one big integer operation
+    return (int.from_bytes(left_mask, 'little') & int.from_bytes(right_mask, 'little')).to_bytes(size, 'little')
+
+
+def _mask_or(left_mask, right_mask):
+    if numpy is not None and isinstance(left_mask, numpy.ndarray):
+        return left_mask | right_mask
+    size = len(left_mask)
+    return (int.from_bytes(left_mask, 'little') | int.from_bytes(right_mask, 'little')).to_bytes(size, 'little')
+
+
+# byte translation table that flips the 0/1 bytes of a mask
+NOT_TABLE = bytes([1, 0]) + bytes(254)
+
+
+def _mask_not(mask):
+    if numpy is not None and isinstance(mask, numpy.ndarray):
+        return ~mask
+    return mask.translate(NOT_TABLE)
+
+
+def mask_row_ids(mask):
+    # get the ids of the rows selected by a mask
+    if numpy is not None and isinstance(mask, numpy.ndarray):
+        return numpy.flatnonzero(mask).tolist()
+    return list(compress(range(len(mask)), mask))
+
+
+def compute_where_mask(table, where_clause):
+    # evaluate the where_clause over whole columns of a columnar table at once
+    # returns one mask entry per row, or None when every row matches
+    if where_clause is None:
+        return None
+    left, operator, right = where_clause
+    if operator in ('AND', 'OR'):
+        left_mask = compute_where_mask(table, left)
+        right_mask = compute_where_mask(table, right)
+        if operator == 'AND':
+            if left_mask is None:
+                return right_mask
+            if right_mask is None:
+                return left_mask
+            return _mask_and(left_mask, right_mask)
+        if left_mask is None or right_mask is None:
+            return None
+        return _mask_or(left_mask, right_mask)
+    elif operator == 'NOT':
+        mask = compute_where_mask(table, right)
+        if mask is None:
+            return _empty_mask(len(table.rows))
+        return _mask_not(mask)
+    column = table.get_column(left)
+    data = table.get_column_data(column.name)
+    if operator == 'BETWEEN':
+        low, high = _cast_value(column, right[0]), _cast_value(column, right[1])
+        return _mask_and(_column_mask(data, ge, low), _column_mask(data, le, high))
+    compare = MASK_OPERATORS.get(operator)
+    if compare is None:
+        print(f"Error: Operator {operator} not supported in where clause")
+        return _empty_mask(len(data))
+    return _column_mask(data, compare, _cast_value(column, right))
+
+
+# rows built at once by the streaming selects of Table.iter_select_rows
+FETCH_BATCH_ROWS = 1024
+
+
+def _fetch_rows(rows, row_ids):
+    # iterate the rows with the given ids, fetching one batch of ids at a time
+    row_ids = iter(row_ids)
+    while True:
+        batch = list(islice(row_ids, FETCH_BATCH_ROWS))
+        if not batch:
+            return
+        if isinstance(rows, list):
+            yield from map(rows.__getitem__, batch)
+        else:
+            yield from rows.take(batch)
+
+
+# range operators that a BTree index can answer with a range scan
+RANGE_OPERATORS = ('<', '>', '<=', '>=', 'BETWEEN')
+
+
+def _index_row_ids(table, where_clause):
+    # find the ids of the rows that may satisfy the where_clause using the table indexes
+    # returns None when the indexes cannot narrow the search and a full scan is needed
+    left, operator, right = where_clause
+    if operator == 'AND':
+        # either side can narrow the search, both sides narrow it further
+        left_ids = _index_row_ids(table, left) if left is not None else None
+        right_ids = _index_row_ids(table, right) if right is not None else None
+        if left_ids is None:
+            return right_ids
+        if right_ids is None:
+            return left_ids
+        return left_ids & right_ids
+    elif operator == 'OR':
+        # both sides must be answered by an index, otherwise we scan anyway
+        if left is None or right is None:
+            return None
+        left_ids = _index_row_ids(table, left)
+        if left_ids is None:
+            return None
+        right_ids = _index_row_ids(table, right)
+        if right_ids is None:
+            return None
+        return left_ids | right_ids
+    elif operator == '=':
+        indexes = table.get_indexes(left)
+        if not indexes:
+            return None
+        # prefer a hash index for point lookups, a BTree index works as well
+        index = next((index for index in indexes if isinstance(index, HashIndex)), indexes[0])
+        return set(index.lookup(_cast_value(index.column, right)))
+    elif operator in RANGE_OPERATORS:
+        index = next((index for index in table.get_indexes(left) if isinstance(index, BTreeIndex)), None)
+        if index is None:
+            return None
+        if operator == 'BETWEEN':
+            low, high = _cast_value(index.column, right[0]), _cast_value(index.column, right[1])
+            return set(index.range_lookup(low, high))
+        value = _cast_value(index.column, right)
+        if operator == '<':
+            return set(index.range_lookup(high=value, include_high=False))
+        elif operator == '<=':
+            return set(index.range_lookup(high=value))
+        elif operator == '>':
+            return set(index.range_lookup(low=value, include_low=False))
+        return set(index.range_lookup(low=value))
+    # NOT and <> match most of the table, a scan is cheaper than an index
+    return None
+
+
+class Table:
+    def select_rows(self, where_clause):
+        # select rows based on the given where_clause
+        if self.partition_rows is not None:
+            # partitioned table: the partitions are filtered in worker processes
+            return self.parallel_select_rows(where_clause)
+        if self.storage == 'columnar':
+            # filter whole columns with a boolean mask and only build the selected rows
+            # (columnar tables need NumPy, see Table.__init__)
+            mask = compute_where_mask(self, where_clause)
+            if mask is None:
+                return list(self.rows)
+            return self.rows.take(mask_row_ids(mask))
+        predicate = self.compile_where_clause(where_clause)
+        if predicate is None:
+            return list(self.rows)
+        return [row for row in self.rows if predicate(row)]
+
+    def parallel_select_rows(self, where_clause, columns=None, workers=None):
+        # filter and project the partitions of the table in worker processes, the workers only
+        # send back the selected row ids and the values of the requested columns
+        columns, rows = self.parallel_select_tuples(where_clause, columns, workers)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def parallel_select_tuples(self, where_clause, columns=None, workers=None):
+        # same as parallel_select_rows, returning the column names and an iterator of the
+        # selected rows as tuples of their values
+        if columns is None:
+            columns = [column.name for column in self.columns]
+        if workers is None:
+            workers = self.workers
+        # only the compared and the projected columns are sent to the workers
+        partitions = self.get_partitions(clause_columns(where_clause, list(columns)))
+        _, values = scan_partitions(partitions, where_clause, columns, workers)
+        return columns, zip(*(values[name] for name in columns))
+
+    def parallel_aggregate(self, where_clause, group_by, aggregates, workers=None):
+        # aggregate the rows selected by where_clause per group in worker processes, each
+        # partition is folded into partial aggregates that are combined here; returns the
+        # dictionary of group key -> partial states of aggregates.aggregate_rows
+        if workers is None:
+            workers = self.workers
+        names = list(group_by) + [aggregate.column for aggregate in aggregates if aggregate.column is not None]
+        partitions = self.get_partitions(clause_columns(where_clause, names))
+        return aggregate_partitions(partitions, where_clause, group_by, aggregates, workers)
+
+    def compile_where_clause(self, where_clause):
+        # compile the where_clause once before scanning the rows
+        return compile_where_clause(self, where_clause)
+
+    def select_rows_by_index(self, where_clause):
+        # choose an access path for the where_clause: index lookups when the
+        # indexes can narrow the search, a full scan through select_rows otherwise
+        if where_clause is None or not self.indexes:
+            return self.select_rows(where_clause)
+        row_ids = _index_row_ids(self, where_clause)
+        if row_ids is None:
+            return self.select_rows(where_clause)
+        # the indexes may only answer part of the where_clause, so the
+        # candidate rows are checked against the whole predicate
+        predicate = self.compile_where_clause(where_clause)
+        rows = self.rows
+        if isinstance(rows, list):
+            candidates = [rows[row_id] for row_id in sorted(row_ids)]
+        else:
+            # columnar, paged and snapshot rows fetch a batch of row ids at once
+            candidates = rows.take(sorted(row_ids))
+        return [row for row in candidates if predicate(row)]
+
+    def iter_select_rows(self, where_clause):
+        # select_rows_by_index as an iterator: the rows are found and built as they are
+        # pulled, so a large result is never held in memory at once; a columnar table
+        # computes its mask up front, it takes one byte per row
+        if self.partition_rows is not None:
+            columns, rows = self.parallel_select_tuples(where_clause)
+            return (dict(zip(columns, row)) for row in rows)
+        if where_clause is not None and self.indexes:
+            row_ids = _index_row_ids(self, where_clause)
+            if row_ids is not None:
+                return filter(self.compile_where_clause(where_clause), _fetch_rows(self.rows, sorted(row_ids)))
+        if self.storage == 'columnar':
+            mask = compute_where_mask(self, where_clause)
+            if mask is None:
+                return iter(self.rows)
+            return _fetch_rows(self.rows, mask_row_ids(mask))
+        predicate = self.compile_where_clause(where_clause)
+        if predicate is None:
+            return iter(self.rows)
+        return filter(predicate, self.rows)
+
+    def _where_clause_eval(self, row, where_clause):
+        # evaluate the where_clause for a single row
+        if where_clause is None:
+            return True
+        if where_clause[1] in ('AND', 'OR'):
+            # handle nested where clauses
+            left = self._where_clause_eval(row, where_clause[0])
+            right = self._where_clause_eval(row, where_clause[2])
+            if where_clause[1] == 'AND':
+                return left and right
+            elif where_clause[1] == 'OR':
+                return left or right
+        else:
+            column_name, operator, value = where_clause
+            if operator == 'NOT':
+                return not self._where_clause_eval(row, value)
+            column = self.get_column(column_name)
+            if operator == 'BETWEEN':
+                value = (_cast_value(column, value[0]), _cast_value(column, value[1]))
+            else:
+                value = _cast_value(column, value)
+            row_value = row[column_name]
+            if operator == '=':
+                return row_value == value
+            elif operator == '<':
+                return row_value < value
+            elif operator == '>':
+                return row_value > value
+            elif operator == '<=':
+                return row_value <= value
+            elif operator == '>=':
+                return row_value >= value
+            elif operator == '<>':
+                return row_value != value
+            elif operator == 'BETWEEN':
+                return row_value >= value[0] and row_value <= value[1]
+        return False
+      # Added functionality for the keywords "NOT" and "BETWEEN"
+    
+
+class MiniDB:
+    def execute_select(self, table_name, where_clause=None, snapshot=None):
+        # execute a SELECT statement and return the selected rows
+        # the rows are read from a snapshot (see MiniDB.snapshot), by default one of the table
+        # alone, so a select never sees a half finished insert and never blocks a writer
+        if snapshot is not None:
+            table = snapshot[table_name]
+        else:
+            table = self.tables[table_name].snapshot()
+        try:
+            key = (table_name, normalize_where_clause(table, where_clause))
+        except (KeyError, TypeError, ValueError):
+            # unknown columns and values that cannot be cast or hashed are not cached,
+            # the select reports them as before
+            return table.select_rows_by_index(where_clause)
+        # the version the snapshot was taken at, the rows selected from it are of that version
+        version = table.version
+        cached_rows = self.result_cache.get(key, version)
+        if cached_rows is not None:
+            # copies of the cached row dicts, so a caller changing its rows doesn't change
+            # the result of the next hit
+            return [dict(row) for row in cached_rows]
+        selected_rows = table.select_rows_by_index(where_clause)
+        self.result_cache.put(key, version, selected_rows)
+        return [dict(row) for row in selected_rows]
+
+    def iter_select(self, table_name, where_clause=None, snapshot=None):
+        # execute_select as an iterator, for results too large to build at once: a result
+        # the cache holds is served from it, any other is read from the snapshot as the rows
+        # are pulled and is not cached
+        if snapshot is not None:
+            table = snapshot[table_name]
+        else:
+            table = self.tables[table_name].snapshot()
+        try:
+            key = (table_name, normalize_where_clause(table, where_clause))
+        except (KeyError, TypeError, ValueError):
+            return table.iter_select_rows(where_clause)
+        cached_rows = self.result_cache.get(key, table.version)
+        if cached_rows is not None:
+            return (dict(row) for row in cached_rows)  # copies, as execute_select returns
+        return table.iter_select_rows(where_clause)
@@ -1,168 +1,1132 @@
-import dict  # external library for hash table
-
-class MiniDB:
-    def __init__(self):
-        self.tables = {}  # dictionary of table objects
-        self.meta_tables = {}  # dictionary of meta_table objects
-    
-    def create_table(self, name, columns):
-        # add support for declaring a column as unique
-        for column in columns:
-            if column['unique']:
-                column['index'] = 'BTree'  # set index type to BTree for unique columns
-        # create new table and add it to the dictionary of tables
-        self.tables[name] = Table(name, columns)
-        # add table metadata to the dictionary of meta_tables
-        self.meta_tables[name] = MetaTable(name, self.tables[name].get_primary_key())
-    
-    def create_index(self, table_name, column_name):
-        # get the specified table object and the column object
-        table = self.tables[table_name]
-        column = table.get_column(column_name)
-        # check if the column is unique or a primary key
-        if column.unique or column.primary_key:
-            if column.index == 'BTree':
-                # create a BTree index over the column
-                index = BTreeIndex(table, column)
-                # add the index to the table object and the meta_table object
-                table.add_index(index)
-                self.meta_tables[table_name].add_index(index)
-            elif column.index == 'Hash':
-                # create a Hash index over the column
-                index = HashIndex(table, column)
-                # add the index to the table object and the meta_table object
-                table.add_index(index)
-                self.meta_tables[table_name].add_index(index)
-            else:
-                print(f"Error: Index type not supported for column {column_name}")
-        else:
-            print(f"Error: Index can only be created over unique or primary key columns")
-
-class Column:
-    # Creating class Column
-    def __init__(self, name, data_type, unique=False, primary_key=False, index=None):
-        self.name = name
-        self.data_type = data_type
-        self.unique = unique
-        self.primary_key = primary_key
-        self.index = index
-
-class Index:
-    def __init__(self, table, column):
-        self.table = table
-        self.column = column
-        self.rows = {}  # dictionary of rows indexed by the column value
-    
-    def add_row(self, row):
-        # add a row to the index
-        value = row[self.column.name]
-        if value in self.rows:
-            self.rows[value].append(row)
-        else:
-            self.rows[value] = [row]
-
-class BTreeIndex(Index):
-    def __init__(self, table, column):
-        super().__init__(table, column)
-        self.tree = BTree()  # initialize a new BTree data structure
-    
-    def add_row(self, row):
-        # add a row to the index and the BTree
-        super().add_row(row)
-        self.tree.insert(row[self.column.name], row)
-
-class HashIndex(Index):
-    def __init__(self, table, column):
-        super().__init__(table, column)
-        self.table_size = 100  # choose a hash table size
-        self.table = dict.Hash(self.table_size)  # initialize a new hash table
-    
-    def add_row(self, row):
-        # add a row to the index and the hash table
-        super().add_row(row)
-        hash_key = row[self.column.name] % self.table_size
-        if self.table.exists(hash_key):
-            self.table[hash_key].append(row)
-        else:
-            self.table[hash_key] = [row]
-
-class Table:
-def init(self, name, columns):
-self.name = name
-self.columns = columns
-self.primary_key = None # set primary key to None by default
-self.indexes = [] # list of index objects
-
-def get_column(self, column_name):
-    # get the specified column object by name
-    for column in self.columns:
-        if column.name == column_name:
-            return column
-    print(f"Error: Column {column_name} not found in table {self.name}")
-
-def add_index(self, index):
-    # add an index object to the list of indexes
-    self.indexes.append(index)
-
-def get_primary_key(self):
-    # get the primary key column object
-    for column in self.columns:
-        if column.primary_key:
-            self.primary_key = column
-            return column
-    print(f"Error: Primary key not found in table {self.name}")
-class MetaTable:
-def init(self, name, primary_key):
-self.name = name
-self.primary_key = primary_key
-self.indexes = [] # list of index objects
-
-def add_index(self, index):
-    # add an index object to the list of indexes
-    self.indexes.append(index)
-class BTree:
-def init(self):
-self.root = None
-
-
-def insert(self, key, value):
-    # insert a key-value pair into the BTree
-    if self.root is None:
-        self.root = Node(key, value)
-    else:
-        self.root.insert(key, value)
-class Node:
-def init(self, key, value):
-self.keys = [key]
-self.values = [value]
-self.children = []
-
-def is_leaf(self):
-    # check if the node is a leaf node
-    return len(self.children) == 0
-
-def insert(self, key, value):
-    # insert a key-value pair into the node or one of its children
-    if self.is_leaf():
-        # if the node is a leaf, insert the key-value pair into the node
-        self.keys.append(key)
-        self.values.append(value)
-        self.sort_keys()
-    else:
-        # if the node is not a leaf, insert the key-value pair into one of its children
-        i = self.find_child_index(key)
-        child = self.children[i]
-        child.insert(key, value)
-
-def find_child_index(self, key):
-    # find the index of the child that should contain the key
-    for i, k in enumerate(self.keys):
-        if key < k:
-            return i
-    return len(self.children) - 1
-
-def sort_keys(self):
-    # sort the keys and values of the node by key value
-    keys, values = zip(*sorted(zip(self.keys, self.values)))
-    self.keys = list(keys)
-    self.values = list(values)
+import array
+import bisect
+import copy
+import threading
+from itertools import chain
+from operator import eq, itemgetter
+
+from column_stats import DEFAULT_SAMPLE_SIZE, ColumnStats
+from loader import DEFAULT_BATCH_ROWS, batches, read_csv, read_jsonl
+from mvcc import ColumnSlices, HeapView, RowsView, SnapshotManager
+from parallel import DEFAULT_PARTITION_ROWS, Partition, encode_column
+from result_cache import DEFAULT_CACHE_BYTES, ResultCache
+from storage import DEFAULT_POOL_PAGES, DataFile
+from wal import DEFAULT_CHECKPOINT_BYTES, DEFAULT_GROUP_COMMIT_DELAY, WriteAheadLog
+
+try:
+    import numpy
+except ImportError:  # only columnar tables need NumPy, they filter their columns with it
+    numpy = None
+
+class MiniDB:
+    def __init__(self, path=None, pool_pages=DEFAULT_POOL_PAGES, wal=True,
+                 group_commit_delay=DEFAULT_GROUP_COMMIT_DELAY, checkpoint_bytes=DEFAULT_CHECKPOINT_BYTES,
+                 cache_bytes=DEFAULT_CACHE_BYTES):
+        self.tables = {}  # dictionary of table objects
+        self.meta_tables = {}  # dictionary of meta_table objects
+        # results of execute_select, invalidated by the version counter of their table
+        self.result_cache = ResultCache(cache_bytes)
+        self.lock = threading.Lock()  # serializes the writers, readers use snapshots instead
+        # consistent read-only views of the tables for readers running next to writers
+        self.snapshots = SnapshotManager()
+        # database file holding the 'paged' tables and their BTree indexes, when a path is given
+        # opening an existing file only reads its catalog, the pages are read on demand
+        self.data_file = None
+        # write-ahead log next to the database file, making inserts into paged tables durable
+        self.wal = None
+        if path is not None:
+            if wal:
+                self.wal = WriteAheadLog(path + '-wal', group_commit_delay, checkpoint_bytes)
+            self.data_file = DataFile(path, pool_pages, wal=self.wal)
+            self.load_catalog()
+            if self.wal is not None:
+                self.recover()
+    
+    def create_table(self, name, columns, storage='row'):
+        # add support for declaring a column as unique
+        for column in columns:
+            if column.unique and column.index is None:
+                column.index = 'BTree'  # set index type to BTree for unique columns
+        if storage == 'paged' and self.data_file is None:
+            print(f"Error: Paged table {name} needs a database opened with a path")
+            return
+        # a new table starts again at version 0, so the results of a replaced one must go
+        self.result_cache.invalidate(name)
+        # create new table and add it to the dictionary of tables
+        self.tables[name] = Table(name, columns, storage, self.data_file)
+        self.snapshots.committed()
+        # add table metadata to the dictionary of meta_tables
+        self.meta_tables[name] = MetaTable(name, self.tables[name].get_primary_key())
+        if storage == 'paged' and self.wal is not None:
+            # the log only holds inserts, so a new table is made durable by a checkpoint
+            self.tables[name].wal = self.wal
+            self.flush()
+    
+    def create_index(self, table_name, column_name):
+        # get the specified table object and the column object
+        table = self.tables[table_name]
+        column = table.get_column(column_name)
+        # check if the column is unique or a primary key
+        if column.unique or column.primary_key:
+            # a hash table is not paged, so paged tables answer equality lookups from a BTree
+            # in the database file, which survives a restart instead of being rebuilt
+            if column.index == 'BTree' or (column.index == 'Hash' and table.storage == 'paged'):
+                # create a BTree index over the column
+                index = BTreeIndex(table, column)
+            elif column.index == 'Hash':
+                # create a Hash index over the column
+                index = HashIndex(table, column)
+            else:
+                print(f"Error: Index type not supported for column {column_name}")
+                return
+            # index the rows that are already in the table; the index is built aside and
+            # installed in one step, so snapshots never see it half built
+            with self.lock:
+                index.build()
+                table.add_index(index)
+                self.meta_tables[table_name].add_index(index)
+                table.commit()  # the rows the index was built from are visible
+                self.snapshots.committed()
+            if table.storage == 'paged' and self.wal is not None:
+                self.flush()
+        else:
+            print(f"Error: Index can only be created over unique or primary key columns")
+
+    def get_stats(self):
+        # statistics for the query optimizer: the row count of every table under its name and
+        # the ColumnStats of every analyzed column under "table.column" and its bare column name
+        stats = {}
+        for name, table in self.tables.items():
+            stats[name] = ColumnStats(num_rows=len(table.rows))
+            for column_name, column_stats in (table.stats or {}).items():
+                stats[f'{name}.{column_name}'] = column_stats
+                stats.setdefault(column_name, column_stats)
+        return stats
+
+    def load_catalog(self):
+        # recreate the paged tables and their indexes described by the catalog of the file
+        for name, entry in self.data_file.catalog.get('tables', {}).items():
+            columns = [Column(*column) for column in entry['columns']]
+            table = Table(name, columns, 'paged', self.data_file)
+            table.heap = self.data_file.open_heap(entry['heap'])
+            if 'load_start' in entry:
+                # checkpointed in the middle of a bulk load that never finished, drop its rows
+                print(f"Error: Rolled back an unfinished load of {len(table.heap) - entry['load_start']} rows "
+                      f"into table {name}")
+                table.heap.truncate(entry['load_start'])
+            self.tables[name] = table
+            self.meta_tables[name] = MetaTable(name, table.get_primary_key())
+            for column_name, root, size in entry['indexes']:
+                index = BTreeIndex(table, table.get_column(column_name))
+                index.tree = self.data_file.open_btree(root, size)
+                table.add_index(index)
+                self.meta_tables[name].add_index(index)
+            table.commit()
+
+    def recover(self):
+        # replay the inserts logged since the last checkpoint, then log new ones
+        self.wal.attach(self.data_file.pool, self._flush)
+        replayed = 0
+        for table_name, values in self.wal.replay():
+            # a record the table cannot take is reported and skipped, so one bad insert
+            # does not keep the database from opening
+            try:
+                table = self.tables[table_name]
+                table.insert(dict(zip([column.name for column in table.columns], values)))
+            except (KeyError, TypeError, ValueError) as error:
+                print(f"Error: Skipped logged insert into table {table_name}: {type(error).__name__}: {error}")
+                continue
+            replayed += 1
+        for table in self.tables.values():
+            table.wal = self.wal
+        # the pages changed by the replayed inserts and the loads rolled back by load_catalog
+        if replayed or self.data_file.pool.dirty_pages():
+            self.flush()
+
+    def insert(self, table_name, row, wait=True):
+        # insert a row and, with wait, return once it is durable
+        # concurrent inserts share the fsyncs of the log (group commit), and inserts made
+        # with wait=False become durable with the next commit()
+        table = self.tables[table_name]
+        with self.lock:
+            row_id = table.insert(row)
+            self.snapshots.committed()
+        if wait and table.wal is not None:
+            table.wal.commit()
+        return row_id
+
+    def insert_many(self, table_name, rows, batch_size=DEFAULT_BATCH_ROWS):
+        # bulk load rows into a table, see Table.insert_many
+        table = self.tables[table_name]
+        with self.lock:
+            row_ids = table.insert_many(rows, batch_size)
+            self.snapshots.committed()
+        return row_ids
+
+    def load_csv(self, table_name, path, header=True, delimiter=',', batch_size=DEFAULT_BATCH_ROWS):
+        # bulk load a CSV file, converting every field to the data_type of its column
+        # returns the range of the new row ids, or None when nothing was loaded
+        table = self.tables[table_name]
+        try:
+            rows = chain.from_iterable(read_csv(path, table.columns, header, delimiter, batch_size))
+            return self.insert_many(table_name, rows, batch_size)
+        except (OSError, ValueError, TypeError) as error:
+            print(f"Error: Could not load {path} into table {table_name}: {error}")
+
+    def load_jsonl(self, table_name, path, batch_size=DEFAULT_BATCH_ROWS):
+        # bulk load a file of one JSON object per line, converted like load_csv
+        table = self.tables[table_name]
+        try:
+            rows = chain.from_iterable(read_jsonl(path, table.columns, batch_size))
+            return self.insert_many(table_name, rows, batch_size)
+        except (OSError, ValueError, TypeError) as error:
+            print(f"Error: Could not load {path} into table {table_name}: {error}")
+
+    def snapshot(self):
+        # read-only views of every table as of the last commit, see mvcc.Snapshot
+        # readers take no lock: rows and index entries written meanwhile stay invisible
+        return self.snapshots.begin(self.tables)
+
+    def commit(self):
+        # wait until every logged insert is durable
+        if self.wal is not None:
+            self.wal.commit()
+
+    def flush(self):
+        # write the catalog and every dirty page to the database file
+        # with a write-ahead log this is a checkpoint, after which the log is truncated
+        # holds the write lock, so no insert changes the pages or the log meanwhile
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        # flush() for a caller already holding the write lock, e.g. a checkpoint of the log
+        # started by an insert (see WriteAheadLog.maybe_checkpoint)
+        if self.data_file is None:
+            return
+        tables = {}
+        for name, table in self.tables.items():
+            if table.storage != 'paged':
+                continue  # row and columnar tables only live in memory
+            tables[name] = {
+                'columns': [(column.name, column.data_type, column.unique, column.primary_key, column.index)
+                            for column in table.columns],
+                'heap': table.heap.state(),
+                'indexes': [(index.column.name, index.tree.root, len(index.tree))
+                            for index in table.indexes if isinstance(index, BTreeIndex)],
+            }
+            if table.load_start is not None:
+                tables[name]['load_start'] = table.load_start
+        self.data_file.save_catalog({'tables': tables})
+        if self.wal is not None:
+            self.wal.checkpoint(self.data_file.pager)
+        else:
+            self.data_file.flush()
+
+    def close(self):
+        if self.data_file is not None:
+            self.flush()
+            if self.wal is not None:
+                self.wal.close()
+                self.wal = None
+            self.data_file.close()
+            self.data_file = None
+
+class Column:
+    # Creating class Column
+    def __init__(self, name, data_type, unique=False, primary_key=False, index=None):
+        self.name = name
+        self.data_type = data_type
+        self.unique = unique
+        self.primary_key = primary_key
+        self.index = index
+
+class Index:
+    limit = None  # in the view of a snapshot, row ids from limit on are not visible yet
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+        self.row_ids = {}  # dictionary of row ids indexed by the column value
+    
+    def add_row(self, row, row_id):
+        # add a row to the index
+        value = row[self.column.name]
+        if value in self.row_ids:
+            self.row_ids[value].append(row_id)
+        else:
+            self.row_ids[value] = [row_id]
+
+    def remove_row(self, row, row_id):
+        # take back add_row, to undo an insert that failed
+        value = row[self.column.name]
+        row_ids = self.row_ids.get(value)
+        if row_ids is not None and row_id in row_ids:
+            row_ids.remove(row_id)
+            if not row_ids:
+                del self.row_ids[value]
+
+    def build(self):
+        # add every row already stored in the table to the index, replacing its contents
+        # the new contents are built aside and installed in one assignment
+        index = copy.copy(self)
+        index.row_ids = {}
+        for row_id, row in enumerate(self.table.rows):
+            index.add_row(row, row_id)
+        self.row_ids = index.row_ids
+
+    def lookup(self, value):
+        # return the ids of the rows whose column equals value
+        return self.visible(self.row_ids.get(value, []))
+
+    def snapshot(self, table, limit):
+        # read-only copy of the index for the view of a table holding limit rows
+        view = copy.copy(self)
+        view.table = table
+        view.limit = limit
+        return view
+
+    def visible(self, row_ids):
+        # the row ids a snapshot may see, entries of later rows are skipped
+        if self.limit is None:
+            return row_ids
+        limit = self.limit
+        return [row_id for row_id in row_ids if row_id < limit]
+
+class BTreeIndex(Index):
+    def __init__(self, table, column):
+        super().__init__(table, column)
+        if table.storage == 'paged':
+            self.tree = table.data_file.new_btree()  # BTree whose nodes are pages of the database file
+        else:
+            self.tree = BTree()  # initialize a new BTree data structure
+    
+    def add_row(self, row, row_id):
+        # add a row to the BTree, the tree holds the row ids so they are not kept twice
+        self.tree.insert(row[self.column.name], row_id)
+
+    def remove_row(self, row, row_id):
+        self.tree.delete(row[self.column.name], row_id)
+
+    def build(self, keys=None, row_ids=None):
+        # sort the existing rows once and bulk load the BTree instead of inserting one by one
+        # a caller that already sorted the column passes its keys and the sorted row ids
+        if keys is None:
+            keys = self.table.get_column_values(self.column.name)
+            row_ids = sorted_row_ids(keys)
+        self.tree.bulk_load(zip(map(keys.__getitem__, row_ids), row_ids))
+
+    def lookup(self, value):
+        # point lookup through the BTree
+        return self.visible(self.tree.search(value))
+
+    def range_lookup(self, low=None, high=None, include_low=True, include_high=True):
+        # return the ids of the rows whose column lies between low and high
+        # a bound of None leaves that side of the range open
+        return self.visible(self.tree.range_search(low, high, include_low, include_high))
+
+    def first_key(self, reverse=False):
+        # the smallest indexed value, the largest with reverse, None when the index is empty
+        # read from one end of the tree instead of scanning the column
+        limit = self.limit
+        return self.tree.first_key(reverse, None if limit is None else lambda row_id: row_id < limit)
+
+    def ordered_row_ids(self, reverse=False):
+        # the row ids in column order, the largest values first with reverse
+        # an in-memory tree is walked lazily, so reading the first rows stops early
+        if isinstance(self.tree, BTree):
+            row_ids = map(itemgetter(1), self.tree.reversed_items() if reverse else self.tree.items())
+        else:
+            # pages are only read under the lock of the buffer pool, list the ids at once
+            row_ids = self.tree.range_search()
+            if reverse:
+                row_ids = reversed(row_ids)
+        limit = self.limit
+        if limit is None:
+            return row_ids
+        return (row_id for row_id in row_ids if row_id < limit)
+
+    def snapshot(self, table, limit):
+        # the view keeps the version of the tree it started with
+        view = super().snapshot(table, limit)
+        view.tree = self.tree.snapshot()
+        return view
+
+class HashIndex(Index):
+    # row_ids maps a column value to a single row id, or to an array of row ids
+    # once the value repeats, so an indexed row costs one int instead of a list and a row
+    # the dict grows with the index and hashes any hashable column type
+    def add_row(self, row, row_id):
+        # add a row id to the hash table
+        value = row[self.column.name]
+        row_ids = self.row_ids.get(value)
+        if row_ids is None:
+            self.row_ids[value] = row_id
+        elif isinstance(row_ids, int):
+            self.row_ids[value] = array.array('q', (row_ids, row_id))
+        else:
+            row_ids.append(row_id)
+
+    def remove_row(self, row, row_id):
+        value = row[self.column.name]
+        row_ids = self.row_ids.get(value)
+        if isinstance(row_ids, int):
+            if row_ids == row_id:
+                del self.row_ids[value]
+        elif row_ids is not None and row_id in row_ids:
+            row_ids.remove(row_id)
+
+    def build(self):
+        # index the column values in one pass, without building row dicts, then install
+        # the new hash table in one assignment
+        index = {}
+        for row_id, value in enumerate(self.table.get_column_values(self.column.name)):
+            row_ids = index.get(value)
+            if row_ids is None:
+                index[value] = row_id
+            elif isinstance(row_ids, int):
+                index[value] = array.array('q', (row_ids, row_id))
+            else:
+                row_ids.append(row_id)
+        self.row_ids = index
+
+    def lookup(self, value):
+        # return the ids of the rows whose column equals value
+        row_ids = self.row_ids.get(value)
+        if row_ids is None:
+            return []
+        if isinstance(row_ids, int):
+            return self.visible([row_ids])
+        return self.visible(list(row_ids))
+
+    def lookup_many(self, values):
+        # return the ids of the rows whose column equals any of values
+        result = []
+        for value in values:
+            row_ids = self.row_ids.get(value)
+            if row_ids is None:
+                continue
+            if isinstance(row_ids, int):
+                result.append(row_ids)
+            else:
+                result.extend(row_ids)
+        return self.visible(result)
+
+# array typecodes used to store columns of each data_type in columnar tables
+# columns of any other data_type are stored in a plain list
+COLUMN_TYPECODES = {
+    'int': 'q',
+    'float': 'd',
+    'bool': 'b',
+}
+
+# Python types a value of each data_type may have, values of other data_types are not checked
+VALUE_TYPES = {
+    'int': int,
+    'float': (int, float),
+    'bool': (bool, int),
+    'str': str,
+}
+
+
+class Table:
+    def __init__(self, name, columns, storage='row', data_file=None):
+        self.name = name
+        self.columns = columns
+        self.primary_key = None # set primary key to None by default
+        self.indexes = [] # list of index objects
+        self.storage = storage # 'row' keeps a list of row dicts, 'columnar' one typed array per column,
+                               # 'paged' stores the rows in pages of a database file
+        self.data_file = data_file
+        if storage == 'columnar':
+            if numpy is None:
+                # without it the column masks are bytes objects, slower than filtering row tables
+                raise ImportError(f"Columnar table {name} needs NumPy, install it or use storage='row'")
+            self.column_data = {column.name: new_column_data(column) for column in columns}
+            self.rows = ColumnarRows(self) # lazy dict-of-rows view over the column arrays
+        elif storage == 'paged':
+            self.heap = data_file.new_heap()
+            self.rows = PagedRows(self) # row dicts read through the buffer pool on demand
+        else:
+            self.rows = [] # list of rows, a row id is the position of the row in this list
+        self.stats = None # dictionary of ColumnStats by column name, kept up to date once analyze() ran
+        self.wal = None # write-ahead log of the database file of a paged table
+        self.load_start = None # first row id of the bulk load of a paged table still running
+        self.partition_rows = None # rows per horizontal partition once partition() ran
+        self.workers = None # worker processes scanning the partitions, None uses every core
+        self.partition_cache = {} # (row count, encoded column) by (first row id, column name) of a partition
+        self.version = 0 # bumped by every change to the rows, makes cached results of the table stale
+        self.committed = (0, 0) # (number of rows, version) visible to new snapshots, see commit()
+
+    def get_column_data(self, column_name):
+        # get the array holding every value of a column of a columnar table
+        return self.column_data[column_name]
+
+    def get_column_values(self, column_name):
+        # get every value of a column in row id order, without building row dicts
+        # when the table is columnar
+        if self.storage == 'columnar':
+            return self.column_data[column_name]
+        if self.storage == 'paged':
+            position = [column.name for column in self.columns].index(column_name)
+            return [values[position] for values in self.heap.scan()]
+        return [row[column_name] for row in self.rows]
+
+    def check_row(self, row):
+        # reject a row the table could not store before anything is changed or logged
+        # raises KeyError for a missing column the storage or an index needs and TypeError
+        # for a value that does not match the data_type of its column
+        indexed = {index.column.name for index in self.indexes}
+        for column in self.columns:
+            value = row.get(column.name)
+            if value is None:
+                # typed arrays of columnar tables and the keys of indexes hold no None
+                if column.name in indexed or (self.storage == 'columnar' and column.data_type in COLUMN_TYPECODES):
+                    if column.name not in row:
+                        raise KeyError(column.name)
+                    raise TypeError(f"Column {column.name} of table {self.name} cannot hold None")
+                continue
+            types = VALUE_TYPES.get(column.data_type)
+            if types is not None and not isinstance(value, types):
+                raise TypeError(f"Value {value!r} of column {column.name} of table {self.name} "
+                                f"is not of type {column.data_type}")
+
+    def insert(self, row):
+        # append a row and add it to the indexes and the column statistics
+        self.check_row(row)
+        row_id = len(self.rows)
+        self.rows.append(row)
+        indexed = []
+        counted = []
+        try:
+            for index in self.indexes:
+                index.add_row(row, row_id)
+                indexed.append(index)
+            for column_name, column_stats in (self.stats or {}).items():
+                column_stats.add(row.get(column_name))
+                counted.append((column_stats, row.get(column_name)))
+        except BaseException:
+            # undo the insert, so the rows, the indexes and the statistics still agree
+            for index in indexed:
+                index.remove_row(row, row_id)
+            for column_stats, value in counted:
+                column_stats.remove(value)
+            self._truncate(row_id)
+            raise
+        if self.wal is not None:
+            # log the row once it is stored, so a failed insert leaves no record to replay;
+            # the changed pages only reach the data file with a checkpoint, which runs after
+            # this (no-steal), and recovery replays the row if they are lost
+            self.wal.log_insert(self.name, tuple(row.get(column.name) for column in self.columns))
+        self.version += 1
+        self.commit()
+        if self.wal is not None:
+            self.wal.maybe_checkpoint()
+        return row_id
+
+    def insert_many(self, rows, batch_size=DEFAULT_BATCH_ROWS):
+        # append many rows at once: instead of adding every row to the indexes, the indexes
+        # are rebuilt with one sorted bulk build at the end, and unique and primary key
+        # columns are checked in one pass over their sorted keys
+        # a duplicate or an error while reading rows rejects the whole load
+        # returns the range of the new row ids, or None when the load was rejected
+        # a paged table is not logged row by row but checkpointed between batches once its
+        # dirty pages fill the buffer pool, and again when the load is complete; the catalog
+        # of a checkpoint in the middle of the load records where it started, so a crash
+        # before the end loses the whole load and never part of it (see load_catalog)
+        start = len(self.rows)
+        sorted_columns = {}  # column name -> (keys, row ids sorted by key) of checked columns
+        if self.wal is not None:
+            self.load_start = start
+        try:
+            for batch in batches(iter(rows), batch_size):
+                self.rows.extend(batch)
+                self.version += 1
+                if self.wal is not None:
+                    self.wal.maybe_checkpoint()
+            for column in self.columns:
+                if not (column.unique or column.primary_key):
+                    continue
+                keys = self.get_column_values(column.name)
+                row_ids = sorted_row_ids(keys)
+                duplicate = first_duplicate(keys, row_ids, start)
+                if duplicate is not None:
+                    print(f"Error: Duplicate value {keys[duplicate]!r} for column {column.name} "
+                          f"of table {self.name}, no rows were loaded")
+                    self._truncate(start)
+                    return None
+                sorted_columns[column.name] = (keys, row_ids)
+        except BaseException:
+            self._truncate(start)
+            raise
+        finally:
+            self.load_start = None
+        for index in self.indexes:
+            if isinstance(index, BTreeIndex) and index.column.name in sorted_columns:
+                index.build(*sorted_columns[index.column.name])
+            else:
+                index.build()
+        if self.stats is not None:
+            for column_name, column_stats in self.stats.items():
+                if column_name in sorted_columns:
+                    values = sorted_columns[column_name][0]
+                else:
+                    values = self.get_column_values(column_name)
+                for value in values[start:]:
+                    column_stats.add(value)
+        self.version += 1
+        self.commit()
+        if self.wal is not None and self.wal.checkpoint_hook is not None:
+            self.wal.checkpoint_hook()
+        return range(start, len(self.rows))
+
+    def commit(self):
+        # make every row and index entry written so far visible to new snapshots, in one
+        # assignment; rows appended after the last commit, e.g. by a bulk load still running
+        # or rolled back, are never seen by readers
+        self.committed = (len(self.rows), self.version)
+
+    def snapshot(self):
+        # read-only copy of the table as of its last commit: the rows, column arrays, heap and
+        # indexes are replaced by views that stop at the committed rows
+        num_rows, version = self.committed
+        view = copy.copy(self)
+        view.version = version
+        view.wal = None
+        if self.storage == 'columnar':
+            view.column_data = ColumnSlices(self.column_data, num_rows)
+            view.rows = ColumnarRows(view)
+        elif self.storage == 'paged':
+            view.heap = HeapView(self.heap, num_rows)
+            view.rows = PagedRows(view)
+        else:
+            view.rows = RowsView(self.rows, num_rows)
+        view.indexes = [index.snapshot(view, num_rows) for index in self.indexes]
+        return view
+
+    def _truncate(self, num_rows):
+        # drop the rows from row id num_rows on, to undo a rejected bulk load
+        # the indexes are left as they are, they never held those rows
+        if self.storage == 'columnar':
+            for data in self.column_data.values():
+                del data[num_rows:]
+        elif self.storage == 'paged':
+            self.heap.truncate(num_rows)
+        else:
+            del self.rows[num_rows:]
+        self.partition_cache = {}
+        self.version += 1
+
+    def analyze(self, sample_size=DEFAULT_SAMPLE_SIZE):
+        # build the statistics of every column in one pass over the column values
+        # afterwards insert() keeps them up to date, so they never need a rescan
+        self.stats = {}
+        for column in self.columns:
+            column_stats = ColumnStats(sample_size=sample_size)
+            for value in self.get_column_values(column.name):
+                column_stats.add(value)
+            self.stats[column.name] = column_stats
+        return self.stats
+
+    def partition(self, num_partitions=None, workers=None, partition_rows=None):
+        # split the table into horizontal partitions of consecutive row ids, scanned and
+        # filtered by worker processes; rows inserted later fill new partitions of the same size
+        if partition_rows is None:
+            if num_partitions and len(self.rows):
+                partition_rows = -(-len(self.rows) // num_partitions)
+            else:
+                partition_rows = DEFAULT_PARTITION_ROWS
+        self.partition_rows = partition_rows
+        self.workers = workers
+        self.partition_cache = {}
+
+    def get_partitions(self, column_names=None):
+        # the partitions as compact column buffers that can be sent to worker processes,
+        # holding only the named columns (every column by default); each column of a
+        # partition is encoded once and only encoded again after rows were added to it
+        if column_names is None:
+            columns = self.columns
+        else:
+            columns = [column for column in self.columns if column.name in column_names]
+        names = [(column.name, column.data_type) for column in columns]
+        num_rows = len(self.rows)
+        partitions = []
+        for first in range(0, num_rows, self.partition_rows):
+            end = min(first + self.partition_rows, num_rows)
+            stale = [column for column in columns
+                     if self.partition_cache.get((first, column.name), (None,))[0] != end - first]
+            if stale:
+                values = self._partition_values(first, end, stale)
+                for column in stale:
+                    self.partition_cache[(first, column.name)] = (end - first, encode_column(values[column.name]))
+            buffers = [self.partition_cache[(first, column.name)][1] for column in columns]
+            partitions.append(Partition(first, end - first, names, buffers))
+        return partitions
+
+    def _partition_values(self, first, end, columns):
+        # the values of rows first .. end - 1 of columns, one typed array per column where possible
+        if self.storage == 'columnar':
+            return {column.name: self.column_data[column.name][first:end] for column in columns}
+        rows = self.rows[first:end]
+        values = {}
+        for column in columns:
+            column_values = [row[column.name] for row in rows]
+            data = new_column_data(column)
+            try:
+                data.extend(column_values)
+            except (TypeError, OverflowError):
+                data = column_values  # None or out of range values stay in a list
+            values[column.name] = data
+        return values
+
+    def get_column(self, column_name):
+        # get the specified column object by name
+        for column in self.columns:
+            if column.name == column_name:
+                return column
+        print(f"Error: Column {column_name} not found in table {self.name}")
+
+    def add_index(self, index):
+        # add an index object to the list of indexes
+        self.indexes.append(index)
+
+    def get_indexes(self, column_name):
+        # get the index objects built over the specified column
+        return [index for index in self.indexes if index.column.name == column_name]
+
+    def get_primary_key(self):
+        # get the primary key column object
+        for column in self.columns:
+            if column.primary_key:
+                self.primary_key = column
+                return column
+        print(f"Error: Primary key not found in table {self.name}")
+
+
+def new_column_data(column):
+    # create the empty typed array that stores a column of a columnar table
+    typecode = COLUMN_TYPECODES.get(column.data_type)
+    if typecode is None:
+        return []
+    return array.array(typecode)
+
+
+def sorted_row_ids(keys):
+    # row ids ordered by key, sorting is stable so equal keys stay in row id order
+    return sorted(range(len(keys)), key=keys.__getitem__)
+
+
+def first_duplicate(keys, row_ids, start):
+    # the first row id from start on whose key equals the key of an earlier row, or None
+    # row_ids are sorted by key, so equal keys are adjacent and in row id order
+    sorted_keys = list(map(keys.__getitem__, row_ids))
+    if not any(map(eq, sorted_keys, sorted_keys[1:])):
+        return None  # no equal keys at all, checked without a Python loop
+    for previous, row_id in zip(row_ids, row_ids[1:]):
+        if row_id >= start and keys[row_id] == keys[previous]:
+            return row_id
+    return None
+
+
+class ColumnarRows:
+    # list-like view that builds row dicts from the column arrays on demand,
+    # so code written against Table.rows keeps working on columnar tables
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        if not self.table.columns:
+            return 0
+        return len(self.table.column_data[self.table.columns[0].name])
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return [self[i] for i in range(*row_id.indices(len(self)))]
+        row = {}
+        for column in self.table.columns:
+            value = self.table.column_data[column.name][row_id]
+            row[column.name] = bool(value) if column.data_type == 'bool' else value
+        return row
+
+    def __iter__(self):
+        names = [column.name for column in self.table.columns]
+        data = [self.table.column_data[name] for name in names]
+        for values in zip(*data):
+            row = dict(zip(names, values))
+            for column in self.table.columns:
+                if column.data_type == 'bool':
+                    row[column.name] = bool(row[column.name])
+            yield row
+
+    def take(self, row_ids):
+        # build the rows with the given ids, one column at a time
+        # a snapshot reads the ids from its live arrays instead of copying whole columns
+        names = [column.name for column in self.table.columns]
+        column_data = self.table.column_data
+        get_column = getattr(column_data, 'live', column_data.__getitem__)
+        columns = []
+        for column in self.table.columns:
+            data = get_column(column.name)
+            values = [data[row_id] for row_id in row_ids]
+            columns.append(list(map(bool, values)) if column.data_type == 'bool' else values)
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def append(self, row):
+        # store each value of the row at the end of its column array
+        size = len(self)
+        try:
+            for column in self.table.columns:
+                self.table.column_data[column.name].append(row[column.name])
+        except BaseException:
+            self._truncate(size)
+            raise
+
+    def extend(self, rows):
+        # store a batch of rows one column at a time
+        rows = rows if isinstance(rows, list) else list(rows)
+        size = len(self)
+        try:
+            for column in self.table.columns:
+                self.table.column_data[column.name].extend([row[column.name] for row in rows])
+        except BaseException:
+            self._truncate(size)
+            raise
+
+    def _truncate(self, size):
+        # a missing key or a value a typed array rejects fails partway through the columns,
+        # cut every column back so they keep the same length
+        for data in self.table.column_data.values():
+            del data[size:]
+
+
+class PagedRows:
+    # list-like view over the heap file of a paged table, rows are stored as tuples of
+    # column values and turned into dicts when they are read
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table.heap)
+
+    def _names(self):
+        return [column.name for column in self.table.columns]
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return self.take(range(*row_id.indices(len(self))))
+        if row_id < 0:
+            row_id += len(self)
+        return dict(zip(self._names(), self.table.heap.get(row_id)))
+
+    def __iter__(self):
+        names = self._names()
+        for values in self.table.heap.scan():
+            yield dict(zip(names, values))
+
+    def take(self, row_ids):
+        names = self._names()
+        get = self.table.heap.get
+        return [dict(zip(names, get(row_id))) for row_id in row_ids]
+
+    def append(self, row):
+        self.table.heap.append(tuple(row.get(name) for name in self._names()))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+
+class MetaTable:
+    def __init__(self, name, primary_key):
+        self.name = name
+        self.primary_key = primary_key
+        self.indexes = [] # list of index objects
+
+    def add_index(self, index):
+        # add an index object to the list of indexes
+        self.indexes.append(index)
+class BTree:
+    # B+-tree: values live in the leaves, internal nodes only hold separator keys
+    # the tree is copy-on-write: a change copies the nodes on its path and then publishes
+    # the new root, so readers walking an older root (see snapshot()) never see it
+    # the leaves are not linked to their neighbours, a split would have to copy the leaf
+    # before it as well; items() walks the leaves in key order with a stack of the internal
+    # nodes above them instead (the paged BTree of storage.py still links its leaves)
+    def __init__(self, order=64):
+        self.order = order  # maximum number of children of an internal node
+        self.max_keys = order - 1
+        self.min_keys = self.max_keys // 2
+        self.root = Node(leaf=True)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key, value):
+        # insert a key-value pair into the BTree, splitting full nodes on the way back up
+        root = self.root.copy()
+        split = self._insert(root, key, value)
+        if split is not None:
+            separator, right = split
+            left = root
+            root = Node(leaf=False)
+            root.keys = [separator]
+            root.children = [left, right]
+        self.root = root
+        self.size += 1
+
+    def _insert(self, node, key, value):
+        if node.is_leaf():
+            i = bisect.bisect_right(node.keys, key)
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+        else:
+            i = node.find_child_index(key)
+            child = node.children[i] = node.children[i].copy()
+            split = self._insert(child, key, value)
+            if split is None:
+                return None
+            separator, right = split
+            node.keys.insert(i, separator)
+            node.children.insert(i + 1, right)
+        if len(node.keys) > self.max_keys:
+            return node.split()
+        return None
+
+    def delete(self, key, value=None):
+        # delete one entry with the given key (and value, when given)
+        # returns False when no such entry exists
+        root = self.root.copy()
+        if not self._delete(root, key, value):
+            return False
+        if not root.is_leaf() and len(root.children) == 1:
+            root = root.children[0]
+        self.root = root
+        self.size -= 1
+        return True
+
+    def _delete(self, node, key, value):
+        if node.is_leaf():
+            i = bisect.bisect_left(node.keys, key)
+            while i < len(node.keys) and node.keys[i] == key:
+                if value is None or node.values[i] == value:
+                    del node.keys[i]
+                    del node.values[i]
+                    return True
+                i += 1
+            return False
+        # equal keys may have been split over neighbouring children
+        i = bisect.bisect_left(node.keys, key)
+        while i < len(node.children):
+            child = node.children[i].copy()
+            if self._delete(child, key, value):
+                node.children[i] = child
+                if len(node.children[i].keys) < self.min_keys:
+                    self._rebalance(node, i)
+                return True
+            if i >= len(node.keys) or node.keys[i] != key:
+                return False
+            i += 1
+        return False
+
+    def _rebalance(self, parent, i):
+        # fix an underflowing child by borrowing from a sibling or merging with it
+        # the siblings may still be shared with older roots, so they are copied first
+        child = parent.children[i]
+        left = right = None
+        if i > 0:
+            left = parent.children[i - 1] = parent.children[i - 1].copy()
+        if i + 1 < len(parent.children):
+            right = parent.children[i + 1] = parent.children[i + 1].copy()
+        if left is not None and len(left.keys) > self.min_keys:
+            if child.is_leaf():
+                child.keys.insert(0, left.keys.pop())
+                child.values.insert(0, left.values.pop())
+                parent.keys[i - 1] = child.keys[0]
+            else:
+                child.keys.insert(0, parent.keys[i - 1])
+                child.children.insert(0, left.children.pop())
+                parent.keys[i - 1] = left.keys.pop()
+        elif right is not None and len(right.keys) > self.min_keys:
+            if child.is_leaf():
+                child.keys.append(right.keys.pop(0))
+                child.values.append(right.values.pop(0))
+                parent.keys[i] = right.keys[0]
+            else:
+                child.keys.append(parent.keys[i])
+                child.children.append(right.children.pop(0))
+                parent.keys[i] = right.keys.pop(0)
+        elif left is not None:
+            left.merge(child, parent.keys.pop(i - 1))
+            parent.children.pop(i)
+        elif right is not None:
+            child.merge(right, parent.keys.pop(i))
+            parent.children.pop(i + 1)
+
+    def bulk_load(self, items, fill=1.0):
+        # build the tree bottom-up from (key, value) pairs that are already sorted by key
+        # this replaces the current contents of the tree
+        keys_per_leaf = max(self.min_keys, int(self.max_keys * fill), 1)
+        items = list(items)
+        leaves = []
+        for chunk in _even_chunks(items, keys_per_leaf):
+            leaf = Node(leaf=True)
+            leaf.keys = [key for key, _ in chunk]
+            leaf.values = [value for _, value in chunk]
+            leaves.append(leaf)
+        self.size = len(items)
+        if not leaves:
+            self.root = Node(leaf=True)
+            return
+        # every level keeps the smallest key of each node to use as the separator above it
+        level = [(leaf.keys[0], leaf) for leaf in leaves]
+        while len(level) > 1:
+            parents = []
+            for chunk in _even_chunks(level, self.order):
+                node = Node(leaf=False)
+                node.keys = [low for low, _ in chunk[1:]]
+                node.children = [child for _, child in chunk]
+                parents.append((chunk[0][0], node))
+            level = parents
+        self.root = level[0][1]
+
+    def search(self, key):
+        # return the values stored under key
+        return [value for _, value in self.items(key, key)]
+
+    def range_search(self, low=None, high=None, include_low=True, include_high=True):
+        # return the values whose keys lie between low and high, in key order
+        return [value for _, value in self.items(low, high, include_low, include_high)]
+
+    def items(self, low=None, high=None, include_low=True, include_high=True):
+        # iterate the (key, value) pairs between low and high in key order
+        # a bound of None leaves that side of the range open
+        # the walk keeps the root it started from and a stack of the internal nodes above
+        # the current leaf, so a change published meanwhile does not affect it
+        node = self.root
+        stack = []  # (internal node, index of the next child to visit)
+        while not node.is_leaf():
+            i = 0 if low is None else bisect.bisect_left(node.keys, low)
+            stack.append((node, i + 1))
+            node = node.children[i]
+        if low is None:
+            i = 0
+        elif include_low:
+            i = bisect.bisect_left(node.keys, low)
+        else:
+            i = bisect.bisect_right(node.keys, low)
+        while node is not None:
+            keys = node.keys
+            while i < len(keys):
+                key = keys[i]
+                if high is not None and (key > high or (key == high and not include_high)):
+                    return
+                if include_low or key != low:
+                    yield key, node.values[i]
+                i += 1
+            node = _next_leaf(stack)
+            i = 0
+
+    def reversed_items(self):
+        # iterate every (key, value) pair in descending key order
+        return _reversed_items(self.root)
+
+    def first_key(self, reverse=False, accept=None):
+        # the smallest key (the largest with reverse) whose value passes accept, or None
+        for key, value in self.reversed_items() if reverse else self.items():
+            if accept is None or accept(value):
+                return key
+        return None
+
+    def snapshot(self):
+        # read-only copy of the tree as it is now, later changes replace nodes instead of
+        # changing the ones it holds
+        return copy.copy(self)
+
+
+def _reversed_items(node):
+    if node.is_leaf():
+        return zip(reversed(node.keys), reversed(node.values))
+    return chain.from_iterable(map(_reversed_items, reversed(node.children)))
+
+
+def _next_leaf(stack):
+    # the leaf after the current one, popping the exhausted internal nodes off the stack
+    while stack:
+        node, i = stack.pop()
+        if i < len(node.children):
+            stack.append((node, i + 1))
+            node = node.children[i]
+            while not node.is_leaf():
+                stack.append((node, 1))
+                node = node.children[0]
+            return node
+    return None
+
+
+def _even_chunks(items, size):
+    # split items into consecutive chunks of at most size items, spread evenly
+    # so that the last chunk is not left underfull
+    if not items:
+        return []
+    count = -(-len(items) // size)
+    base, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + base + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+class Node:
+    def __init__(self, leaf=True):
+        self.keys = []
+        self.values = []  # only used by leaf nodes
+        self.children = []  # only used by internal nodes
+        self.leaf = leaf
+
+    def is_leaf(self):
+        # check if the node is a leaf node
+        return self.leaf
+
+    def copy(self):
+        # copy of the node with its own lists, the children are shared
+        node = Node.__new__(Node)
+        node.leaf = self.leaf
+        node.keys = self.keys[:]
+        node.values = self.values[:]
+        node.children = self.children[:]
+        return node
+
+    def find_child_index(self, key):
+        # find the index of the child that should contain the key
+        return bisect.bisect_right(self.keys, key)
+
+    def split(self):
+        # split a full node in two halves, returning the separator key and the new right node
+        middle = len(self.keys) // 2
+        right = Node(leaf=self.leaf)
+        if self.leaf:
+            right.keys = self.keys[middle:]
+            right.values = self.values[middle:]
+            self.keys = self.keys[:middle]
+            self.values = self.values[:middle]
+            return right.keys[0], right
+        separator = self.keys[middle]
+        right.keys = self.keys[middle + 1:]
+        right.children = self.children[middle + 1:]
+        self.keys = self.keys[:middle]
+        self.children = self.children[:middle + 1]
+        return separator, right
+
+    def merge(self, right, separator):
+        # append the contents of the right sibling to this node
+        if self.leaf:
+            self.keys.extend(right.keys)
+            self.values.extend(right.values)
+        else:
+            self.keys.append(separator)
+            self.keys.extend(right.keys)
+            self.children.extend(right.children)
@@ -1,331 +1,2136 @@
-#1
-
-from typing import List, Dict, Union
-
-Table = List[Dict[str, Union[str, int]]]
-
-def project(table: Table, columns: List[str]) -> Table:
-    return [{c: row[c] for c in columns} for row in table]
-
-def select(table: Table, condition: str) -> Table:
-    return [row for row in table if eval(condition, {}, row)]
-
-def join(left: Table, right: Table, join_condition: str) -> Table:
-    result = []
-    for lrow in left:
-        for rrow in right:
-            if eval(join_condition, {}, {**lrow, **rrow}):
-                result.append({**lrow, **rrow})
-    return result
-
-def get_column_stats(table: Table, column: str) -> Dict[str, Union[int, List[Union[str, int]]]]:
-    distinct_values = set(row[column] for row in table)
-    return {
-        'distinct_values': len(distinct_values),
-        'min_value': min(distinct_values),
-        'max_value': max(distinct_values),
-        'histogram': [len([row for row in table if row[column] == value]) for value in distinct_values]
-    }
-
-def estimate_query_cost(query_plan: List[Dict]) -> float:
-    # We will use a simple cost model that estimates the cost of each operator based on column statistics.
-    # The cost of a SELECT operation is proportional to the number of rows that satisfy the condition.
-    # The cost of a PROJECT operation is negligible.
-    # The cost of a JOIN operation is proportional to the product of the number of rows in the two tables that are being joined.
-    # This is a very simple cost model that ignores many important factors, such as disk access time and network latency.
-    # A real query optimizer would use a much more sophisticated cost model.
-    cost = 0
-    for op in query_plan:
-        if op['type'] == 'SELECT':
-            column_stats = op['column_stats']
-            num_rows = column_stats['histogram'][column_stats['distinct_values'] // 2]  # estimate based on median histogram value
-            cost += num_rows
-        elif op['type'] == 'PROJECT':
-            pass
-        elif op['type'] == 'JOIN':
-            left_stats = op['left_column_stats']
-            right_stats = op['right_column_stats']
-            cost += left_stats['distinct_values'] * right_stats['distinct_values']
-    return cost
-
-#2
-
-from typing import List, Dict
-from table import Table
-
-def generate_query_plans(table: Table, select_conditions: List[str], project_columns: List[str], join_conditions: List[str]) -> List[List[Dict]]:
-    # Start with a single query plan that selects all rows from the table.
-    query_plan = [{'type': 'SELECT', 'condition': 'True', 'column_stats': {}}]
-    # Apply select conditions.
-    for condition in select_conditions:
-        new_plans = []
-        for plan in query_plan:
-            if plan['type'] == 'SELECT':
-                new_plans.append({'type': 'SELECT', 'condition': f'({condition}) and ({plan["condition"]})', 'column_stats': plan['column_stats']})
-        query_plan = new_plans
-    # Apply projection.
-    new_plans = []
-    for plan in query_plan:
-        if plan['type'] == 'SELECT':
-            column_stats = {column: plan['column_stats'][column] for column in project_columns}
-            new_plans.append({'type': 'SELECT', 'condition': plan['condition'], 'column_stats': column_stats})
-        elif plan['type'] == 'JOIN':
-            column_stats = {column: plan['column_stats'][column] for column in project_columns}
-            new_plans.append({'type': 'PROJECT', 'columns': project_columns, 'column_stats': column_stats, 'child': plan})
-    query_plan = new_plans
-    # Apply joins.
-    for condition in join_conditions:
-        new_plans = []
-        for plan in query_plan:
-            if plan['type'] == 'SELECT':
-                new_plans.append({'type': 'SELECT', 'condition': plan['condition'], 'column_stats': plan['column_stats']})
-            elif plan['type'] == 'PROJECT':
-                new_plans.append({'type': 'PROJECT', 'columns': plan['columns'], 'column_stats': plan['column_stats'], 'child': plan['child']})
-            elif plan['type'] == 'JOIN':
-                left_stats = plan['left']['column_stats']
-                right_stats = plan['right']['column_stats']
-                # Apply the join condition to both children.
-                left_condition = f'({condition}) and ({plan["condition"]})'
-                right_condition = f'({condition}) and ({plan["condition"]})'
-                # Merge column stats from both children.
-                column_stats = {}
-                for column in left_stats:
-                    if column in right_stats:
-                        column_stats[column] = {
-                            'num_distinct': min(left_stats[column]['num_distinct'], right_stats[column]['num_distinct']),
-                            'min_value': min(left_stats[column]['min_value'], right_stats[column]['min_value']),
-                            'max_value': max(left_stats[column]['max_value'], right_stats[column]['max_value']),
-                            'histogram': None
-                        }
-                    else:
-                        column_stats[column] = left_stats[column]
-                for column in right_stats:
-                    if column not in left_stats:
-                        column_stats[column] = right_stats[column]
-                new_plans.append({'type': 'JOIN', 'left': plan['left'], 'right': plan['right'], 'condition': condition, 'left_condition': left_condition, 'right_condition': right_condition, 'column_stats': column_stats})
-        query_plan = new_plans
-    # Return the list of equivalent query plans.
-    return query_plan
-
-
-#3
-
-from typing import Dict, List
-import math
-
-class QueryPlan:
-    def __init__(self, root: Node):
-        self.root = root
-        self.cost = None
-
-    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-        result = self.root.execute(db)
-        return result
-
-    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-        self.cost = self.root.estimate_cost(stats)
-        return self.cost
-
-
-class Node:
-    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-        pass
-
-    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-        pass
-
-
-class ScanNode(Node):
-    def __init__(self, relation_name: str):
-        self.relation_name = relation_name
-
-    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-        return db[self.relation_name]
-
-    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-        relation_name = self.relation_name
-        relation_size = stats[relation_name].num_rows
-        return relation_size
-
-
-class SelectNode(Node):
-    def __init__(self, condition: Expression, child: Node):
-        self.condition = condition
-        self.child = child
-        self.relation_name = child.relation_name
-
-    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-        child_table = self.child.execute(db)
-        condition_func = self.condition.get_func()
-
-        result = []
-        for row in child_table:
-            if condition_func(row):
-                result.append(row)
-
-        return result
-
-    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-        relation_name = self.relation_name
-        relation_size = stats[relation_name].num_rows
-        selectivity = self.condition.estimate_selectivity(stats)
-        filtered_size = relation_size * selectivity
-        return relation_size + filtered_size
-
-
-class JoinNode(Node):
-    def __init__(self, left_child: Node, right_child: Node):
-        self.left_child = left_child
-        self.right_child = right_child
-        self.relation_name = f'{left_child.relation_name}_{right_child.relation_name}'
-
-    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-        left_table = self.left_child.execute(db)
-        right_table = self.right_child.execute(db)
-        join_cols = set(left_table[0]) & set(right_table[0])
-
-        result = []
-        for left_row in left_table:
-            for right_row in right_table:
-                match = True
-                for join_col in join_cols:
-                    if left_row[join_col] != right_row[join_col]:
-                        match = False
-                        break
-
-                if match:
-                    result.append({**left_row, **right_row})
-
-        return result
-
-    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-        left_relation_name = self.left_child.relation_name
-        right_relation_name = self.right_child.relation_name
-        left_relation_size = stats[left_relation_name].num_rows
-        right_relation_size = stats[right_relation_name].num_rows
-        return left_relation_size * right_relation_size
-
-
-class ProjectNode(Node):
-    def __init__(self, child: Node, cols: List[str]):
-        self.child = child
-        self.cols = cols
-class ProjectNode(Node):
-def init(self, child: Node, cols: List[str]):
-self.child = child
-self.cols = cols
-self.relation_name = child.relation_name
-
-def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
-    child_table = self.child.execute(db)
-    result = [{col: row[col] for col in self.cols} for row in child_table]
-    return result
-
-def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
-    child_relation_name = self.child.relation_name
-    child_relation_size = stats[child_relation_name].num_rows
-    return child_relation_size
-class Expression:
-def init(self):
-pass
-
-def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
-    pass
-
-def get_func(self):
-    pass
-class EqExpression(Expression):
-def init(self, col: str, val: any):
-self.col = col
-self.val = val
-
-def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
-    col_stats = stats[self.col]
-    if self.val in col_stats.value_counts:
-        return 1 / col_stats.value_counts[self.val]
-    else:
-        return 0
-
-def get_func(self):
-    def func(row):
-        return row[self.col] == self.val
-
-    return func
-class AndExpression(Expression):
-def init(self, left: Expression, right: Expression):
-self.left = left
-self.right = right
-
-def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
-    return self.left.estimate_selectivity(stats) * self.right.estimate_selectivity(stats)
-
-def get_func(self):
-    left_func = self.left.get_func()
-    right_func = self.right.get_func()
-
-    def func(row):
-        return left_func(row) and right_func(row)
-
-    return func
-class ColumnStats:
-def init(self, num_rows: int, value_counts: Dict[any, int]):
-self.num_rows = num_rows
-self.value_counts = value_counts
-
-def choose_best_plan(plans: List[QueryPlan], stats: Dict[str, ColumnStats]) -> QueryPlan:
-best_plan = None
-min_cost = math.inf
-for plan in plans:
-    cost = plan.estimate_cost(stats)
-    if cost < min_cost:
-        min_cost = cost
-        best_plan = plan
-
-return best_plan
-
-
-
-# Implement a simple query evaluator that uses per column statistics to evaluate the cost of each query plan
-
-#4
-
-from typing import List
-from database import MiniDB, Table
-
-from typing import Dict, List
-
-class QueryOptimizer:
-    def __init__(self, stats: Dict[str, ColumnStats]):
-        self.stats = stats
-
-    def optimize(self, root: Node) -> QueryPlan:
-        best_plan = self._find_best_plan(root, {})
-        return best_plan
-
-    def _find_best_plan(self, node: Node, memo: Dict[Node, QueryPlan]) -> QueryPlan:
-        if node in memo:
-            return memo[node]
-
-        if isinstance(node, ScanNode):
-            plan = QueryPlan(node)
-            cost = plan.estimate_cost(self.stats)
-            plan.cost = cost
-            memo[node] = plan
-            return plan
-
-        best_plan = None
-        best_cost = math.inf
-
-        for child in node.children():
-            child_plan = self._find_best_plan(child, memo)
-            plan = QueryPlan(node)
-            plan.root.set_child(child_plan.root)
-            cost = plan.estimate_cost(self.stats)
-            plan.cost = cost + child_plan.cost
-
-            if plan.cost < best_cost:
-                best_plan = plan
-                best_cost = plan.cost
-
-        memo[node] = best_plan
-        return best_plan
+#1
+
+from __future__ import annotations
+
+import array
+import operator
+
+from column_stats import DEFAULT_SAMPLE_SIZE, ColumnStats
+from itertools import compress, repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+Table = List[Dict[str, Union[str, int]]]
+# columnar table: one array (or list) of values per column name, all of the same length
+ColumnarTable = Dict[str, Sequence]
+# row of a table or of the output of a join: a dict, or a compact tuple described by a Schema
+Row = Union[Dict[str, any], tuple]
+
+
+class Schema:
+    # column names of compact tuple rows, resolved to ordinals once when a plan starts so the
+    # operators index, slice and concatenate rows by position instead of building dicts
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        # a name repeated by a join resolves to its last occurrence, the right input, which
+        # is the value {**lrow, **rrow} keeps
+        self.ordinals = {name: i for i, name in enumerate(self.names)}
+
+    def ordinal(self, name: str) -> int:
+        return self.ordinals[name]
+
+    def key_getter(self, names: List[str]) -> Callable[[tuple], any]:
+        # join key of a row: the value itself for one column, a tuple for several
+        if not names:
+            return lambda row: ()
+        return operator.itemgetter(*map(self.ordinals.__getitem__, names))
+
+    def getter(self, names: List[str]) -> Callable[[tuple], tuple]:
+        # the tuple of the given columns of a row, in the order of names
+        ordinals = [self.ordinals[name] for name in names]
+        if len(ordinals) == 1:
+            i = ordinals[0]
+            return lambda row: (row[i],)
+        if not ordinals:
+            return lambda row: ()
+        return operator.itemgetter(*ordinals)
+
+    def dict_getter(self) -> Callable[[Dict], tuple]:
+        # the tuple of a dict row, its values in the order of the schema
+        names = self.names
+        if len(names) == 1:
+            name = names[0]
+            return lambda row: (row[name],)
+        if not names:
+            return lambda row: ()
+        return operator.itemgetter(*names)
+
+    def concat(self, other: 'Schema') -> 'Schema':
+        # schema of the rows of a join, the left row followed by the right one
+        return Schema(self.names + other.names)
+
+    def to_dicts(self, rows: Iterable[tuple]) -> Iterator[Dict]:
+        # the rows as dicts, as they are handed out of a plan
+        return map(dict, map(zip, repeat(self.names), rows))
+
+    def __repr__(self):
+        return f'Schema({list(self.names)})'
+
+
+def _column_key(schema: Schema, col: str):
+    # what a row is indexed with to read col: its name in a dict row, its ordinal in a tuple row
+    return col if schema is None else schema.ordinal(col)
+
+
+def _compress_column(values: Sequence, mask: List[bool]) -> Sequence:
+    # keep the values whose mask entry is True, preserving the array type of the column
+    if isinstance(values, array.array):
+        return array.array(values.typecode, compress(values, mask))
+    return list(compress(values, mask))
+
+def project(table: Union[Table, ColumnarTable], columns: List[str]) -> Union[Table, ColumnarTable]:
+    if isinstance(table, dict):
+        # projecting a columnar table just picks the column arrays, nothing is copied
+        return {c: table[c] for c in columns}
+    return [{c: row[c] for c in columns} for row in table]
+
+def select(table: Union[Table, ColumnarTable], condition: Union[str, 'Expression']) -> Union[Table, ColumnarTable]:
+    if isinstance(table, dict):
+        # evaluate the condition as one boolean mask over whole columns and keep the selected positions
+        if isinstance(condition, str):
+            condition = parse_condition(condition)
+        mask = condition.get_mask(table)
+        return {c: _compress_column(values, mask) for c, values in table.items()}
+    # the condition is parsed and compiled once, and only once for repeated condition strings
+    func = compile_condition(condition) if isinstance(condition, str) else condition.get_func()
+    return [row for row in table if func(row)]
+
+def join(left: Table, right: Table, join_condition: Union[str, 'Expression']) -> Table:
+    if not left or not right:
+        return []
+    if isinstance(join_condition, str):
+        join_condition = parse_condition(join_condition)
+    left_keys, right_keys, residual = _split_join_condition(join_condition, left[0], right[0])
+    if not left_keys:
+        return nested_loop_join(left, right, join_condition)
+    # column equalities are answered by a hash join, the rest of the condition filters its output
+    result = hash_join(left, right, left_keys, right_keys)
+    if residual:
+        funcs = [expression.get_func() for expression in residual]
+        result = [row for row in result if all(func(row) for func in funcs)]
+    return result
+
+def nested_loop_join(left: Table, right: Table, join_condition: Union[str, 'Expression']) -> Table:
+    func = compile_condition(join_condition) if isinstance(join_condition, str) else join_condition.get_func()
+    result = []
+    for lrow in left:
+        for rrow in right:
+            row = {**lrow, **rrow}
+            if func(row):
+                result.append(row)
+    return result
+
+def _conjuncts(expression: 'Expression') -> List['Expression']:
+    # flatten a tree of AndExpressions into the list of conditions that must all hold
+    if isinstance(expression, AndExpression):
+        return _conjuncts(expression.left) + _conjuncts(expression.right)
+    return [expression]
+
+def _split_join_condition(join_condition: 'Expression', left_row: Dict, right_row: Dict):
+    # split a join condition into the column pairs it equates across the two inputs
+    # and the residual conditions, returns (left_keys, right_keys, residual)
+    left_keys, right_keys, residual = [], [], []
+    for expression in _conjuncts(join_condition):
+        if isinstance(expression, EqExpression) and isinstance(expression.val, ColumnRef):
+            a, b = expression.col, expression.val.name
+            # the condition sees {**lrow, **rrow}, so a name present on both sides means the right column
+            a_is_left = a in left_row and a not in right_row
+            b_is_left = b in left_row and b not in right_row
+            if a_is_left and not b_is_left and b in right_row:
+                left_keys.append(a)
+                right_keys.append(b)
+                continue
+            if b_is_left and not a_is_left and a in right_row:
+                left_keys.append(b)
+                right_keys.append(a)
+                continue
+        residual.append(expression)
+    return left_keys, right_keys, residual
+
+def _key_getter(keys: List[str]):
+    # function returning the join key of a row: the value itself for one column, a tuple for several
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: row[key]
+    return lambda row: tuple(row[key] for key in keys)
+
+def hash_join(left: Table, right: Table, left_keys: List[str], right_keys: List[str], build_left: bool = None) -> Table:
+    # build a hash table on one input and probe it with the other
+    # the smaller input is used as the build side unless build_left says otherwise
+    if build_left is None:
+        build_left = len(left) < len(right)
+    if build_left:
+        return list(iter_hash_join(left, right, left_keys, right_keys, build_left=True))
+    return list(iter_hash_join(right, left, right_keys, left_keys, build_left=False))
+
+def iter_hash_join(build: Table, probe: Iterable[Row], build_keys: List[str], probe_keys: List[str],
+                   build_left: bool, combine: Callable = operator.or_) -> Iterator[Row]:
+    # stream the hash join: only the build side is held in memory, probe rows are joined as they arrive
+    # build_left tells which input is the left one, so output rows are always combine(lrow, rrow):
+    # {**lrow, **rrow} for dicts, or lrow + rrow for tuples indexed by ordinal keys
+    build_key = _key_getter(build_keys)
+    probe_key = _key_getter(probe_keys)
+    buckets = {}
+    for row in build:
+        buckets.setdefault(build_key(row), []).append(row)
+    if build_left:
+        for rrow in probe:
+            for lrow in buckets.get(probe_key(rrow), ()):
+                yield combine(lrow, rrow)
+    else:
+        for lrow in probe:
+            for rrow in buckets.get(probe_key(lrow), ()):
+                yield combine(lrow, rrow)
+
+def sort_merge_join(left: Table, right: Table, left_keys: List[str], right_keys: List[str],
+                    left_sorted: bool = False, right_sorted: bool = False) -> Table:
+    # merge two inputs ordered on their join keys, sorting the ones that are not ordered yet
+    if not left_sorted:
+        left = sorted(left, key=_key_getter(left_keys))
+    if not right_sorted:
+        right = sorted(right, key=_key_getter(right_keys))
+    return list(iter_merge_join(left, right, left_keys, right_keys))
+
+def iter_merge_join(left: Table, right: Table, left_keys: List[str], right_keys: List[str],
+                    combine: Callable = operator.or_) -> Iterator[Row]:
+    # stream the merge of two inputs that are both ordered on their join keys
+    left_key = _key_getter(left_keys)
+    right_key = _key_getter(right_keys)
+    i, j = 0, 0
+    while i < len(left) and j < len(right):
+        lkey, rkey = left_key(left[i]), right_key(right[j])
+        if lkey < rkey:
+            i += 1
+        elif lkey > rkey:
+            j += 1
+        else:
+            # join the whole group of rows sharing this key on both sides
+            j_end = j
+            while j_end < len(right) and right_key(right[j_end]) == lkey:
+                j_end += 1
+            while i < len(left) and left_key(left[i]) == lkey:
+                lrow = left[i]
+                for rrow in right[j:j_end]:
+                    yield combine(lrow, rrow)
+                i += 1
+            j = j_end
+
+def index_nested_loop_join(left: Table, right: Table, left_key: str, index) -> Table:
+    # probe an existing BTreeIndex or HashIndex over the right input for every left row
+    # the index returns row ids, i.e. positions in right
+    return list(iter_index_nested_loop_join(left, right, left_key, index))
+
+def iter_index_nested_loop_join(left: Iterable[Row], right: Table, left_key: str, index,
+                                combine: Callable = operator.or_) -> Iterator[Row]:
+    # stream the index nested loop join as the left rows arrive
+    for lrow in left:
+        for row_id in index.lookup(lrow[left_key]):
+            yield combine(lrow, right[row_id])
+
+def get_column_stats(table: Table, column: str, sample_size: int = DEFAULT_SAMPLE_SIZE) -> Dict[str, Union[int, List[Union[str, int]]]]:
+    # one pass over the table; the histogram is equi-depth, built from a reservoir sample
+    # of sample_size rows (every row when sample_size is None)
+    stats = ColumnStats(sample_size=sample_size)
+    for row in table:
+        stats.add(row[column])
+    return stats.summary()
+
+def estimate_query_cost(query_plan: List[Dict]) -> float:
+    # We will use a simple cost model that estimates the cost of each operator based on column statistics.
+    # The cost of a SELECT operation is proportional to the number of rows that satisfy the condition.
+    # The cost of a PROJECT operation is negligible.
+    # The cost of a JOIN operation is proportional to the product of the number of rows in the two tables that are being joined.
+    # This is a very simple cost model that ignores many important factors, such as disk access time and network latency.
+    # A real query optimizer would use a much more sophisticated cost model.
+    cost = 0
+    for op in query_plan:
+        if op['type'] == 'SELECT':
+            column_stats = op['column_stats']
+            num_rows = column_stats['num_rows'] / max(column_stats['distinct_values'], 1)  # estimate based on the average rows per value
+            cost += num_rows
+        elif op['type'] == 'PROJECT':
+            pass
+        elif op['type'] == 'JOIN':
+            left_stats = op['left_column_stats']
+            right_stats = op['right_column_stats']
+            cost += left_stats['distinct_values'] * right_stats['distinct_values']
+    return cost
+
+#2
+
+from typing import List, Dict
+from table import Table
+
+def generate_query_plans(table: Table, select_conditions: List[str], project_columns: List[str], join_conditions: List[str]) -> List[List[Dict]]:
+    # Start with a single query plan that selects all rows from the table.
+    query_plan = [{'type': 'SELECT', 'condition': 'True', 'column_stats': {}}]
+    # Apply select conditions.
+    for condition in select_conditions:
+        new_plans = []
+        for plan in query_plan:
+            if plan['type'] == 'SELECT':
+                new_plans.append({'type': 'SELECT', 'condition': f'({condition}) and ({plan["condition"]})', 'column_stats': plan['column_stats']})
+        query_plan = new_plans
+    # Apply projection.
+    new_plans = []
+    for plan in query_plan:
+        if plan['type'] == 'SELECT':
+            column_stats = {column: plan['column_stats'][column] for column in project_columns}
+            new_plans.append({'type': 'SELECT', 'condition': plan['condition'], 'column_stats': column_stats})
+        elif plan['type'] == 'JOIN':
+            column_stats = {column: plan['column_stats'][column] for column in project_columns}
+            new_plans.append({'type': 'PROJECT', 'columns': project_columns, 'column_stats': column_stats, 'child': plan})
+    query_plan = new_plans
+    # Apply joins.
+    for condition in join_conditions:
+        new_plans = []
+        for plan in query_plan:
+            if plan['type'] == 'SELECT':
+                new_plans.append({'type': 'SELECT', 'condition': plan['condition'], 'column_stats': plan['column_stats']})
+            elif plan['type'] == 'PROJECT':
+                new_plans.append({'type': 'PROJECT', 'columns': plan['columns'], 'column_stats': plan['column_stats'], 'child': plan['child']})
+            elif plan['type'] == 'JOIN':
+                left_stats = plan['left']['column_stats']
+                right_stats = plan['right']['column_stats']
+                # Apply the join condition to both children.
+                left_condition = f'({condition}) and ({plan["condition"]})'
+                right_condition = f'({condition}) and ({plan["condition"]})'
+                # Merge column stats from both children.
+                column_stats = {}
+                for column in left_stats:
+                    if column in right_stats:
+                        column_stats[column] = {
+                            'num_distinct': min(left_stats[column]['num_distinct'], right_stats[column]['num_distinct']),
+                            'min_value': min(left_stats[column]['min_value'], right_stats[column]['min_value']),
+                            'max_value': max(left_stats[column]['max_value'], right_stats[column]['max_value']),
+                            'histogram': None
+                        }
+                    else:
+                        column_stats[column] = left_stats[column]
+                for column in right_stats:
+                    if column not in left_stats:
+                        column_stats[column] = right_stats[column]
+                new_plans.append({'type': 'JOIN', 'left': plan['left'], 'right': plan['right'], 'condition': condition, 'left_condition': left_condition, 'right_condition': right_condition, 'column_stats': column_stats})
+        query_plan = new_plans
+    # Return the list of equivalent query plans.
+    return query_plan
+
+
+#3
+
+import ast
+import functools
+from aggregates import Aggregate, aggregate_rows, final_values, sorted_aggregate
+from collections import Counter
+from external_sort import DEFAULT_SORT_BYTES, ExternalSort, mixed_key, parse_order_key, top_n
+from itertools import chain, islice, repeat
+from typing import Dict, List
+import math
+import operator
+import re
+import threading
+import time
+import tracemalloc
+
+class QueryPlan:
+    def __init__(self, root: Node):
+        self.root = root
+        self.cost = None
+
+    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
+        start = time.perf_counter()
+        result = self.root.execute(db)
+        if PLAN_COUNTERS.enabled:
+            PLAN_COUNTERS.record(self, len(result), time.perf_counter() - start)
+        return result
+
+    def iter_rows(self, db: Dict[str, Dict[str, any]]) -> Iterator[Dict]:
+        # pull the result rows one at a time, intermediate results are never materialized
+        # except for the build side of hash joins and the inputs of merge joins
+        start = time.perf_counter()
+        rows = self.root.iter_rows(db)
+        return _recorded_rows(self, rows, start) if PLAN_COUNTERS.enabled else rows
+
+    def iter_tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        # the schema of the result and its rows as compact tuples, no dict is built per row
+        start = time.perf_counter()
+        schema, rows = self.root.tuples(db)
+        return schema, _recorded_rows(self, rows, start) if PLAN_COUNTERS.enabled else rows
+
+    def iter_batches(self, db: Dict[str, Dict[str, any]], batch_size: int = 1024) -> Iterator[List[Dict]]:
+        start = time.perf_counter()
+        batches = self.root.iter_batches(db, batch_size)
+        return _recorded_batches(self, batches, start) if PLAN_COUNTERS.enabled else batches
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        self.cost = self.root.estimate_cost(stats)
+        return self.cost
+
+    def explain(self, stats: Dict[str, ColumnStats] = None) -> str:
+        # the plan tree with the estimated output rows of every node, nothing is executed
+        return _instrument(self.root, stats).format(self.cost)
+
+    def explain_analyze(self, db: Dict[str, Dict[str, any]], stats: Dict[str, ColumnStats] = None,
+                        memory: bool = False) -> PlanProfile:
+        # run the plan with every node instrumented: wall time, rows in and out, and with
+        # memory the bytes each subtree holds; stats adds the estimated rows of every node
+        # the result rows are kept in the returned profile, print it for the annotated tree
+        root = _instrument(self.root, stats)
+        tracing = memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        root.attach(memory)
+        start = time.perf_counter()
+        try:
+            schema, rows = self.root.tuples(db)
+            result = list(schema.to_dicts(rows))
+        finally:
+            root.detach()
+            seconds = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1] - base if memory else None
+            if tracing:
+                tracemalloc.stop()
+        root.infer_fused(db)
+        profile = PlanProfile(root, result, seconds, peak_bytes, self.cost)
+        if PLAN_COUNTERS.enabled:
+            PLAN_COUNTERS.record(self, len(result), seconds, profile)
+        return profile
+
+
+class Node:
+    sorted_on = None  # column the output rows are ordered by, if any
+
+    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
+        return list(self.iter_rows(db))
+
+    def iter_rows(self, db: Dict[str, Dict[str, any]]) -> Iterator[Dict]:
+        # pull-based execution: yield the output rows lazily as the parent asks for them
+        # the operators pass compact tuple rows to each other, only the output becomes dicts
+        schema, rows = self.tuples(db)
+        return schema.to_dicts(rows)
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        # the schema of the output rows, resolved once, and the rows as tuples following it
+        pass
+
+    def iter_batches(self, db: Dict[str, Dict[str, any]], batch_size: int = 1024) -> Iterator[List[Dict]]:
+        # yield the output rows in lists of at most batch_size rows
+        rows = self.iter_rows(db)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        # estimated work of this node and everything below it
+        pass
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        # estimated number of output rows
+        pass
+
+    def describe(self) -> str:
+        # one line naming the operator in EXPLAIN output
+        return type(self).__name__
+
+
+class ScanNode(Node):
+    def __init__(self, relation_name: str, sorted_on: str = None, indexed_on: List[str] = ()):
+        self.relation_name = relation_name
+        self.sorted_on = sorted_on  # column the relation rows are stored in order of, if any
+        self.indexed_on = list(indexed_on)  # columns with a BTreeIndex or HashIndex on the relation
+
+    def execute(self, db: Dict[str, Dict[str, any]]) -> Dict[str, any]:
+        return _relation_rows(db[self.relation_name])
+
+    def iter_rows(self, db: Dict[str, Dict[str, any]]) -> Iterator[Dict]:
+        # the stored rows are handed out as they are
+        return iter(_relation_rows(db[self.relation_name]))
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        relation = db[self.relation_name]
+        schema = _relation_schema(relation)
+        return schema, _relation_tuples(relation, schema)
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        relation_name = self.relation_name
+        relation_size = stats[relation_name].num_rows
+        return relation_size
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        return stats[self.relation_name].num_rows
+
+    def describe(self) -> str:
+        if self.sorted_on is not None:
+            return f'Scan {self.relation_name} sorted on {self.sorted_on}'
+        return f'Scan {self.relation_name}'
+
+    def parallel_tuples(self, db: Dict[str, Dict[str, any]], cols: List[str] = None, where_clause: tuple = None):
+        # (schema, tuple rows) of a partitioned MiniDB Table filtered by where_clause and
+        # projected on cols in worker processes, or None when the relation is not partitioned
+        relation = db[self.relation_name]
+        if getattr(relation, 'partition_rows', None) is None:
+            return None
+        names, rows = relation.parallel_select_tuples(where_clause, cols)
+        return Schema(names), rows
+
+    def parallel_aggregate(self, db: Dict[str, Dict[str, any]], group_by: List[str], aggregates: List[Aggregate],
+                           where_clause: tuple = None) -> Dict[tuple, list]:
+        # the groups of a partitioned MiniDB Table, aggregated per partition in worker
+        # processes and combined, or None when the relation is not partitioned
+        relation = db[self.relation_name]
+        if getattr(relation, 'partition_rows', None) is None:
+            return None
+        return relation.parallel_aggregate(where_clause, group_by, aggregates)
+
+
+def _relation_rows(relation) -> Table:
+    # the db maps a relation name to a list of rows or to a MiniDB Table holding them
+    return relation.rows if hasattr(relation, 'rows') else relation
+
+
+def _relation_schema(relation) -> Schema:
+    # the columns of a MiniDB Table, or the keys of the first row of a list of rows
+    if hasattr(relation, 'columns'):
+        return Schema([column.name for column in relation.columns])
+    rows = _relation_rows(relation)
+    return Schema(rows[0] if rows else ())
+
+
+def _relation_tuples(relation, schema: Schema) -> Iterator[tuple]:
+    # the rows of a relation as tuples following its schema, columnar and paged tables hand
+    # out their values without building a dict per row
+    storage = getattr(relation, 'storage', None)
+    if storage == 'columnar':
+        return zip(*_columnar_values(relation))
+    if storage == 'paged':
+        return relation.heap.scan()
+    return map(schema.dict_getter(), _relation_rows(relation))
+
+
+def _columnar_values(relation) -> List[Sequence]:
+    # the value arrays of a columnar MiniDB Table in column order, bools read back as bools
+    values = []
+    for column in relation.columns:
+        data = relation.column_data[column.name]
+        values.append(map(bool, data) if column.data_type == 'bool' else data)
+    return values
+
+
+class _RowFetcher:
+    # the row with a given id of a relation as a tuple, for index lookups
+    def __init__(self, relation, schema: Schema):
+        storage = getattr(relation, 'storage', None)
+        if storage == 'paged':
+            self.fetch = relation.heap.get
+        elif storage == 'columnar':
+            columns = [(relation.column_data[column.name], column.data_type == 'bool') for column in relation.columns]
+            self.fetch = lambda row_id: tuple(bool(data[row_id]) if is_bool else data[row_id] for data, is_bool in columns)
+        else:
+            rows, getter = _relation_rows(relation), schema.dict_getter()
+            self.fetch = lambda row_id: getter(rows[row_id])
+
+    def __getitem__(self, row_id: int) -> tuple:
+        return self.fetch(row_id)
+
+
+def _failing_rows(rows: Iterator[tuple], error: Exception) -> Iterator[tuple]:
+    # raise error once a row arrives: a column missing from a schema fails on the first row
+    # as it did with dict rows, so inputs without any rows stay valid
+    for _ in rows:
+        raise error
+    yield from ()
+
+
+def _peek(rows: Iterator[Dict]):
+    # get the first row of an iterator without losing it, returns (first_row, rows)
+    rows = iter(rows)
+    for first in rows:
+        return first, chain((first,), rows)
+    return None, iter(())
+
+
+def _relation_index(relation, column: str):
+    # get an index over the column of a MiniDB Table, or None
+    if not hasattr(relation, 'get_indexes'):
+        return None
+    indexes = relation.get_indexes(column)
+    return indexes[0] if indexes else None
+
+
+class SelectNode(Node):
+    def __init__(self, condition: Expression, child: Node):
+        self.condition = condition
+        self.child = child
+        self.relation_name = child.relation_name
+        self.sorted_on = child.sorted_on
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        parallel = self.parallel_tuples(db)
+        if parallel is not None:
+            return parallel
+        if isinstance(self.child, ScanNode):
+            relation = db[self.child.relation_name]
+            if getattr(relation, 'storage', 'row') == 'row':
+                # rows stored as dicts are tested first, only the selected ones become tuples
+                schema = _relation_schema(relation)
+                rows = filter(self.condition.get_func(), self.child.iter_rows(db))
+                return schema, map(schema.dict_getter(), rows)
+        schema, rows = self.child.tuples(db)
+        try:
+            # the condition reads the columns it tests by ordinal
+            condition_func = self.condition.get_func(schema)
+        except KeyError as error:
+            return schema, _failing_rows(rows, error)
+        return schema, filter(condition_func, rows)
+
+    def parallel_tuples(self, db: Dict[str, Dict[str, any]], cols: List[str] = None):
+        # a selection straight over a partitioned table runs in worker processes when its
+        # condition can be written as a where_clause of the 1st issue
+        if not isinstance(self.child, ScanNode):
+            return None
+        where_clause = self.condition.to_where_clause(db[self.child.relation_name])
+        if where_clause is None:
+            return None
+        return self.child.parallel_tuples(db, cols, where_clause)
+
+    def parallel_aggregate(self, db: Dict[str, Dict[str, any]], group_by: List[str],
+                           aggregates: List[Aggregate]) -> Dict[tuple, list]:
+        # the workers filter the partitions before aggregating them
+        if not isinstance(self.child, ScanNode):
+            return None
+        where_clause = self.condition.to_where_clause(db[self.child.relation_name])
+        if where_clause is None:
+            return None
+        return self.child.parallel_aggregate(db, group_by, aggregates, where_clause)
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        # every input row is tested, the selected ones are passed on
+        relation_size = self.child.estimate_rows(stats)
+        filtered_size = self.estimate_rows(stats)
+        return self.child.estimate_cost(stats) + relation_size + filtered_size
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        return self.child.estimate_rows(stats) * self.condition.estimate_selectivity(stats)
+
+    def describe(self) -> str:
+        return f'Select {self.condition!r}'
+
+
+# join algorithms JoinNode can run
+JOIN_METHODS = ('hash', 'merge', 'index', 'nested_loop')
+
+
+class JoinNode(Node):
+    def __init__(self, left_child: Node, right_child: Node, join_cols: List[str] = None, method: str = None):
+        self.left_child = left_child
+        self.right_child = right_child
+        self.relation_name = f'{left_child.relation_name}_{right_child.relation_name}'
+        self.join_cols = join_cols  # joined on the columns both inputs share when None
+        self.method = method  # forces one of JOIN_METHODS, otherwise estimate_cost picks the cheapest
+        self.chosen_method = None
+        self.build_left = None  # hash join build side, the smaller input according to ColumnStats
+        self.join_selectivity = None  # set by the QueryOptimizer from the statistics of each side
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        # the output rows are the left row followed by the right one, concatenated tuples
+        left_schema, left_rows = self.left_child.tuples(db)
+        right_schema, right_rows = self.right_child.tuples(db)
+        rows = self._join_tuples(db, left_schema, left_rows, right_schema, right_rows)
+        return left_schema.concat(right_schema), rows
+
+    def _join_tuples(self, db: Dict[str, Dict[str, any]], left_schema: Schema, left_rows: Iterator[tuple],
+                     right_schema: Schema, right_rows: Iterator[tuple]) -> Iterator[tuple]:
+        method = self.method or self.chosen_method or 'hash'
+        if method == 'index' and isinstance(self.right_child, ScanNode):
+            right_relation = db[self.right_child.relation_name]
+            first_left, left_rows = _peek(left_rows)
+            if first_left is None or not _relation_rows(right_relation):
+                return
+            join_cols = self._join_columns(left_schema, right_schema)
+            index = _relation_index(right_relation, join_cols[0]) if len(join_cols) == 1 else None
+            if index is not None:
+                right_table = _RowFetcher(right_relation, right_schema)
+                yield from iter_index_nested_loop_join(left_rows, right_table, left_schema.ordinal(join_cols[0]),
+                                                       index, operator.add)
+                return
+            # no usable index, fall back to a hash join on the scanned rows
+            method = 'hash'
+
+        if method == 'merge':
+            # a merge join needs both inputs in order, so it consumes them completely
+            left_table, right_table = list(left_rows), list(right_rows)
+            if not left_table or not right_table:
+                return
+            join_cols = self._join_columns(left_schema, right_schema)
+            left_sorted = self.left_child.sorted_on is not None and [self.left_child.sorted_on] == join_cols
+            right_sorted = self.right_child.sorted_on is not None and [self.right_child.sorted_on] == join_cols
+            left_table, left_sorted = self._ordered_rows(self.left_child, db, left_table, join_cols, left_sorted)
+            right_table, right_sorted = self._ordered_rows(self.right_child, db, right_table, join_cols, right_sorted)
+            if not left_sorted:
+                left_table = sorted(left_table, key=left_schema.key_getter(join_cols))
+            if not right_sorted:
+                right_table = sorted(right_table, key=right_schema.key_getter(join_cols))
+            left_keys = [left_schema.ordinal(col) for col in join_cols]
+            right_keys = [right_schema.ordinal(col) for col in join_cols]
+            yield from iter_merge_join(left_table, right_table, left_keys, right_keys, operator.add)
+            return
+
+        # hash and nested loop joins hold the build (inner) input and stream the other one
+        # without statistics the right input is the build side
+        build_left = bool(self.build_left)
+        if build_left:
+            build, probe = list(left_rows), right_rows
+        else:
+            build, probe = list(right_rows), left_rows
+        first_probe, probe = _peek(probe)
+        if not build or first_probe is None:
+            return
+        join_cols = self._join_columns(left_schema, right_schema)
+        if method == 'nested_loop':
+            left_key, right_key = left_schema.key_getter(join_cols), right_schema.key_getter(join_cols)
+            build_key, probe_key = (left_key, right_key) if build_left else (right_key, left_key)
+            for probe_row in probe:
+                key = probe_key(probe_row)
+                for build_row in build:
+                    if build_key(build_row) == key:
+                        yield build_row + probe_row if build_left else probe_row + build_row
+            return
+        left_keys = [left_schema.ordinal(col) for col in join_cols]
+        right_keys = [right_schema.ordinal(col) for col in join_cols]
+        if build_left:
+            yield from iter_hash_join(build, probe, left_keys, right_keys, True, operator.add)
+        else:
+            yield from iter_hash_join(build, probe, right_keys, left_keys, False, operator.add)
+
+    def _join_columns(self, left_schema: Schema, right_schema: Schema) -> List[str]:
+        if self.join_cols is not None:
+            return self.join_cols
+        return sorted(set(left_schema.names) & set(right_schema.names))
+
+    def _ordered_rows(self, child: Node, db: Dict[str, Dict[str, any]], table: Table, join_cols: List[str], is_sorted: bool):
+        # read the rows of a scanned relation in join column order through its BTreeIndex
+        if is_sorted or len(join_cols) != 1 or not isinstance(child, ScanNode):
+            return table, is_sorted
+        index = _relation_index(db[child.relation_name], join_cols[0])
+        if index is None or not hasattr(index, 'tree'):
+            return table, False
+        # an open range lists every row id the index shows, a snapshot view leaves out later rows
+        return [table[row_id] for row_id in index.range_lookup()], True
+
+    def _method_costs(self, left_size: float, right_size: float) -> Dict[str, float]:
+        # cost of each join algorithm that can run on these children
+        if self.join_cols == []:
+            # nothing to match on, every algorithm degrades to a cross product
+            return {'nested_loop': left_size * right_size}
+        costs = {
+            'nested_loop': left_size * right_size,
+            # scan both inputs and build a hash table on the smaller one
+            'hash': left_size + right_size + min(left_size, right_size),
+        }
+        join_cols = self.join_cols or []
+        if len(join_cols) == 1:
+            join_col = join_cols[0]
+
+            def sort_cost(child: Node, size: float) -> float:
+                ordered = child.sorted_on == join_col or (isinstance(child, ScanNode) and join_col in child.indexed_on)
+                return 0 if ordered else size * math.log2(size + 1)
+
+            costs['merge'] = left_size + right_size + sort_cost(self.left_child, left_size) + sort_cost(self.right_child, right_size)
+            if isinstance(self.right_child, ScanNode) and join_col in self.right_child.indexed_on:
+                costs['index'] = left_size * (1 + math.log2(right_size + 1))
+        return costs
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        left_relation_size = self.left_child.estimate_rows(stats)
+        right_relation_size = self.right_child.estimate_rows(stats)
+        join_cost = self.choose_method(left_relation_size, right_relation_size)
+        return self.left_child.estimate_cost(stats) + self.right_child.estimate_cost(stats) + join_cost
+
+    def choose_method(self, left_relation_size: float, right_relation_size: float) -> float:
+        # pick the cheapest join algorithm for inputs of these sizes and return its cost
+        self.build_left = left_relation_size < right_relation_size
+        costs = self._method_costs(left_relation_size, right_relation_size)
+        if self.method is not None:
+            self.chosen_method = self.method
+        else:
+            self.chosen_method = min(costs, key=costs.get)
+        # a merge join keeps its output ordered on the join column
+        self.sorted_on = self.join_cols[0] if self.chosen_method == 'merge' else None
+        return costs.get(self.chosen_method, left_relation_size * right_relation_size)
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        left_rows = self.left_child.estimate_rows(stats)
+        right_rows = self.right_child.estimate_rows(stats)
+        return left_rows * right_rows * self.estimate_selectivity(stats, left_rows, right_rows)
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats], left_rows: float, right_rows: float) -> float:
+        # fraction of the row pairs that match: 1 / the larger distinct count of each join column
+        if self.join_selectivity is not None:
+            return self.join_selectivity
+        if self.join_cols is None:
+            # natural join over unknown columns, assume a key / foreign key join
+            return 1 / max(left_rows, right_rows, 1)
+        selectivity = 1.0
+        for join_col in self.join_cols:
+            col_stats = stats.get(join_col)
+            if col_stats is None:
+                selectivity *= DEFAULT_EQ_SELECTIVITY
+            else:
+                selectivity /= max(col_stats.num_distinct, 1)
+        return selectivity
+
+    def describe(self) -> str:
+        method = self.method or self.chosen_method or 'hash'
+        cols = ', '.join(self.join_cols) if self.join_cols is not None else 'shared columns'
+        if method in ('hash', 'nested_loop'):
+            return f"Join {method} on {cols}, build {'left' if self.build_left else 'right'}"
+        return f'Join {method} on {cols}'
+
+
+class ProjectNode(Node):
+    def __init__(self, child: Node, cols: List[str]):
+        self.child = child
+        self.cols = cols
+        self.relation_name = child.relation_name
+        self.sorted_on = child.sorted_on if child.sorted_on in cols else None
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        cols = self.cols
+        if isinstance(self.child, (ScanNode, SelectNode)):
+            # the workers of a parallel scan only send back the projected columns
+            parallel = self.child.parallel_tuples(db, cols)
+            if parallel is not None:
+                return parallel
+        schema, rows = self.child.tuples(db)
+        try:
+            # positional slicing of the child rows instead of a new dict per row
+            getter = schema.getter(cols)
+        except KeyError as error:
+            return Schema(cols), _failing_rows(rows, error)
+        return Schema(cols), map(getter, rows)
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        child_relation_size = self.child.estimate_rows(stats)
+        return self.child.estimate_cost(stats) + child_relation_size
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        return self.child.estimate_rows(stats)
+
+    def describe(self) -> str:
+        return f"Project {', '.join(self.cols)}"
+
+
+class LimitNode(Node):
+    def __init__(self, child: Node, limit: int, offset: int = 0):
+        if isinstance(child, SortNode):
+            # ORDER BY ... LIMIT: the sort only keeps the rows the limit can return
+            child = child.top(offset + limit)
+        self.child = child
+        self.limit = limit
+        self.offset = offset
+        self.relation_name = child.relation_name
+        self.sorted_on = child.sorted_on
+
+    def iter_rows(self, db: Dict[str, Dict[str, any]]) -> Iterator[Dict]:
+        # stop pulling from the child as soon as enough rows were produced
+        return islice(self.child.iter_rows(db), self.offset, self.offset + self.limit)
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        schema, rows = self.child.tuples(db)
+        return schema, islice(rows, self.offset, self.offset + self.limit)
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        # a pipelined child only does the fraction of its work needed for the first rows
+        child_cost = self.child.estimate_cost(stats)
+        relation_size = self.child.estimate_rows(stats)
+        if not relation_size:
+            return child_cost
+        return child_cost * min(1.0, (self.offset + self.limit) / relation_size)
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        return min(self.child.estimate_rows(stats), self.limit)
+
+    def describe(self) -> str:
+        if self.offset:
+            return f'Limit {self.limit} offset {self.offset}'
+        return f'Limit {self.limit}'
+
+
+# ways AggregateNode can group its input
+AGGREGATE_MODES = ('hash', 'sorted')
+
+
+class AggregateNode(Node):
+    # GROUP BY: one output row per group with the group columns followed by the aggregates,
+    # e.g. AggregateNode(child, ['l_returnflag'], ['count(*)', 'sum(l_quantity) as qty'])
+    # without group columns the whole input is one group and there is always one output row
+    def __init__(self, child: Node, group_by: List[str], aggregates: List[Union[str, Aggregate]], mode: str = None):
+        self.child = child
+        self.group_by = list(group_by)
+        self.aggregates = [aggregate if isinstance(aggregate, Aggregate) else Aggregate(aggregate)
+                           for aggregate in aggregates]
+        # forces one of AGGREGATE_MODES, otherwise groups are streamed when the input is
+        # ordered on the group column and hashed when it is not
+        self.mode = mode
+        self.relation_name = child.relation_name
+        self.sorted_on = self.group_by[0] if self.chosen_mode() == 'sorted' else None
+
+    def chosen_mode(self) -> str:
+        if self.mode is not None:
+            return self.mode
+        if len(self.group_by) == 1 and self.child.sorted_on == self.group_by[0]:
+            return 'sorted'
+        return 'hash'
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        schema = Schema(self.group_by + [aggregate.name for aggregate in self.aggregates])
+        if not self.group_by:
+            values = self._metadata_values(db)
+            if values is not None:
+                return schema, iter([values])
+        if isinstance(self.child, (ScanNode, SelectNode)):
+            # partitions are aggregated by the workers of a parallel scan, only the partial
+            # aggregates come back
+            groups = self.child.parallel_aggregate(db, self.group_by, self.aggregates)
+            if groups is not None:
+                return schema, self._output_rows(groups.items())
+        child_schema, rows = self.child.tuples(db)
+        try:
+            key = child_schema.key_getter(self.group_by)
+            ordinals = [None if aggregate.column is None else child_schema.ordinal(aggregate.column)
+                        for aggregate in self.aggregates]
+        except KeyError as error:
+            # an input without rows still has its totals
+            return schema, self._output_rows(_failing_rows(rows, error))
+        if self.chosen_mode() == 'sorted':
+            groups = sorted_aggregate(rows, key, self.aggregates, ordinals)
+        else:
+            groups = self._hashed_groups(rows, key, ordinals)
+        return schema, self._output_rows(groups)
+
+    def _hashed_groups(self, rows: Iterator[tuple], key: Callable, ordinals: List[int]) -> Iterator[tuple]:
+        # the input is consumed once the first output row is asked for
+        yield from aggregate_rows(rows, key, self.aggregates, ordinals).items()
+
+    def _output_rows(self, groups: Iterable[tuple]) -> Iterator[tuple]:
+        single = len(self.group_by) == 1
+        found = False
+        for group_key, states in groups:
+            found = True
+            yield ((group_key,) if single else group_key) + final_values(states, self.aggregates)
+        if not found and not self.group_by:
+            # an empty input still has its totals: count 0, the other aggregates None
+            yield final_values([aggregate.new() for aggregate in self.aggregates], self.aggregates)
+
+    def _metadata_values(self, db: Dict[str, Dict[str, any]]) -> tuple:
+        # count(*), min and max straight over a table are answered from its row count, the
+        # ends of a BTreeIndex and up-to-date ColumnStats without reading the rows; None when
+        # an aggregate needs the rows
+        if not isinstance(self.child, ScanNode):
+            return None
+        relation = db[self.child.relation_name]
+        num_rows = len(_relation_rows(relation))
+        values = []
+        for aggregate in self.aggregates:
+            if aggregate.func == 'count' and aggregate.column is None:
+                values.append(num_rows)
+            elif aggregate.func in ('min', 'max'):
+                found, value = _column_extreme(relation, aggregate.column, aggregate.func == 'max', num_rows)
+                if not found:
+                    return None
+                values.append(value)
+            else:
+                return None
+        return tuple(values)
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        # one pass over the input, plus a hash table of the groups unless the input is ordered
+        self.sorted_on = self.group_by[0] if self.chosen_mode() == 'sorted' else None
+        child_rows = self.child.estimate_rows(stats)
+        groups = self.estimate_rows(stats) if self.chosen_mode() == 'hash' else 0
+        return self.child.estimate_cost(stats) + child_rows + groups
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        # the number of groups: the product of the distinct counts of the group columns,
+        # at most one group per input row
+        if not self.group_by:
+            return 1
+        child_rows = self.child.estimate_rows(stats)
+        groups = 1.0
+        for col in self.group_by:
+            col_stats = stats.get(col)
+            groups *= col_stats.num_distinct if col_stats is not None else 1 / DEFAULT_EQ_SELECTIVITY
+        return max(min(groups, child_rows), 1.0) if child_rows else 0.0
+
+    def describe(self) -> str:
+        aggregates = ', '.join(map(repr, self.aggregates))
+        if not self.group_by:
+            return f'Aggregate {aggregates}'
+        return f"Aggregate {self.chosen_mode()} {aggregates} by {', '.join(self.group_by)}"
+
+
+def _column_extreme(relation, column: str, largest: bool, num_rows: int) -> Tuple[bool, any]:
+    # (True, min or max of a column of a MiniDB Table) when an index or the statistics know
+    # it without a scan, else (False, None)
+    for index in getattr(relation, 'get_indexes', lambda column: [])(column):
+        if hasattr(index, 'first_key'):
+            return True, index.first_key(reverse=largest)
+    column_stats = (getattr(relation, 'stats', None) or {}).get(column)
+    # statistics kept up to date by the inserts cover exactly the rows when their counts
+    # match, a snapshot of the table sees fewer rows than they do
+    if column_stats is not None and column_stats.num_rows == num_rows:
+        return True, column_stats.max_value if largest else column_stats.min_value
+    return False, None
+
+
+# ways SortNode can deliver its rows in order
+SORT_METHODS = ('sort', 'top_n', 'index', 'presorted')
+
+
+class SortNode(Node):
+    # ORDER BY: the input rows ordered on keys, each a column optionally followed by asc or
+    # desc, e.g. SortNode(child, ['o_totalprice desc', 'orderkey']); with limit only the
+    # first limit rows come out, which a LimitNode right above the sort asks for
+    def __init__(self, child: Node, order_by: List[str], limit: int = None, max_bytes: int = DEFAULT_SORT_BYTES,
+                 temp_dir: str = None):
+        if not order_by:
+            raise ValueError("Sort needs at least one column to order by")
+        self.child = child
+        self.order_by = list(order_by)
+        keys = [parse_order_key(text) for text in self.order_by]
+        self.keys = [column for column, _ in keys]
+        self.descending = [descending for _, descending in keys]
+        self.limit = limit
+        # memory budget of the rows held at once, a larger input is sorted in runs written to
+        # temporary files in temp_dir and merged back
+        self.max_bytes = max_bytes
+        self.temp_dir = temp_dir
+        self.relation_name = child.relation_name
+        self.sorted_on = None if self.descending[0] else self.keys[0]
+        self.chosen_method = None  # one of SORT_METHODS, picked by estimate_cost
+        self.runs = 0  # sorted runs the last sort wrote to disk
+
+    def top(self, n: int) -> SortNode:
+        # the same sort producing only its first n rows
+        limit = n if self.limit is None else min(self.limit, n)
+        return SortNode(self.child, self.order_by, limit, self.max_bytes, self.temp_dir)
+
+    def presorted(self) -> bool:
+        # the child already delivers the rows in this order
+        return len(self.keys) == 1 and not self.descending[0] and self.child.sorted_on == self.keys[0]
+
+    def tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        if not self.presorted():
+            # a BTreeIndex on the key hands out the row ids in order, the rows are fetched
+            # as they are asked for and nothing is sorted
+            ordered = self._index_tuples(db)
+            if ordered is not None:
+                return ordered
+        schema, rows = self.child.tuples(db)
+        if self.presorted():
+            return schema, self._first_rows(rows)
+        try:
+            if all(self.descending) or not any(self.descending):
+                key, reverse = schema.key_getter(self.keys), self.descending[0]
+            else:
+                key, reverse = mixed_key([schema.ordinal(col) for col in self.keys], self.descending), False
+        except KeyError as error:
+            return schema, _failing_rows(rows, error)
+        if self.limit is not None:
+            return schema, self._top_rows(rows, key, reverse)
+        return schema, self._sorted_rows(rows, key, reverse)
+
+    def _index_tuples(self, db: Dict[str, Dict[str, any]]) -> Tuple[Schema, Iterator[tuple]]:
+        # (schema, rows) of a scanned MiniDB Table in the order of a BTreeIndex on the one
+        # key, or None without such an index
+        if len(self.keys) != 1 or not isinstance(self.child, ScanNode):
+            return None
+        relation = db[self.child.relation_name]
+        for index in getattr(relation, 'get_indexes', lambda column: [])(self.keys[0]):
+            if hasattr(index, 'ordered_row_ids'):
+                schema = _relation_schema(relation)
+                fetcher = _RowFetcher(relation, schema)
+                return schema, self._first_rows(map(fetcher.__getitem__, index.ordered_row_ids(self.descending[0])))
+        return None
+
+    def _first_rows(self, rows: Iterator[tuple]) -> Iterator[tuple]:
+        return rows if self.limit is None else islice(rows, self.limit)
+
+    def _top_rows(self, rows: Iterator[tuple], key: Callable, reverse: bool) -> Iterator[tuple]:
+        # ORDER BY ... LIMIT n keeps a heap of n rows while the input streams by
+        yield from top_n(rows, self.limit, key, reverse)
+
+    def _sorted_rows(self, rows: Iterator[tuple], key: Callable, reverse: bool) -> Iterator[tuple]:
+        sorter = ExternalSort(key, reverse, self.max_bytes, self.temp_dir)
+        try:
+            yield from sorter.sort(rows)
+        finally:
+            self.runs = sorter.runs
+
+    def estimate_cost(self, stats: Dict[str, ColumnStats]) -> int:
+        # sorting the input costs n log n comparisons, a top-N heap n log N, walking an
+        # index only touches the rows that come out
+        # the child cost comes first, a join decides there whether its output is ordered
+        child_cost = self.child.estimate_cost(stats)
+        rows = self.child.estimate_rows(stats)
+        wanted = rows if self.limit is None else min(rows, self.limit)
+        if self.presorted():
+            self.chosen_method = 'presorted'
+            return child_cost + wanted
+        costs = {}
+        if self.limit is None:
+            costs['sort'] = child_cost + rows * math.log2(rows + 1)
+        else:
+            costs['top_n'] = child_cost + rows * math.log2(wanted + 1)
+        if len(self.keys) == 1 and isinstance(self.child, ScanNode) and self.keys[0] in self.child.indexed_on:
+            costs['index'] = wanted + math.log2(rows + 1)
+        self.chosen_method = min(costs, key=costs.get)
+        return costs[self.chosen_method]
+
+    def estimate_rows(self, stats: Dict[str, ColumnStats]) -> float:
+        rows = self.child.estimate_rows(stats)
+        return rows if self.limit is None else min(rows, self.limit)
+
+    def describe(self) -> str:
+        text = f"Sort {', '.join(self.order_by)}"
+        if self.limit is not None:
+            text += f' top {self.limit}'
+        if self.chosen_method == 'index':
+            text += ' by index'
+        elif self.chosen_method == 'presorted':
+            text += ', presorted'
+        if self.runs:
+            text += f', {self.runs} runs on disk'
+        return text
+
+
+# EXPLAIN ANALYZE: explain_analyze replaces the tuples method of every node of a plan with
+# one that times the call and wraps the returned rows in a _ProfiledRows counting them,
+# the nodes keep their types so the operators take the same paths as in execute
+
+# an estimate off by this factor or more is marked as a misestimate
+MISESTIMATE_FACTOR = 10
+
+
+class OperatorProfile:
+    # what one plan node did during an EXPLAIN ANALYZE run; seconds and peak_bytes include
+    # the work of the children, which run inside the calls that pull rows from this node
+    def __init__(self, node: Node, children: List[OperatorProfile], estimated_rows: float = None):
+        self.node = node
+        self.children = children
+        self.estimated_rows = estimated_rows
+        self.executed = False
+        # run inside its parent, a parallel scan or a sort reading an index; rows_out is then
+        # inferred, None when unknown
+        self.fused = False
+        self.fused_as = 'inside parallel scan'
+        self.rows_out = 0
+        self.seconds = 0.0
+        self.peak_bytes = None
+
+    @property
+    def rows_in(self) -> int:
+        # rows handed to this node by its children, None for a scan or unknown inputs
+        if not self.children or not all(child.executed or child.fused for child in self.children):
+            return None
+        if any(child.rows_out is None for child in self.children):
+            return None
+        return sum(child.rows_out for child in self.children)
+
+    @property
+    def self_seconds(self) -> float:
+        return max(0.0, self.seconds - sum(child.seconds for child in self.children))
+
+    @property
+    def q_error(self) -> float:
+        # factor between the estimated and actual rows, 1.0 for a perfect estimate
+        if self.estimated_rows is None or not (self.executed or self.fused) or self.rows_out is None:
+            return None
+        estimated, actual = max(self.estimated_rows, 1.0), max(self.rows_out, 1)
+        return max(estimated / actual, actual / estimated)
+
+    def attach(self, memory: bool = False):
+        # instrument the node and its subtree until detach
+        for child in self.children:
+            child.attach(memory)
+        tuples = self.node.tuples
+
+        def profiled_tuples(db):
+            self.executed = True
+            base = tracemalloc.get_traced_memory()[0] if memory else None
+            start = time.perf_counter()
+            schema, rows = tuples(db)
+            self.seconds += time.perf_counter() - start
+            return schema, _ProfiledRows(rows, self, base)
+
+        self.node.tuples = profiled_tuples
+        if isinstance(self.node, ScanNode):
+            # a selection reads stored dict rows through iter_rows
+            iter_rows = self.node.iter_rows
+
+            def profiled_iter_rows(db):
+                self.executed = True
+                return _ProfiledRows(iter_rows(db), self, tracemalloc.get_traced_memory()[0] if memory else None)
+
+            self.node.iter_rows = profiled_iter_rows
+
+    def detach(self):
+        self.node.__dict__.pop('tuples', None)
+        self.node.__dict__.pop('iter_rows', None)
+        for child in self.children:
+            child.detach()
+
+    def infer_fused(self, db: Dict[str, Dict[str, any]], parent: OperatorProfile = None):
+        # a parallel scan reads the relation in worker processes: the scan produced every
+        # stored row and a selection below a projection the projection's rows, below an
+        # aggregate the workers only send back the groups
+        if not self.executed and parent is not None and (parent.executed or parent.fused):
+            self.fused = True
+            if isinstance(parent.node, SortNode):
+                # the sort fetched the rows of the table in the order of an index, the
+                # estimate of a full scan does not apply
+                self.rows_out = parent.rows_out
+                self.estimated_rows = None
+                self.fused_as = 'read in index order'
+            elif isinstance(self.node, ScanNode):
+                self.rows_out = len(_relation_rows(db[self.node.relation_name]))
+            elif isinstance(parent.node, AggregateNode):
+                self.rows_out = None
+            else:
+                self.rows_out = parent.rows_out
+        for child in self.children:
+            child.infer_fused(db, self)
+
+    def format_lines(self, depth: int = 0) -> List[str]:
+        fields = []
+        if (self.executed or self.fused) and self.rows_out is not None:
+            fields.append(f'rows={self.rows_out:,}')
+        if self.estimated_rows is not None:
+            fields.append(f'est={self.estimated_rows:,.0f}')
+        if self.q_error is not None and self.q_error >= MISESTIMATE_FACTOR:
+            fields.append(f'misestimate x{self.q_error:,.0f}')
+        if self.rows_in is not None:
+            fields.append(f'in={self.rows_in:,}')
+        if self.executed:
+            fields.append(f'time={self.seconds * 1e3:.3f} ms self={self.self_seconds * 1e3:.3f} ms')
+        elif self.fused:
+            fields.append(self.fused_as)
+        if self.peak_bytes is not None:
+            fields.append(f'mem={self.peak_bytes / 1024:,.1f} KB')
+        prefix = '  ' * depth + ('-> ' if depth else '')
+        lines = [f"{prefix}{self.node.describe()}  ({' '.join(fields)})" if fields else prefix + self.node.describe()]
+        for child in self.children:
+            lines.extend(child.format_lines(depth + 1))
+        return lines
+
+    def format(self, cost: float = None) -> str:
+        lines = self.format_lines()
+        if cost is not None:
+            lines.insert(0, f'estimated cost {cost:,.0f}')
+        return '\n'.join(lines)
+
+    def walk(self) -> Iterator[OperatorProfile]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class _ProfiledRows:
+    # iterator over the rows of a node adding the time spent producing each one to its
+    # OperatorProfile, with base the traced memory growth is sampled after every row
+    def __init__(self, rows: Iterable[tuple], profile: OperatorProfile, base: int = None):
+        self.rows = iter(rows)
+        self.profile = profile
+        self.base = base
+        if base is not None:
+            profile.peak_bytes = profile.peak_bytes or 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        profile = self.profile
+        start = time.perf_counter()
+        try:
+            row = next(self.rows)
+        finally:
+            profile.seconds += time.perf_counter() - start
+            if self.base is not None:
+                profile.peak_bytes = max(profile.peak_bytes, tracemalloc.get_traced_memory()[0] - self.base)
+        profile.rows_out += 1
+        return row
+
+
+class PlanProfile:
+    # the result of QueryPlan.explain_analyze: the result rows and the profile of every node
+    def __init__(self, root: OperatorProfile, rows: List[Dict], seconds: float, peak_bytes: int = None, cost: float = None):
+        self.root = root
+        self.rows = rows
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.cost = cost
+
+    def operators(self) -> List[OperatorProfile]:
+        return list(self.root.walk())
+
+    def misestimates(self, factor: float = MISESTIMATE_FACTOR) -> List[OperatorProfile]:
+        # the nodes whose estimated rows are off by factor or more
+        return [op for op in self.root.walk() if op.q_error is not None and op.q_error >= factor]
+
+    def format(self) -> str:
+        header = f'{len(self.rows):,} rows in {self.seconds * 1e3:.3f} ms'
+        if self.peak_bytes is not None:
+            header += f', peak memory {self.peak_bytes / 2**20:,.2f} MB'
+        return header + '\n' + self.root.format(self.cost)
+
+    def __str__(self):
+        return self.format()
+
+
+def _children(node: Node) -> List[Node]:
+    return [getattr(node, attr) for attr in ('child', 'left_child', 'right_child') if getattr(node, attr, None) is not None]
+
+
+def _instrument(node: Node, stats: Dict[str, ColumnStats] = None) -> OperatorProfile:
+    # the OperatorProfile tree of a plan, with the estimated rows of every node when stats are given
+    children = [_instrument(child, stats) for child in _children(node)]
+    estimated_rows = node.estimate_rows(stats) if stats is not None else None
+    return OperatorProfile(node, children, estimated_rows)
+
+
+class PlanExecution:
+    # one executed plan as handed to the profiling hooks; profile is the PlanProfile of an
+    # EXPLAIN ANALYZE run and None otherwise
+    def __init__(self, plan: QueryPlan, rows: int, seconds: float, profile: PlanProfile = None):
+        self.plan = plan
+        self.rows = rows
+        self.seconds = seconds
+        self.profile = profile
+
+
+class PlanCounters:
+    # totals over every plan run by QueryPlan, cheap enough to stay on: a few counter
+    # updates per query, never per row; a streamed plan is counted once it is exhausted
+    # hooks are called with a PlanExecution after every plan, e.g. to log slow queries
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.queries = 0
+            self.rows = 0
+            self.seconds = 0.0
+            self.operators = Counter()  # executed nodes by type
+            self.join_methods = Counter()  # planned join algorithm of the executed JoinNodes
+
+    def add_hook(self, hook: Callable[[PlanExecution], None]):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[PlanExecution], None]):
+        self.hooks.remove(hook)
+
+    def record(self, plan: QueryPlan, rows: int, seconds: float, profile: PlanProfile = None):
+        nodes = [plan.root]
+        with self.lock:
+            self.queries += 1
+            self.rows += rows
+            self.seconds += seconds
+            while nodes:
+                node = nodes.pop()
+                self.operators[type(node).__name__] += 1
+                if isinstance(node, JoinNode):
+                    self.join_methods[node.method or node.chosen_method or 'hash'] += 1
+                nodes.extend(_children(node))
+        if self.hooks:
+            execution = PlanExecution(plan, rows, seconds, profile)
+            for hook in list(self.hooks):
+                hook(execution)
+
+    def summary(self) -> Dict[str, any]:
+        with self.lock:
+            return {
+                'queries': self.queries,
+                'rows': self.rows,
+                'seconds': self.seconds,
+                'operators': dict(self.operators),
+                'join_methods': dict(self.join_methods),
+            }
+
+
+PLAN_COUNTERS = PlanCounters()
+
+
+def _recorded_rows(plan: QueryPlan, rows: Iterable, start: float) -> Iterator:
+    count = 0
+    for count, row in enumerate(rows, 1):
+        yield row
+    PLAN_COUNTERS.record(plan, count, time.perf_counter() - start)
+
+
+def _recorded_batches(plan: QueryPlan, batches: Iterable[List], start: float) -> Iterator[List]:
+    count = 0
+    for batch in batches:
+        count += len(batch)
+        yield batch
+    PLAN_COUNTERS.record(plan, count, time.perf_counter() - start)
+class Expression:
+    def __init__(self):
+        pass
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        pass
+
+    def get_func(self, schema: Schema = None):
+        # function testing a row: a dict, or a tuple following schema whose ordinals are
+        # resolved here once
+        pass
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        pass
+
+    def to_where_clause(self, relation) -> tuple:
+        # the condition as a where_clause tuple of the 1st issue over the columns of a MiniDB
+        # Table, or None when it has no such form
+        return None
+
+
+def _where_value(relation, col: str, val: any) -> bool:
+    # where_clause values are cast to the type of their column, so only values that already
+    # have that type keep the meaning of the condition
+    if isinstance(val, ColumnRef):
+        return False
+    for column in getattr(relation, 'columns', ()):
+        if column.name == col:
+            if column.data_type == 'int':
+                return type(val) is int
+            if column.data_type == 'float':
+                return type(val) in (int, float)
+            if column.data_type == 'bool':
+                return type(val) is bool
+            return True
+    return False
+
+
+class ColumnRef:
+    # a column used as the right-hand side of a comparison, e.g. the b in "a == b"
+    def __init__(self, name: str):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnRef) and other.name == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return self.name
+
+
+# default selectivities used when a column has no statistics
+DEFAULT_EQ_SELECTIVITY = 0.1
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+DEFAULT_LIKE_SELECTIVITY = 0.1
+
+
+def _value_fraction(stats: Dict[str, ColumnStats], col: str, predicate, default: float) -> float:
+    # fraction of the rows whose value of col satisfies predicate, measured on the column sample
+    col_stats = stats.get(col)
+    if col_stats is None or not col_stats.sample:
+        return default
+    matching = 0
+    for value in col_stats.sample:
+        try:
+            if predicate(value):
+                matching += 1
+        except TypeError:
+            pass
+    return matching / len(col_stats.sample)
+
+
+class EqExpression(Expression):
+    def __init__(self, col: str, val: any):
+        self.col = col
+        self.val = val
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        col_stats = stats.get(self.col)
+        if col_stats is None:
+            return DEFAULT_EQ_SELECTIVITY
+        if isinstance(self.val, ColumnRef):
+            return 1 / max(col_stats.num_distinct, 1)
+        return col_stats.eq_selectivity(self.val)
+
+    def get_func(self, schema: Schema = None):
+        col = _column_key(schema, self.col)
+        if isinstance(self.val, ColumnRef):
+            other = _column_key(schema, self.val.name)
+            return lambda row: row[col] == row[other]
+        val = self.val
+
+        def func(row):
+            return row[col] == val
+
+        return func
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        if isinstance(self.val, ColumnRef):
+            return list(map(operator.eq, columns[self.col], columns[self.val.name]))
+        return list(map(operator.eq, columns[self.col], repeat(self.val)))
+
+    def to_where_clause(self, relation) -> tuple:
+        if not _where_value(relation, self.col, self.val):
+            return None
+        return (self.col, '=', self.val)
+
+    def __repr__(self):
+        return f'{self.col} == {self.val!r}'
+
+
+class AndExpression(Expression):
+    def __init__(self, left: Expression, right: Expression):
+        self.left = left
+        self.right = right
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        return self.left.estimate_selectivity(stats) * self.right.estimate_selectivity(stats)
+
+    def get_func(self, schema: Schema = None):
+        left_func = self.left.get_func(schema)
+        right_func = self.right.get_func(schema)
+
+        def func(row):
+            return left_func(row) and right_func(row)
+
+        return func
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        return list(map(operator.and_, self.left.get_mask(columns), self.right.get_mask(columns)))
+
+    def to_where_clause(self, relation) -> tuple:
+        left = self.left.to_where_clause(relation)
+        right = self.right.to_where_clause(relation)
+        if left is None or right is None:
+            return None
+        return (left, 'AND', right)
+
+    def __repr__(self):
+        return f'({self.left!r} and {self.right!r})'
+
+
+class OrExpression(Expression):
+    def __init__(self, left: Expression, right: Expression):
+        self.left = left
+        self.right = right
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        left = self.left.estimate_selectivity(stats)
+        right = self.right.estimate_selectivity(stats)
+        return left + right - left * right
+
+    def get_func(self, schema: Schema = None):
+        left_func = self.left.get_func(schema)
+        right_func = self.right.get_func(schema)
+        return lambda row: left_func(row) or right_func(row)
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        return list(map(operator.or_, self.left.get_mask(columns), self.right.get_mask(columns)))
+
+    def to_where_clause(self, relation) -> tuple:
+        left = self.left.to_where_clause(relation)
+        right = self.right.to_where_clause(relation)
+        if left is None or right is None:
+            return None
+        return (left, 'OR', right)
+
+    def __repr__(self):
+        return f'({self.left!r} or {self.right!r})'
+
+
+class NotExpression(Expression):
+    def __init__(self, child: Expression):
+        self.child = child
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        return 1 - self.child.estimate_selectivity(stats)
+
+    def get_func(self, schema: Schema = None):
+        child_func = self.child.get_func(schema)
+        return lambda row: not child_func(row)
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        return list(map(operator.not_, self.child.get_mask(columns)))
+
+    def to_where_clause(self, relation) -> tuple:
+        child = self.child.to_where_clause(relation)
+        if child is None:
+            return None
+        return (None, 'NOT', child)
+
+    def __repr__(self):
+        return f'not {self.child!r}'
+
+
+# comparison functions of RangeExpression
+RANGE_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class RangeExpression(Expression):
+    def __init__(self, col: str, op: str, val: any):
+        self.col = col
+        self.op = op  # one of RANGE_OPERATORS
+        self.val = val
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        col_stats = stats.get(self.col)
+        if col_stats is None or isinstance(self.val, ColumnRef):
+            return DEFAULT_RANGE_SELECTIVITY
+        if self.op in ('<', '<='):
+            return col_stats.range_selectivity(high=self.val, include_high=self.op == '<=')
+        return col_stats.range_selectivity(low=self.val, include_low=self.op == '>=')
+
+    def get_func(self, schema: Schema = None):
+        col, val = _column_key(schema, self.col), self.val
+        if isinstance(val, ColumnRef):
+            compare, other = RANGE_OPERATORS[self.op], _column_key(schema, val.name)
+            return lambda row: compare(row[col], row[other])
+        # one specialized closure per operator avoids an extra call per row
+        if self.op == '<':
+            return lambda row: row[col] < val
+        elif self.op == '<=':
+            return lambda row: row[col] <= val
+        elif self.op == '>':
+            return lambda row: row[col] > val
+        return lambda row: row[col] >= val
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        other = columns[self.val.name] if isinstance(self.val, ColumnRef) else repeat(self.val)
+        return list(map(RANGE_OPERATORS[self.op], columns[self.col], other))
+
+    def to_where_clause(self, relation) -> tuple:
+        if not _where_value(relation, self.col, self.val):
+            return None
+        return (self.col, self.op, self.val)
+
+    def __repr__(self):
+        return f'{self.col} {self.op} {self.val!r}'
+
+
+class InExpression(Expression):
+    def __init__(self, col: str, values: List[any]):
+        self.col = col
+        self.values = values
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        col_stats = stats.get(self.col)
+        if col_stats is None:
+            return min(1.0, DEFAULT_EQ_SELECTIVITY * len(self.values))
+        return min(1.0, sum(col_stats.eq_selectivity(value) for value in set(self.values)))
+
+    def get_func(self, schema: Schema = None):
+        col = _column_key(schema, self.col)
+        try:
+            values = frozenset(self.values)
+        except TypeError:
+            values = self.values
+        return lambda row: row[col] in values
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        try:
+            values = frozenset(self.values)
+        except TypeError:
+            values = self.values
+        return [value in values for value in columns[self.col]]
+
+    def __repr__(self):
+        return f'{self.col} in {list(self.values)!r}'
+
+
+class LikeExpression(Expression):
+    def __init__(self, col: str, pattern: str):
+        self.col = col
+        self.pattern = pattern  # SQL pattern: % matches any text, _ any single character
+        regex = ''.join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+        self.regex = re.compile(regex, re.DOTALL)
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        match = self.regex.fullmatch
+        return _value_fraction(stats, self.col, lambda value: match(value) is not None, DEFAULT_LIKE_SELECTIVITY)
+
+    def get_func(self, schema: Schema = None):
+        col, match = _column_key(schema, self.col), self.regex.fullmatch
+        return lambda row: isinstance(row[col], str) and match(row[col]) is not None
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        match = self.regex.fullmatch
+        return [isinstance(value, str) and match(value) is not None for value in columns[self.col]]
+
+    def __repr__(self):
+        return f'{self.col} like {self.pattern!r}'
+
+
+class ConstExpression(Expression):
+    # a condition that does not depend on the row, e.g. "True"
+    def __init__(self, value: bool):
+        self.value = bool(value)
+
+    def estimate_selectivity(self, stats: Dict[str, ColumnStats]) -> float:
+        return 1.0 if self.value else 0.0
+
+    def get_func(self, schema: Schema = None):
+        value = self.value
+        return lambda row: value
+
+    def get_mask(self, columns: ColumnarTable) -> List[bool]:
+        size = len(next(iter(columns.values()))) if columns else 0
+        return [self.value] * size
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+# tokens of the condition language: numbers, quoted strings, operators, brackets and names
+TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<op>==|!=|<>|<=|>=|<|>|=)
+      | (?P<punct>[()\[\],-])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+    )""", re.VERBOSE)
+
+KEYWORDS = ('and', 'or', 'not', 'in', 'like')
+LITERALS = {'True': True, 'False': False, 'None': None}
+# comparison operator written with the column on the right, e.g. 3 < a is a > 3
+FLIPPED_OPERATORS = {'<': '>', '<=': '>=', '>': '<', '>=': '<=', '==': '==', '!=': '!='}
+
+
+class ConditionParser:
+    # recursive descent parser turning a condition string into an Expression tree
+    # only comparisons, and/or/not, in and like are accepted, nothing is ever evaluated
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    def _tokenize(self, text: str) -> List[tuple]:
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = TOKEN_PATTERN.match(text, pos)
+            if match is None:
+                raise ValueError(f"Invalid condition {text!r} at position {pos}")
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'name' and value.lower() in KEYWORDS:
+                kind, value = 'keyword', value.lower()
+            tokens.append((kind, value))
+            pos = match.end()
+        return tokens
+
+    def parse(self) -> Expression:
+        expression = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.pos][1]!r} in condition {self.text!r}")
+        return expression
+
+    def _peek(self, kind: str = None, value: str = None) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        token_kind, token_value = self.tokens[self.pos]
+        return (kind is None or token_kind == kind) and (value is None or token_value == value)
+
+    def _next(self) -> tuple:
+        if self.pos >= len(self.tokens):
+            raise ValueError(f"Unexpected end of condition {self.text!r}")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, kind: str, value: str):
+        token = self._next()
+        if token != (kind, value):
+            raise ValueError(f"Expected {value!r} but found {token[1]!r} in condition {self.text!r}")
+
+    def _parse_or(self) -> Expression:
+        expression = self._parse_and()
+        while self._peek('keyword', 'or'):
+            self._next()
+            expression = OrExpression(expression, self._parse_and())
+        return expression
+
+    def _parse_and(self) -> Expression:
+        expression = self._parse_not()
+        while self._peek('keyword', 'and'):
+            self._next()
+            expression = AndExpression(expression, self._parse_not())
+        return expression
+
+    def _parse_not(self) -> Expression:
+        if self._peek('keyword', 'not'):
+            self._next()
+            return NotExpression(self._parse_not())
+        return self._parse_comparison()
+
+    def _parse_comparison(self) -> Expression:
+        if self._peek('punct', '('):
+            # a bracket opens either a nested condition or a value list
+            self._next()
+            expression = self._parse_or()
+            self._expect('punct', ')')
+            return expression
+        left = self._parse_operand()
+        negate = False
+        if self._peek('keyword', 'not'):
+            self._next()
+            negate = True
+            if not (self._peek('keyword', 'in') or self._peek('keyword', 'like')):
+                raise ValueError(f"Expected 'in' or 'like' after 'not' in condition {self.text!r}")
+        if self._peek('keyword', 'in'):
+            self._next()
+            expression = InExpression(self._column(left), self._parse_list())
+        elif self._peek('keyword', 'like'):
+            self._next()
+            pattern = self._parse_operand()
+            if not isinstance(pattern, str):
+                raise ValueError(f"LIKE needs a string pattern in condition {self.text!r}")
+            expression = LikeExpression(self._column(left), pattern)
+        elif self._peek('op'):
+            expression = None
+            # chained comparisons read as in Python: 1 < a < 5 is 1 < a and a < 5
+            while self._peek('op'):
+                op = self._next()[1]
+                op = {'=': '==', '<>': '!='}.get(op, op)
+                right = self._parse_operand()
+                comparison = self._comparison(left, op, right)
+                expression = comparison if expression is None else AndExpression(expression, comparison)
+                left = right
+        elif isinstance(left, ColumnRef):
+            raise ValueError(f"Column {left.name} is not compared with anything in condition {self.text!r}")
+        else:
+            expression = ConstExpression(left)
+        return NotExpression(expression) if negate else expression
+
+    def _comparison(self, left: any, op: str, right: any) -> Expression:
+        if not isinstance(left, ColumnRef):
+            if not isinstance(right, ColumnRef):
+                # nothing depends on the row, fold the comparison now
+                compare = {'==': operator.eq, '!=': operator.ne, **RANGE_OPERATORS}[op]
+                return ConstExpression(compare(left, right))
+            left, op, right = right, FLIPPED_OPERATORS[op], left
+        if op == '==':
+            return EqExpression(left.name, right)
+        if op == '!=':
+            return NotExpression(EqExpression(left.name, right))
+        return RangeExpression(left.name, op, right)
+
+    def _column(self, operand: any) -> str:
+        if not isinstance(operand, ColumnRef):
+            raise ValueError(f"Expected a column name but found {operand!r} in condition {self.text!r}")
+        return operand.name
+
+    def _parse_list(self) -> List[any]:
+        kind, opening = self._next()
+        if (kind, opening) not in (('punct', '('), ('punct', '[')):
+            raise ValueError(f"Expected a list of values after 'in' in condition {self.text!r}")
+        closing = ')' if opening == '(' else ']'
+        values = []
+        while not self._peek('punct', closing):
+            value = self._parse_operand()
+            if isinstance(value, ColumnRef):
+                raise ValueError(f"Only literal values are allowed in an 'in' list in condition {self.text!r}")
+            values.append(value)
+            if not self._peek('punct', ','):
+                break
+            self._next()
+        self._expect('punct', closing)
+        return values
+
+    def _parse_operand(self) -> any:
+        kind, value = self._next()
+        if kind == 'punct' and value == '-':
+            operand = self._parse_operand()
+            if isinstance(operand, (int, float)) and not isinstance(operand, bool):
+                return -operand
+            raise ValueError(f"Unexpected '-' in condition {self.text!r}")
+        if kind == 'number':
+            return float(value) if any(c in value for c in '.eE') else int(value)
+        if kind == 'string':
+            return ast.literal_eval(value)
+        if kind == 'name':
+            if value in LITERALS:
+                return LITERALS[value]
+            return ColumnRef(value)
+        raise ValueError(f"Unexpected {value!r} in condition {self.text!r}")
+
+
+# number of distinct condition strings whose parsed and compiled forms are kept
+CONDITION_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=CONDITION_CACHE_SIZE)
+def parse_condition(condition: str) -> Expression:
+    # parse a condition string into an Expression tree, repeated conditions come from the cache
+    return ConditionParser(condition).parse()
+
+
+@functools.lru_cache(maxsize=CONDITION_CACHE_SIZE)
+def compile_condition(condition: str):
+    # compile a condition string into a row function, repeated conditions skip parsing entirely
+    return parse_condition(condition).get_func()
+
+
+
+def choose_best_plan(plans: List[QueryPlan], stats: Dict[str, ColumnStats]) -> QueryPlan:
+    best_plan = None
+    min_cost = math.inf
+    for plan in plans:
+        cost = plan.estimate_cost(stats)
+        if cost < min_cost:
+            min_cost = cost
+            best_plan = plan
+
+    return best_plan
+
+
+
+# Implement a simple query evaluator that uses per column statistics to evaluate the cost of each query plan
+
+#4
+
+from typing import List
+from database import MiniDB, Table
+
+import copy
+import itertools
+from typing import Dict, List
+
+# number of joined relations above which join orders are chosen greedily instead of
+# by dynamic programming over every subset of relations
+DEFAULT_DP_LIMIT = 10
+
+
+class JoinCandidate:
+    # best plan found for one set of relations (a bitmask of leaf positions)
+    def __init__(self, mask: int, node: Node, rows: float, cost: float):
+        self.mask = mask
+        self.node = node
+        self.rows = rows
+        self.cost = cost
+
+
+class QueryOptimizer:
+    def __init__(self, stats: Dict[str, ColumnStats], dp_limit: int = DEFAULT_DP_LIMIT, bushy: bool = True):
+        self.stats = stats
+        self.dp_limit = dp_limit
+        self.bushy = bushy  # consider bushy join trees, otherwise only left-deep ones
+
+    def optimize(self, root: Node) -> QueryPlan:
+        # reorder the joins below root, keeping the selections, projections, limits,
+        # aggregates and sorts above them
+        wrappers = []
+        node = root
+        while not isinstance(node, JoinNode) and hasattr(node, 'child'):
+            wrappers.append(node)
+            node = node.child
+        best = None
+        if isinstance(node, JoinNode):
+            best = self._best_join_tree(node)
+        if best is None:
+            plan = QueryPlan(root)
+            plan.estimate_cost(self.stats)
+            return plan
+        node = best.node
+        for wrapper in reversed(wrappers):
+            node = _with_child(wrapper, node)
+        plan = QueryPlan(node)
+        plan.estimate_cost(self.stats)
+        return plan
+
+    def _best_join_tree(self, join: JoinNode):
+        # the leaves are the maximal subtrees without joins, the predicates are the join
+        # columns of the original tree: (column, leaves on one side, leaves on the other side)
+        self.leaves = []
+        self.predicates = []
+        if self._collect(join) is None:
+            return None
+        self.leaf_rows = [leaf.estimate_rows(self.stats) for leaf in self.leaves]
+        self.leaf_distinct = [self._leaf_distinct(i) for i in range(len(self.leaves))]
+        candidates = [JoinCandidate(1 << i, leaf, rows, leaf.estimate_cost(self.stats))
+                      for i, (leaf, rows) in enumerate(zip(self.leaves, self.leaf_rows))]
+        if len(self.leaves) <= self.dp_limit:
+            return self._dynamic_programming(candidates)
+        return self._greedy(candidates)
+
+    def _collect(self, node: Node):
+        # returns the positions of the leaves below node, or None when a join cannot be reordered
+        if not isinstance(node, JoinNode):
+            self.leaves.append(node)
+            return [len(self.leaves) - 1]
+        left = self._collect(node.left_child)
+        right = self._collect(node.right_child) if left is not None else None
+        if right is None:
+            return None
+        join_cols = node.join_cols
+        if join_cols is None:
+            # natural join: the columns both sides share according to the statistics
+            left_cols = set().union(*(self._leaf_columns(i) for i in left))
+            right_cols = set().union(*(self._leaf_columns(i) for i in right))
+            join_cols = sorted(left_cols & right_cols)
+            if not join_cols:
+                return None
+        for join_col in join_cols:
+            left_mask = self._mask([i for i in left if join_col in self._leaf_columns(i)] or left)
+            right_mask = self._mask([i for i in right if join_col in self._leaf_columns(i)] or right)
+            self.predicates.append((join_col, left_mask, right_mask))
+        return left + right
+
+    def _leaf_columns(self, i: int) -> set:
+        # columns of the relations scanned by a leaf, from the "table.column" statistics
+        columns = set()
+        for relation_name in _scanned_relations(self.leaves[i]):
+            prefix = relation_name + '.'
+            columns.update(key[len(prefix):] for key in self.stats if key.startswith(prefix))
+        return columns
+
+    def _leaf_distinct(self, i: int) -> Dict[str, float]:
+        # distinct values of the join columns of a leaf, counted once since HyperLogLog
+        # estimates are not free
+        distinct = {}
+        join_cols = {join_col for join_col, a, b in self.predicates if (a | b) & (1 << i)}
+        for relation_name in _scanned_relations(self.leaves[i]):
+            for join_col in join_cols:
+                col_stats = self.stats.get(f'{relation_name}.{join_col}')
+                if col_stats is not None:
+                    distinct[join_col] = min(distinct.get(join_col, self.leaf_rows[i]), col_stats.num_distinct)
+        return distinct
+
+    def _mask(self, positions: List[int]) -> int:
+        mask = 0
+        for i in positions:
+            mask |= 1 << i
+        return mask
+
+    def _join_columns(self, left_mask: int, right_mask: int) -> List[str]:
+        # columns of the predicates connecting the two sets of leaves
+        join_cols = set()
+        for join_col, a, b in self.predicates:
+            if (a & left_mask and b & right_mask) or (a & right_mask and b & left_mask):
+                join_cols.add(join_col)
+        return sorted(join_cols)
+
+    def _distinct_values(self, mask: int, join_col: str, rows: float) -> float:
+        # distinct values of a column in the join of a set of leaves: the smallest among its
+        # relations, and never more than the number of rows
+        distinct = rows
+        for i, leaf_distinct in enumerate(self.leaf_distinct):
+            if mask & (1 << i) and join_col in leaf_distinct:
+                distinct = min(distinct, leaf_distinct[join_col])
+        return max(distinct, 1)
+
+    def _join(self, left: JoinCandidate, right: JoinCandidate, join_cols: List[str]) -> JoinCandidate:
+        node = JoinNode(left.node, right.node, join_cols=join_cols)
+        selectivity = 1.0
+        for join_col in join_cols:
+            selectivity /= max(self._distinct_values(left.mask, join_col, left.rows),
+                               self._distinct_values(right.mask, join_col, right.rows))
+        node.join_selectivity = selectivity
+        join_cost = node.choose_method(left.rows, right.rows)
+        return JoinCandidate(left.mask | right.mask, node, left.rows * right.rows * selectivity,
+                             left.cost + right.cost + join_cost)
+
+    def _dynamic_programming(self, candidates: List[JoinCandidate]) -> JoinCandidate:
+        # Selinger-style: the best plan of every set of relations is built from the best
+        # plans of its subsets, smallest sets first; cross products are only considered
+        # when the predicates do not connect all the relations
+        n = len(candidates)
+        for cross_products in (False, True):
+            best = {candidate.mask: candidate for candidate in candidates}
+            for size in range(2, n + 1):
+                for positions in itertools.combinations(range(n), size):
+                    mask = self._mask(positions)
+                    best_plan = self._best_split(mask, best, cross_products)
+                    if best_plan is not None:
+                        best[mask] = best_plan
+            if (1 << n) - 1 in best:
+                return best[(1 << n) - 1]
+
+    def _best_split(self, mask: int, best: Dict[int, JoinCandidate], cross_products: bool):
+        best_plan = None
+        left_mask = (mask - 1) & mask
+        while left_mask:
+            right_mask = mask ^ left_mask
+            left, right = best.get(left_mask), best.get(right_mask)
+            is_left_deep = right_mask & (right_mask - 1) == 0
+            if left is not None and right is not None and (self.bushy or is_left_deep):
+                join_cols = self._join_columns(left_mask, right_mask)
+                if join_cols or cross_products:
+                    plan = self._join(left, right, join_cols)
+                    if best_plan is None or plan.cost < best_plan.cost:
+                        best_plan = plan
+            left_mask = (left_mask - 1) & mask
+        return best_plan
+
+    def _greedy(self, candidates: List[JoinCandidate]) -> JoinCandidate:
+        # repeatedly join the two connected plans giving the smallest result
+        plans = list(candidates)
+        while len(plans) > 1:
+            best_pair = None
+            for cross_products in (False, True):
+                for i, left in enumerate(plans):
+                    for j, right in enumerate(plans):
+                        if i == j or (not self.bushy and right.mask & (right.mask - 1)):
+                            continue
+                        join_cols = self._join_columns(left.mask, right.mask)
+                        if not join_cols and not cross_products:
+                            continue
+                        plan = self._join(left, right, join_cols)
+                        if best_pair is None or (plan.rows, plan.cost) < (best_pair[0].rows, best_pair[0].cost):
+                            best_pair = (plan, i, j)
+                if best_pair is not None:
+                    break
+            plan, i, j = best_pair
+            plans = [p for k, p in enumerate(plans) if k not in (i, j)] + [plan]
+        return plans[0]
+
+
+def _scanned_relations(node: Node) -> List[str]:
+    # names of the relations read by the ScanNodes of a subtree
+    if isinstance(node, ScanNode):
+        return [node.relation_name]
+    relations = []
+    for attr in ('child', 'left_child', 'right_child'):
+        child = getattr(node, attr, None)
+        if child is not None:
+            relations.extend(_scanned_relations(child))
+    return relations
+
+
+def _with_child(node: Node, child: Node) -> Node:
+    # copy of a single-child plan node placed on top of another child
+    if isinstance(node, SelectNode):
+        return SelectNode(node.condition, child)
+    if isinstance(node, ProjectNode):
+        return ProjectNode(child, node.cols)
+    if isinstance(node, LimitNode):
+        return LimitNode(child, node.limit, node.offset)
+    if isinstance(node, AggregateNode):
+        return AggregateNode(child, node.group_by, node.aggregates, node.mode)
+    if isinstance(node, SortNode):
+        return SortNode(child, node.order_by, node.limit, node.max_bytes, node.temp_dir)
+    node = copy.copy(node)
+    node.child = child
+    node.relation_name = child.relation_name
+    return node
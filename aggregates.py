@@ -0,0 +1,168 @@
+import operator
+import re
+
+# aggregate functions of GROUP BY queries, shared by AggregateNode of the 3rd issue and by
+# the worker processes of parallel scans (see parallel.py); every function folds rows into a
+# partial state, partial states of different partitions combine into one, and the final
+# value is computed from the combined state at the end
+
+AGGREGATE_PATTERN = re.compile(r'''
+    \s*(?P<func>count|sum|avg|min|max)\s*
+    \(\s*(?P<column>\*|[A-Za-z_][A-Za-z0-9_.]*)\s*\)
+    (?:\s+as\s+(?P<name>[A-Za-z_][A-Za-z0-9_]*))?\s*$
+''', re.IGNORECASE | re.VERBOSE)
+
+
+def _count_all(state, value):
+    return state + 1
+
+
+def _count(state, value):
+    return state if value is None else state + 1
+
+
+def _add(state, value):
+    return state + value
+
+
+def _sum(state, value):
+    if value is None:
+        return state
+    return value if state is None else state + value
+
+
+def _min(state, value):
+    if value is None:
+        return state
+    return value if state is None or value < state else state
+
+
+def _max(state, value):
+    if value is None:
+        return state
+    return value if state is None or value > state else state
+
+
+def _avg(state, value):
+    # state is [sum, count] of the values that are not None
+    if value is not None:
+        state[0] += value
+        state[1] += 1
+    return state
+
+
+def _avg_combine(state, other):
+    state[0] += other[0]
+    state[1] += other[1]
+    return state
+
+
+def _avg_final(state):
+    return state[0] / state[1] if state[1] else None
+
+
+def _zero():
+    return 0
+
+
+def _none():
+    return None
+
+
+def _zero_pair():
+    return [0, 0]
+
+
+def _identity(state):
+    return state
+
+
+# func -> (new state, step with one value, combine two states, final value)
+FUNCTIONS = {
+    'count': (_zero, _count, _add, _identity),
+    'sum': (_none, _sum, _sum, _identity),
+    'min': (_none, _min, _min, _identity),
+    'max': (_none, _max, _max, _identity),
+    'avg': (_zero_pair, _avg, _avg_combine, _avg_final),
+}
+
+
+class Aggregate:
+    # one aggregate of a GROUP BY, parsed from text such as "COUNT(*)", "sum(l_quantity)" or
+    # "avg(l_discount) as discount"; the output column is named by the alias or by the
+    # normalized text
+    def __init__(self, text):
+        match = AGGREGATE_PATTERN.match(text)
+        if match is None:
+            raise ValueError(f"Invalid aggregate {text!r}, expected count, sum, avg, min or max of a column")
+        self.func = match.group('func').lower()
+        column = match.group('column')
+        if column == '*' and self.func != 'count':
+            raise ValueError(f"Only count takes * in aggregate {text!r}")
+        self.column = None if column == '*' else column  # None counts every row
+        self.name = match.group('name') or f'{self.func}({column})'
+        self.new, self.step, self.combine, self.final = FUNCTIONS[self.func]
+        if self.column is None:
+            self.step = _count_all
+
+    def __repr__(self):
+        text = f"{self.func}({self.column or '*'})"
+        return text if self.name == text else f'{text} as {self.name}'
+
+
+def key_getter(ordinals):
+    # group key of a tuple row: () without group columns, the value itself for one column
+    # and a tuple of the values for several
+    if not ordinals:
+        return lambda row: ()
+    return operator.itemgetter(*ordinals)
+
+
+def aggregate_rows(rows, key, aggregates, ordinals, groups=None):
+    # fold tuple rows into groups: group key -> list of the partial states of the aggregates,
+    # ordinals give the position of the column each aggregate reads, None for count(*)
+    if groups is None:
+        groups = {}
+    steps = list(enumerate(zip([aggregate.step for aggregate in aggregates], ordinals)))
+    for row in rows:
+        group_key = key(row)
+        states = groups.get(group_key)
+        if states is None:
+            states = groups[group_key] = [aggregate.new() for aggregate in aggregates]
+        for i, (step, ordinal) in steps:
+            states[i] = step(states[i], None if ordinal is None else row[ordinal])
+    return groups
+
+
+def sorted_aggregate(rows, key, aggregates, ordinals):
+    # rows ordered by their group key: yield (group key, states) as soon as the key changes,
+    # holding one group at a time
+    steps = list(enumerate(zip([aggregate.step for aggregate in aggregates], ordinals)))
+    current = states = None
+    for row in rows:
+        group_key = key(row)
+        if states is None or group_key != current:
+            if states is not None:
+                yield current, states
+            current = group_key
+            states = [aggregate.new() for aggregate in aggregates]
+        for i, (step, ordinal) in steps:
+            states[i] = step(states[i], None if ordinal is None else row[ordinal])
+    if states is not None:
+        yield current, states
+
+
+def combine_groups(groups, partial, aggregates):
+    # add the partial groups of another partition of the input to groups
+    combines = [aggregate.combine for aggregate in aggregates]
+    for group_key, states in partial.items():
+        own = groups.get(group_key)
+        if own is None:
+            groups[group_key] = states
+        else:
+            groups[group_key] = [combine(a, b) for combine, a, b in zip(combines, own, states)]
+    return groups
+
+
+def final_values(states, aggregates):
+    return tuple(aggregate.final(state) for aggregate, state in zip(aggregates, states))
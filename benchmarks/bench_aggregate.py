@@ -0,0 +1,78 @@
+# GROUP BY over the lineitem table of the TPC-H-like data: aggregating the dict rows of
+# execute_select by hand against AggregateNode with hash aggregation, sorted aggregation over
+# rows ordered on the group column and per-partition aggregation in worker processes; and
+# COUNT(*)/MIN/MAX answered from the statistics and a BTreeIndex against a full scan.
+#
+#   python -m benchmarks.bench_aggregate [scale_factor] [workers]
+
+import sys
+
+from benchmarks import datagen
+from benchmarks.common import best_of, load_query_engine
+from parallel import shutdown
+
+engine = load_query_engine()
+minidb = sys.modules['database']
+
+AGGREGATES = ['count(*)', 'sum(l_quantity)', 'avg(l_extendedprice)', 'avg(l_discount)', 'max(l_shipdate)']
+
+
+def by_hand(db, group_by):
+    # what a report had to do without an aggregate operator
+    groups = {}
+    for row in db.execute_select('lineitem'):
+        key = tuple(row[column] for column in group_by)
+        state = groups.get(key)
+        if state is None:
+            state = groups[key] = [0, 0, 0.0, 0.0, None]
+        state[0] += 1
+        state[1] += row['l_quantity']
+        state[2] += row['l_extendedprice']
+        state[3] += row['l_discount']
+        state[4] = row['l_shipdate'] if state[4] is None else max(state[4], row['l_shipdate'])
+    return [key + (s[0], s[1], s[2] / s[0], s[3] / s[0], s[4]) for key, s in groups.items()]
+
+
+def run(node, tables):
+    return engine.QueryPlan(node).execute(tables)
+
+
+def main(scale_factor=0.05, workers=2):
+    data = datagen.generate(scale_factor)
+    db = datagen.load_tables(minidb, {'lineitem': data['lineitem']}, 'columnar')
+    ordered = {'lineitem': sorted(data['lineitem'], key=lambda row: row['l_returnflag'])}
+    table = db.tables['lineitem']
+    print(f"{len(table.rows):,} lineitem rows, seconds per query")
+
+    for group_by in (['l_returnflag'], ['l_returnflag', 'l_linenumber']):
+        print(f"group by {', '.join(group_by)}")
+        print(f"  {'execute_select + dict':<24} {best_of(lambda: by_hand(db, group_by)):>8.3f}")
+        node = engine.AggregateNode(engine.ScanNode('lineitem'), group_by, AGGREGATES, 'hash')
+        print(f"  {'AggregateNode hash':<24} {best_of(lambda: run(node, db.tables)):>8.3f}")
+        if len(group_by) == 1:
+            node = engine.AggregateNode(engine.ScanNode('lineitem'), group_by, AGGREGATES, 'sorted')
+            print(f"  {'AggregateNode sorted':<24} {best_of(lambda: run(node, ordered)):>8.3f}  (list of dicts ordered on the group)")
+
+    table.partition(num_partitions=4 * workers, workers=workers)
+    node = engine.AggregateNode(engine.ScanNode('lineitem'), ['l_returnflag'], AGGREGATES)
+    run(node, db.tables)  # start the worker processes
+    print("group by l_returnflag, partitioned")
+    print(f"  {'AggregateNode hash':<24} {best_of(lambda: run(node, db.tables)):>8.3f}  ({workers} workers)")
+    table.partition_rows = None
+    shutdown()
+
+    # COUNT(*), MIN and MAX without reading the rows
+    table.get_column('l_id').index = 'BTree'
+    db.create_index('lineitem', 'l_id')
+    table.analyze()
+    simple = ['count(*)', 'min(l_id)', 'max(l_id)', 'max(l_shipdate)']
+    metadata = engine.AggregateNode(engine.ScanNode('lineitem'), [], simple)
+    scan = engine.AggregateNode(engine.SelectNode(engine.parse_condition('True'), engine.ScanNode('lineitem')), [], simple)
+    assert run(metadata, db.tables) == run(scan, db.tables)
+    print("count(*), min, max")
+    print(f"  {'full scan':<24} {best_of(lambda: run(scan, db.tables)):>8.3f}")
+    print(f"  {'stats and BTreeIndex':<24} {best_of(lambda: run(metadata, db.tables)):>8.6f}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.05, int(sys.argv[2]) if len(sys.argv) > 2 else 2)
@@ -0,0 +1,61 @@
+# Insert, bulk load, point lookup and range scan throughput of the B+-tree
+# behind BTreeIndex.
+#
+#   python -m benchmarks.bench_btree [num_keys] [order]
+
+import random
+import sys
+import time
+
+from benchmarks.common import load_issue
+
+second_issue = load_issue('2nd issue.py')
+
+
+def timed(label, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:>8.2f}s {count / elapsed:>14,.0f} ops/s")
+    return result
+
+
+def main(num_keys=1000000, order=64, seed=0):
+    rng = random.Random(seed)
+    keys = list(range(num_keys))
+    rng.shuffle(keys)
+    probes = [rng.randrange(num_keys) for _ in range(100000)]
+    ranges = [(low, low + 100) for low in (rng.randrange(num_keys) for _ in range(10000))]
+
+    print(f"{num_keys:,} keys, order {order}")
+    tree = second_issue.BTree(order)
+
+    def insert_all():
+        for key in keys:
+            tree.insert(key, key)
+    timed('random insert', num_keys, insert_all)
+
+    bulk_tree = second_issue.BTree(order)
+    timed('sort + bulk load', num_keys, lambda: bulk_tree.bulk_load((key, key) for key in sorted(keys)))
+
+    def lookup_all():
+        for key in probes:
+            assert tree.search(key) == [key]
+    timed('point lookup', len(probes), lookup_all)
+
+    def scan_all():
+        for low, high in ranges:
+            tree.range_search(low, high)
+    timed('range scan (100 keys)', len(ranges), scan_all)
+
+    timed('full ordered scan', num_keys, lambda: sum(1 for _ in bulk_tree.items()))
+
+    def delete_half():
+        for key in keys[:num_keys // 2]:
+            tree.delete(key)
+    timed('delete', num_keys // 2, delete_half)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 64)
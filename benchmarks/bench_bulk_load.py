@@ -0,0 +1,92 @@
+# Rows per second loading a CSV file one insert at a time, with every index maintained
+# per row, against MiniDB.load_csv with its deferred sorted index build.
+#
+#   python -m benchmarks.bench_bulk_load [num_rows]
+
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.common import load_minidb
+
+minidb = load_minidb()
+
+
+def make_columns():
+    return [
+        minidb.Column('id', 'int', unique=True, primary_key=True),
+        minidb.Column('email', 'str', unique=True, index='Hash'),
+        minidb.Column('amount', 'float'),
+        minidb.Column('active', 'bool'),
+    ]
+
+
+def write_csv(path, num_rows, seed=0):
+    rng = random.Random(seed)
+    ids = list(range(num_rows))
+    rng.shuffle(ids)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['id', 'email', 'amount', 'active'])
+        for i in ids:
+            writer.writerow([i, f'user{i}@example.com', f'{rng.random() * 1000:.2f}', rng.choice(('true', 'false'))])
+
+
+def make_db(storage, directory):
+    # paged tables live in a new database file with a write-ahead log
+    path = None
+    if storage == 'paged':
+        path = tempfile.mktemp(dir=directory)
+    db = minidb.MiniDB(path)
+    db.create_table('users', make_columns(), storage)
+    db.create_index('users', 'id')
+    db.create_index('users', 'email')
+    return db
+
+
+def load_row_by_row(path, storage):
+    db = make_db(storage, os.path.dirname(path))
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        for record in reader:
+            db.tables['users'].insert({
+                'id': int(record['id']),
+                'email': record['email'],
+                'amount': float(record['amount']),
+                'active': record['active'] == 'true',
+            })
+    return db
+
+
+def load_bulk(path, storage):
+    db = make_db(storage, os.path.dirname(path))
+    db.load_csv('users', path)
+    return db
+
+
+def main(num_rows=200000):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'users.csv')
+    write_csv(path, num_rows)
+    print(f"{'storage':>9} {'row by row rows/s':>18} {'load_csv rows/s':>16} {'speedup':>8}")
+    for storage in ('row', 'columnar', 'paged'):
+        # a load ends once it is durable, a checkpoint for paged tables
+        start = time.perf_counter()
+        db = load_row_by_row(path, storage)
+        db.close()
+        row_by_row = time.perf_counter() - start
+        start = time.perf_counter()
+        db = load_bulk(path, storage)
+        bulk = time.perf_counter() - start
+        assert len(db.tables['users'].rows) == num_rows
+        db.close()
+        print(f"{storage:>9} {num_rows / row_by_row:>18,.0f} {num_rows / bulk:>16,.0f} {row_by_row / bulk:>7.1f}x")
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
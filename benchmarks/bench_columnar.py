@@ -0,0 +1,50 @@
+# Memory and filter throughput of row tables against columnar tables.
+#
+#   python -m benchmarks.bench_columnar [num_rows]
+
+import random
+import sys
+import tracemalloc
+
+from benchmarks.common import best_of, load_minidb
+
+minidb = load_minidb()
+
+WHERE_CLAUSES = {
+    'range': ('price', '<', '250.0'),
+    'between': ('qty', 'BETWEEN', ('10', '20')),
+    'and/or': (('qty', '>', '50'), 'AND', (('price', '<', '100.0'), 'OR', ('id', '>=', '90000'))),
+}
+
+
+def make_table(storage, num_rows, seed=0):
+    rng = random.Random(seed)
+    columns = [minidb.Column('id', 'int'), minidb.Column('qty', 'int'),
+               minidb.Column('price', 'float'), minidb.Column('active', 'bool')]
+    tracemalloc.start()
+    table = minidb.Table('bench', columns, storage)
+    for i in range(num_rows):
+        table.rows.append({'id': i, 'qty': rng.randrange(100), 'price': rng.random() * 1000, 'active': rng.random() < 0.5})
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return table, memory
+
+
+def main(num_rows=200000):
+    row_table, row_memory = make_table('row', num_rows)
+    columnar_table, columnar_memory = make_table('columnar', num_rows)
+    print(f"memory: row {row_memory / num_rows:.0f} bytes/row, columnar {columnar_memory / num_rows:.0f} bytes/row"
+          f" ({row_memory / columnar_memory:.1f}x less)")
+    print("rows/s of the row filter, the columnar mask alone and columnar select_rows (mask + building the selected rows)")
+    print(f"{'clause':<10} {'row':>14} {'columnar mask':>16} {'speedup':>8} {'columnar select':>16}")
+    for name, where_clause in WHERE_CLAUSES.items():
+        assert row_table.select_rows(where_clause) == columnar_table.select_rows(where_clause)
+        row_time = best_of(lambda: row_table.select_rows(where_clause))
+        mask_time = best_of(lambda: minidb.compute_where_mask(columnar_table, where_clause))
+        select_time = best_of(lambda: columnar_table.select_rows(where_clause))
+        print(f"{name:<10} {num_rows / row_time:>14,.0f} {num_rows / mask_time:>16,.0f} {row_time / mask_time:>7.1f}x"
+              f" {num_rows / select_time:>16,.0f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
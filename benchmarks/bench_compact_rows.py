@@ -0,0 +1,67 @@
+# Time and peak memory of a select + hash join + project plan handing out dict rows
+# (execute) against compact tuple rows (iter_tuples), over plain lists of dicts and over
+# row and columnar MiniDB tables.
+#
+#   python -m benchmarks.bench_compact_rows [num_rows]
+
+import random
+import sys
+import tracemalloc
+
+from benchmarks.common import best_of, load_query_engine
+
+engine = load_query_engine()
+minidb = sys.modules['database']
+
+ORDER_COLUMNS = [('order_id', 'int'), ('cust_id', 'int'), ('amount', 'float'), ('status', 'str'), ('note', 'str')]
+CUSTOMER_COLUMNS = [('cust_id', 'int'), ('region', 'int'), ('name', 'str')]
+
+
+def make_rows(num_rows, seed=0):
+    rng = random.Random(seed)
+    orders = [{'order_id': i, 'cust_id': rng.randrange(10000), 'amount': rng.random() * 100,
+               'status': rng.choice(('open', 'paid')), 'note': ''} for i in range(num_rows)]
+    customers = [{'cust_id': i, 'region': rng.randrange(5), 'name': f'c{i}'} for i in range(10000)]
+    return orders, customers
+
+
+def make_db(storage, orders, customers):
+    if storage == 'list':
+        return {'orders': orders, 'customers': customers}
+    db = minidb.MiniDB()
+    for name, columns, rows in (('orders', ORDER_COLUMNS, orders), ('customers', CUSTOMER_COLUMNS, customers)):
+        db.create_table(name, [minidb.Column(*column) for column in columns], storage)
+        db.tables[name].insert_many(rows)
+    return db.tables
+
+
+def make_plan():
+    select = engine.SelectNode(engine.parse_condition('amount > 20'), engine.ScanNode('orders'))
+    join = engine.JoinNode(select, engine.ScanNode('customers'), join_cols=['cust_id'], method='hash')
+    return engine.QueryPlan(engine.ProjectNode(join, ['order_id', 'amount', 'region']))
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(num_rows=200000):
+    orders, customers = make_rows(num_rows)
+    plan = make_plan()
+    print(f"{'source':>9} {'dict rows ms':>13} {'tuple rows ms':>14} {'speedup':>8} {'dict peak MB':>13} {'tuple peak MB':>14}")
+    for storage in ('list', 'row', 'columnar'):
+        db = make_db(storage, orders, customers)
+        as_dicts = lambda: plan.execute(db)
+        as_tuples = lambda: list(plan.iter_tuples(db)[1])
+        dict_time, tuple_time = best_of(as_dicts), best_of(as_tuples)
+        dict_peak, tuple_peak = peak_memory(as_dicts), peak_memory(as_tuples)
+        print(f"{storage:>9} {dict_time * 1e3:>13.0f} {tuple_time * 1e3:>14.0f} {dict_time / tuple_time:>7.1f}x"
+              f" {dict_peak / 2**20:>13.1f} {tuple_peak / 2**20:>14.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,37 @@
+# Overhead of the always-on plan counters on QueryPlan.execute, and of EXPLAIN ANALYZE
+# with per-operator timing, with and without memory tracing, on a select + hash join +
+# project plan over a row table.
+#
+#   python -m benchmarks.bench_explain [num_rows]
+
+import sys
+
+from benchmarks.bench_compact_rows import make_db, make_plan, make_rows
+from benchmarks.common import best_of, load_query_engine
+
+engine = load_query_engine()
+
+
+def main(num_rows=200000):
+    orders, customers = make_rows(num_rows)
+    db = make_db('row', orders, customers)
+    plan = make_plan()
+
+    engine.PLAN_COUNTERS.enabled = False
+    baseline = best_of(lambda: plan.execute(db))
+    engine.PLAN_COUNTERS.enabled = True
+    timings = {
+        'execute, counters off': baseline,
+        'execute, counters on': best_of(lambda: plan.execute(db)),
+        'explain_analyze': best_of(lambda: plan.explain_analyze(db)),
+        'explain_analyze memory': best_of(lambda: plan.explain_analyze(db, memory=True), repeat=1),
+    }
+    print(f"{'mode':<24} {'ms':>9} {'overhead':>9}")
+    for mode, seconds in timings.items():
+        print(f"{mode:<24} {seconds * 1e3:>9.0f} {seconds / baseline - 1:>+9.0%}")
+    print()
+    print(plan.explain_analyze(db))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
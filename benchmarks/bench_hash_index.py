@@ -0,0 +1,44 @@
+# Lookup latency and memory per indexed row of HashIndex as the table grows.
+#
+#   python -m benchmarks.bench_hash_index
+
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import load_issue
+
+second_issue = load_issue('2nd issue.py')
+
+
+def build_index(num_rows, duplicates):
+    column = second_issue.Column('key', 'str', unique=not duplicates, index='Hash')
+    table = second_issue.Table('bench', [column])
+    table.rows = [{'key': f'k{i // duplicates}'} for i in range(num_rows)]
+    tracemalloc.start()
+    index = second_issue.HashIndex(table, column)
+    index.build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return index, memory
+
+
+def main(sizes=(10000, 100000, 1000000), duplicates=1, seed=0):
+    rng = random.Random(seed)
+    print(f"{'rows':>10} {'bytes/row':>10} {'lookup ns':>10} {'lookup_many ns/key':>19}")
+    for num_rows in sizes:
+        index, memory = build_index(num_rows, duplicates)
+        probes = [f'k{rng.randrange(num_rows // duplicates)}' for _ in range(100000)]
+        start = time.perf_counter()
+        for value in probes:
+            index.lookup(value)
+        lookup = (time.perf_counter() - start) / len(probes)
+        start = time.perf_counter()
+        index.lookup_many(probes)
+        lookup_many = (time.perf_counter() - start) / len(probes)
+        print(f"{num_rows:>10,} {memory / num_rows:>10.1f} {lookup * 1e9:>10.0f} {lookup_many * 1e9:>19.0f}")
+
+
+if __name__ == '__main__':
+    main(duplicates=int(sys.argv[1]) if len(sys.argv) > 1 else 1)
@@ -0,0 +1,88 @@
+# Read throughput next to a writer: reader threads run selects while one thread bulk loads
+# small batches of rows, each holding the write lock while the indexes are rebuilt. The
+# readers either take the same lock for every select (one global lock) or read from MVCC
+# snapshots that never wait for the writer.
+#
+#   python -m benchmarks.bench_mvcc [num_rows] [seconds]
+
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import load_minidb
+
+minidb = load_minidb()
+
+QUERIES = [
+    ('id', 'BETWEEN', (1000, 1100)),
+    ('id', '=', 4242),
+    (('region', '=', 3), 'AND', ('id', '<', 2000)),
+]
+BATCH_ROWS = 100
+
+
+def make_db(num_rows, storage, seed=0):
+    rng = random.Random(seed)
+    db = minidb.MiniDB(cache_bytes=0)
+    db.create_table('sales', [
+        minidb.Column('id', 'int', unique=True, primary_key=True, index='BTree'),
+        minidb.Column('region', 'int'),
+        minidb.Column('amount', 'float'),
+    ], storage)
+    db.insert_many('sales', [{'id': i, 'region': rng.randrange(10), 'amount': rng.random() * 1000}
+                             for i in range(num_rows)])
+    db.create_index('sales', 'id')
+    return db
+
+
+def run(db, mode, readers, seconds):
+    # returns (selects per second, inserts per second) over the run
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+
+    def read(slot):
+        while not stop.is_set():
+            for where_clause in QUERIES:
+                if mode == 'lock':
+                    with db.lock:
+                        db.execute_select('sales', where_clause)
+                else:
+                    with db.snapshot() as snapshot:
+                        db.execute_select('sales', where_clause, snapshot)
+                reads[slot] += 1
+
+    def write():
+        next_id = len(db.tables['sales'].rows)
+        while not stop.is_set():
+            batch = [{'id': next_id + i, 'region': i % 10, 'amount': 1.0} for i in range(BATCH_ROWS)]
+            db.insert_many('sales', batch)
+            next_id += BATCH_ROWS
+            writes[0] += BATCH_ROWS
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=read, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=write))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(reads) / elapsed, writes[0] / elapsed
+
+
+def main(num_rows=100000, seconds=3.0):
+    print(f"{'storage':>9} {'mode':>9} {'readers':>8} {'selects/s':>10} {'inserts/s':>10}")
+    for storage in ('row', 'columnar'):
+        for readers in (1, 4):
+            for mode in ('lock', 'snapshot'):
+                selects, inserts = run(make_db(num_rows, storage), mode, readers, seconds)
+                print(f"{storage:>9} {mode:>9} {readers:>8} {selects:>10,.0f} {inserts:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, float(sys.argv[2]) if len(sys.argv) > 2 else 3.0)
@@ -0,0 +1,63 @@
+# Paged tables: load rate, time to reopen the database file, index lookups and full scans
+# through a buffer pool much smaller than the table.
+#
+#   python -m benchmarks.bench_paged [rows]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import load_minidb
+
+minidb = load_minidb()
+
+POOL_PAGES = 256  # 1 MB of 4 KB pages
+
+
+def columns():
+    return [
+        minidb.Column('id', 'int', unique=True, primary_key=True, index='BTree'),
+        minidb.Column('name', 'str'),
+        minidb.Column('value', 'float'),
+    ]
+
+
+def main(num_rows=200000, seed=0):
+    rng = random.Random(seed)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = minidb.MiniDB(path, pool_pages=POOL_PAGES)
+    db.create_table('bench', columns(), storage='paged')
+    table = db.tables['bench']
+    start = time.perf_counter()
+    for i in range(num_rows):
+        table.insert({'id': i, 'name': f'name{i}', 'value': rng.random()})
+    db.create_index('bench', 'id')
+    db.close()
+    load = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"rows {num_rows:,}, file {size / 2**20:.1f} MB, pool {POOL_PAGES * 4096 / 2**20:.1f} MB")
+    print(f"load + index build   {num_rows / load:>12,.0f} rows/s")
+
+    start = time.perf_counter()
+    db = minidb.MiniDB(path, pool_pages=POOL_PAGES)
+    print(f"reopen               {(time.perf_counter() - start) * 1000:>12.2f} ms")
+
+    probes = [rng.randrange(num_rows) for _ in range(10000)]
+    start = time.perf_counter()
+    for value in probes:
+        db.execute_select('bench', ('id', '=', value))
+    print(f"index lookup         {(time.perf_counter() - start) / len(probes) * 1e6:>12.1f} us")
+
+    pool = db.data_file.pool
+    start = time.perf_counter()
+    count = sum(1 for _ in db.tables['bench'].rows)
+    print(f"full scan            {count / (time.perf_counter() - start):>12,.0f} rows/s")
+    print(f"pool hits {pool.hits:,}, misses {pool.misses:,}, evictions {pool.evictions:,}")
+    db.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
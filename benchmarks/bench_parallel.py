@@ -0,0 +1,58 @@
+# Speedup of partitioned parallel scans against the number of worker processes, for a
+# selective filter over row and columnar tables, selecting every column and only the id
+# column (the workers are only sent the columns a scan reads).
+#
+#   python -m benchmarks.bench_parallel [num_rows] [max_workers]
+
+import os
+import random
+import sys
+
+from benchmarks.common import best_of, load_minidb
+from parallel import shutdown
+
+minidb = load_minidb()
+
+WHERE_CLAUSE = (('qty', '>', 90), 'AND', (('price', '<', 100.0), 'OR', ('active', '=', True)))
+
+
+def make_table(storage, num_rows, seed=0):
+    rng = random.Random(seed)
+    columns = [minidb.Column('id', 'int'), minidb.Column('qty', 'int'),
+               minidb.Column('price', 'float'), minidb.Column('active', 'bool')]
+    table = minidb.Table('bench', columns, storage)
+    for i in range(num_rows):
+        table.rows.append({'id': i, 'qty': rng.randrange(100), 'price': rng.random() * 1000, 'active': rng.random() < 0.5})
+    return table
+
+
+def main(num_rows=1000000, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != max_workers:
+        worker_counts.append(max_workers)
+    print(f"{num_rows:,} rows, {os.cpu_count()} cores; seconds per scan and speedup over one worker")
+    for storage in ('row', 'columnar'):
+        table = make_table(storage, num_rows)
+        serial = best_of(lambda: table.select_rows(WHERE_CLAUSE))
+        print(f"{storage}: unpartitioned select_rows {serial:.3f} s")
+        print(f"  {'':>11} {'select *':>17} {'select id':>17}")
+        table.partition(num_partitions=4 * max_workers)
+        table.get_partitions()  # the partitions encode their columns once
+        base = None
+        for workers in worker_counts:
+            table.workers = workers
+            table.select_rows(WHERE_CLAUSE)  # start the worker processes
+            elapsed = (best_of(lambda: table.select_rows(WHERE_CLAUSE)),
+                       best_of(lambda: table.parallel_select_rows(WHERE_CLAUSE, ['id'])))
+            base = base or elapsed
+            print(f"  {workers:>3} workers" + ''.join(f" {seconds:>8.3f} s {first / seconds:>5.2f}x"
+                                                     for first, seconds in zip(base, elapsed)))
+    shutdown()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,75 @@
+# Repeated dashboard queries through MiniDB.execute_select with and without the result
+# cache, with inserts between rounds invalidating the cached results of the table.
+#
+#   python -m benchmarks.bench_result_cache [num_rows]
+
+import random
+import sys
+import time
+
+from benchmarks.common import load_minidb
+
+minidb = load_minidb()
+
+QUERIES = [
+    ('region', '=', 3),
+    (('region', '=', 1), 'AND', ('amount', '>', 500.0)),
+    ('amount', 'BETWEEN', (100.0, 200.0)),
+    (None, 'NOT', ('region', '<', 8)),
+]
+
+
+def make_db(num_rows, storage, cache_bytes, seed=0):
+    rng = random.Random(seed)
+    db = minidb.MiniDB(cache_bytes=cache_bytes)
+    db.create_table('sales', [
+        minidb.Column('id', 'int', unique=True, primary_key=True),
+        minidb.Column('region', 'int'),
+        minidb.Column('amount', 'float'),
+    ], storage)
+    for i in range(num_rows):
+        db.tables['sales'].insert({'id': i, 'region': rng.randrange(10), 'amount': rng.random() * 1000})
+    return db
+
+
+def run(db, rounds, repeats, inserts):
+    # each round sends every query repeats times, then inserts a few rows
+    start = time.perf_counter()
+    next_id = len(db.tables['sales'].rows)
+    for _ in range(rounds):
+        for _ in range(repeats):
+            for where_clause in QUERIES:
+                db.execute_select('sales', where_clause)
+        for _ in range(inserts):
+            db.insert('sales', {'id': next_id, 'region': next_id % 10, 'amount': 1.0})
+            next_id += 1
+    return time.perf_counter() - start
+
+
+def check_copies(db):
+    # callers own the rows they get: changing them must not change the next cached result
+    where_clause = QUERIES[0]
+    expected = db.execute_select('sales', where_clause)
+    for rows in (db.execute_select('sales', where_clause), list(db.iter_select('sales', where_clause))):
+        for row in rows:
+            row['region'] = -1
+        rows.clear()
+    assert db.execute_select('sales', where_clause) == expected, "a cached result changed with its caller's rows"
+
+
+def main(num_rows=100000, rounds=5, repeats=20, inserts=1):
+    queries = rounds * repeats * len(QUERIES)
+    print(f"{'storage':>9} {'uncached ms/query':>18} {'cached ms/query':>16} {'speedup':>8} {'hit rate':>9}")
+    for storage in ('row', 'columnar'):
+        uncached = run(make_db(num_rows, storage, 0), rounds, repeats, inserts)
+        db = make_db(num_rows, storage, minidb.DEFAULT_CACHE_BYTES)
+        check_copies(db)
+        cached = run(db, rounds, repeats, inserts)
+        summary = db.result_cache.summary()
+        print(f"{storage:>9} {uncached / queries * 1e3:>18.3f} {cached / queries * 1e3:>16.3f} "
+              f"{uncached / cached:>7.1f}x {summary['hit_rate']:>9.1%}")
+    print(summary)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,46 @@
+# Compare the compiled where_clause predicates of Table.select_rows against
+# the row-by-row _where_clause_eval interpreter.
+#
+#   python -m benchmarks.bench_select_rows [num_rows]
+
+import random
+import sys
+
+from benchmarks.common import best_of, load_minidb
+
+minidb = load_minidb()
+
+
+WHERE_CLAUSES = {
+    'equality': ('id', '=', '4242'),
+    'range': ('price', '<', '250.0'),
+    'between': ('qty', 'BETWEEN', ('10', '20')),
+    'and/or': (('qty', '>', '50'), 'AND', (('price', '<', '100.0'), 'OR', ('id', '>=', '90000'))),
+    'not': (None, 'NOT', ('qty', '<=', '25')),
+}
+
+
+def make_table(num_rows, seed=0):
+    rng = random.Random(seed)
+    columns = [minidb.Column('id', 'int'), minidb.Column('qty', 'int'), minidb.Column('price', 'float')]
+    table = minidb.Table('bench', columns)
+    table.rows = [{'id': i, 'qty': rng.randrange(100), 'price': rng.random() * 1000} for i in range(num_rows)]
+    return table
+
+
+def interpret(table, where_clause):
+    return [row for row in table.rows if table._where_clause_eval(row, where_clause)]
+
+
+def main(num_rows=200000):
+    table = make_table(num_rows)
+    print(f"{'clause':<10} {'interpreted rows/s':>20} {'compiled rows/s':>18} {'speedup':>8}")
+    for name, where_clause in WHERE_CLAUSES.items():
+        assert interpret(table, where_clause) == table.select_rows(where_clause)
+        interpreted = best_of(lambda: interpret(table, where_clause))
+        compiled = best_of(lambda: table.select_rows(where_clause))
+        print(f"{name:<10} {num_rows / interpreted:>20,.0f} {num_rows / compiled:>18,.0f} {interpreted / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
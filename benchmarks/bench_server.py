@@ -0,0 +1,149 @@
+# Load test of the network server: many concurrent clients share one pooled Client and send
+# a mix of point selects, range selects, optimized join queries and inserts to a server
+# running in its own process over the TPC-H-like data. Reports the requests per second and
+# the p50/p99 latency of each kind of request.
+#
+# A probe on a connection of its own pings the server every few milliseconds throughout;
+# pings are answered on the event loop, so the latency of the probe ('loop') shows how long
+# requests wait for the loop while the worker threads hold the GIL. --heavy sends only join
+# queries, the CPU-bound load that delays the loop the most.
+#
+#   python -m benchmarks.bench_server [--clients 64] [--seconds 10] [--pool 4] [--scale 0.01] [--heavy]
+
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import random
+import sys
+import time
+
+from benchmarks import datagen
+
+# kinds of requests and their share of the load
+MIX = {
+    'point': 0.6,
+    'range': 0.2,
+    'query': 0.1,
+    'insert': 0.1,
+}
+HEAVY_MIX = {'query': 1.0}
+INDEXED = {'customer': 'custkey', 'orders': 'orderkey'}
+PROBE_INTERVAL = 0.005  # seconds between the pings of the probe
+
+
+def query_plan(day):
+    # orders placed after a day by the customers of one market segment, first 100 of them
+    customers = {'select': "c_mktsegment = 'BUILDING'", 'from': {'scan': 'customer'}}
+    orders = {'select': f'o_orderdate > {day}', 'from': {'scan': 'orders'}}
+    return {'limit': 100, 'from': {'project': ['orderkey', 'c_name', 'o_totalprice'],
+                                   'from': {'join': [customers, orders], 'on': ['custkey']}}}
+
+
+def serve(scale_factor, ports):
+    # child process: load the data, index the keys and serve until terminated
+    from benchmarks.common import load_query_engine
+    from server import Server
+    engine = load_query_engine()
+    minidb = sys.modules['database']  # the combined classes the query engine was loaded with
+    db = datagen.load_tables(minidb, datagen.generate(scale_factor))
+    for name, key in INDEXED.items():
+        db.tables[name].get_column(key).index = 'BTree'
+        db.create_index(name, key)
+    for table in db.tables.values():
+        table.analyze()
+
+    async def main():
+        server = Server(db, engine)
+        ports.put(await server.start(port=0))
+        await server.serve_forever()
+    asyncio.run(main())
+
+
+async def client_loop(client, kind_of, num_orders, new_keys, deadline, latencies, rng):
+    while time.perf_counter() < deadline:
+        kind = kind_of(rng)
+        start = time.perf_counter()
+        if kind == 'point':
+            await client.select('orders', ('orderkey', '=', rng.randrange(num_orders)))
+        elif kind == 'range':
+            low = rng.randrange(num_orders)
+            await client.select('orders', ('orderkey', 'BETWEEN', (low, low + 50)))
+        elif kind == 'query':
+            await client.query(query_plan(rng.randrange(datagen.DAYS)))
+        else:
+            key = next(new_keys)
+            await client.insert('orders', {'orderkey': key, 'custkey': 0, 'o_orderstatus': 'O', 'o_totalprice': 1.0,
+                                           'o_orderdate': 0, 'o_orderpriority': '1-URGENT'})
+        latencies[kind].append(time.perf_counter() - start)
+
+
+async def probe_loop(client, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.ping()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def load(port, clients, seconds, pool_size, num_orders, seed, mix):
+    from client import Client
+    kinds, weights = list(mix), list(mix.values())
+
+    def kind_of(rng):
+        return rng.choices(kinds, weights)[0]
+
+    latencies = {kind: [] for kind in mix}
+    latencies['loop'] = []
+    new_keys = itertools.count(num_orders)
+    async with Client(port=port, pool_size=pool_size) as client, Client(port=port, pool_size=1) as probe:
+        await client.ping()
+        await probe.ping()
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(probe_loop(probe, deadline, latencies['loop']),
+                             *(client_loop(client, kind_of, num_orders, new_keys, deadline, latencies,
+                                           random.Random(f'{seed}:{i}')) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_server')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--pool', type=int, default=4, help='connections of the shared client')
+    parser.add_argument('--scale', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--heavy', action='store_true', help='send only CPU-bound join queries')
+    args = parser.parse_args(argv)
+
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, args=(args.scale, ports), daemon=True)
+    process.start()
+    try:
+        port = ports.get(timeout=600)
+        num_orders = datagen.table_rows(args.scale)['orders']
+        mix = HEAVY_MIX if args.heavy else MIX
+        latencies, elapsed = asyncio.run(load(port, args.clients, args.seconds, args.pool, num_orders,
+                                              args.seed, mix))
+    finally:
+        process.terminate()
+        process.join()
+
+    print(f"{args.clients} clients, {args.pool} connections, scale factor {args.scale}, {elapsed:.1f}s")
+    print(f"{'request':<8} {'count':>8} {'qps':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    loop = latencies.pop('loop')
+    every = [latency for values in latencies.values() for latency in values]
+    for kind, values in list(latencies.items()) + [('total', every), ('loop', loop)]:
+        print(f"{kind:<8} {len(values):>8} {len(values) / elapsed:>9.0f} "
+              f"{percentile(values, 0.5) * 1e3:>9.2f} {percentile(values, 0.99) * 1e3:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
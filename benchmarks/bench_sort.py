@@ -0,0 +1,60 @@
+# ORDER BY over the lineitem table of the TPC-H-like data: sorting the dict rows of
+# execute_select by hand against SortNode sorting in memory and within a small memory budget
+# that spills sorted runs to disk, and ORDER BY ... LIMIT through the top-N heap and through
+# a BTreeIndex that already holds the rows in order.
+#
+#   python -m benchmarks.bench_sort [scale_factor] [budget_mb]
+
+import sys
+
+from benchmarks import datagen
+from benchmarks.common import best_of, load_query_engine
+
+engine = load_query_engine()
+minidb = sys.modules['database']
+
+TOP = 10
+
+
+def run(node, tables):
+    return engine.QueryPlan(node).execute(tables)
+
+
+def main(scale_factor=0.05, budget_mb=4.0):
+    data = datagen.generate(scale_factor)
+    db = datagen.load_tables(minidb, {'lineitem': data['lineitem']}, 'columnar')
+    table = db.tables['lineitem']
+    table.get_column('l_id').index = 'BTree'
+    db.create_index('lineitem', 'l_id')
+    print(f"{len(table.rows):,} lineitem rows, seconds per query")
+
+    def by_hand(limit=None):
+        rows = sorted(db.execute_select('lineitem'), key=lambda row: row['l_extendedprice'], reverse=True)
+        return rows if limit is None else rows[:limit]
+
+    scan = engine.ScanNode('lineitem')
+    in_memory = engine.SortNode(scan, ['l_extendedprice desc'])
+    spilling = engine.SortNode(scan, ['l_extendedprice desc'], max_bytes=int(budget_mb * 2**20))
+    assert run(in_memory, db.tables) == run(spilling, db.tables)
+    print("order by l_extendedprice desc")
+    print(f"  {'execute_select + sorted':<28} {best_of(by_hand):>8.3f}")
+    print(f"  {'SortNode in memory':<28} {best_of(lambda: run(in_memory, db.tables)):>8.3f}")
+    print(f"  {'SortNode external':<28} {best_of(lambda: run(spilling, db.tables)):>8.3f}"
+          f"  ({spilling.runs} runs, {budget_mb:g} MB budget)")
+
+    top = engine.LimitNode(engine.SortNode(scan, ['l_extendedprice desc']), TOP)
+    print(f"order by l_extendedprice desc limit {TOP}")
+    print(f"  {'execute_select + sorted':<28} {best_of(lambda: by_hand(TOP)):>8.3f}")
+    print(f"  {'SortNode top-N heap':<28} {best_of(lambda: run(top, db.tables)):>8.3f}")
+
+    # the index hands out the row ids in order, only the first rows are fetched
+    heap = engine.LimitNode(engine.SortNode(engine.SelectNode(engine.parse_condition('True'), scan), ['l_id desc']), TOP)
+    index = engine.LimitNode(engine.SortNode(scan, ['l_id desc']), TOP)
+    assert run(heap, db.tables) == run(index, db.tables)
+    print(f"order by l_id desc limit {TOP}")
+    print(f"  {'SortNode top-N heap':<28} {best_of(lambda: run(heap, db.tables)):>8.3f}")
+    print(f"  {'SortNode BTreeIndex':<28} {best_of(lambda: run(index, db.tables)):>8.6f}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.05, float(sys.argv[2]) if len(sys.argv) > 2 else 4.0)
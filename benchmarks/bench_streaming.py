@@ -0,0 +1,54 @@
+# Time to first row and peak memory of pipelined query plans as the table grows,
+# materialized (execute) against streaming (iter_rows) execution.
+#
+#   python -m benchmarks.bench_streaming
+
+import random
+import time
+import tracemalloc
+
+from benchmarks.common import load_query_engine
+
+engine = load_query_engine()
+
+
+def make_db(num_rows, seed=0):
+    rng = random.Random(seed)
+    orders = [{'order_id': i, 'cust_id': rng.randrange(1000), 'amount': rng.random() * 100} for i in range(num_rows)]
+    customers = [{'cust_id': i, 'region': rng.randrange(5)} for i in range(1000)]
+    return {'orders': orders, 'customers': customers}
+
+
+def make_plans():
+    select = engine.SelectNode(engine.parse_condition('amount > 50'), engine.ScanNode('orders'))
+    join = engine.JoinNode(engine.ScanNode('orders'), engine.ScanNode('customers'), join_cols=['cust_id'], method='hash')
+    return {
+        'scan+select+project limit 10': engine.LimitNode(engine.ProjectNode(select, ['order_id', 'amount']), 10),
+        'hash join limit 10': engine.LimitNode(join, 10),
+    }
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(sizes=(10000, 100000, 1000000)):
+    print(f"{'plan':<30} {'rows':>10} {'execute ms':>11} {'peak KB':>9} {'first row ms':>13} {'peak KB':>9}")
+    for num_rows in sizes:
+        db = make_db(num_rows)
+        for name, plan in make_plans().items():
+            child = plan.child
+            materialized = measure(lambda: child.execute(db)[:plan.limit])
+            streaming = measure(lambda: next(plan.iter_rows(db)))
+            print(f"{name:<30} {num_rows:>10,} {materialized[0] * 1000:>11.1f} {materialized[1] / 1024:>9.0f}"
+                  f" {streaming[0] * 1000:>13.3f} {streaming[1] / 1024:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
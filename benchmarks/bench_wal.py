@@ -0,0 +1,89 @@
+# Durable inserts per second with the write-ahead log: one fsync per insert, group commit
+# of concurrent inserts, and asynchronous commits; then the time to recover a crashed load.
+#
+#   python -m benchmarks.bench_wal [rows]
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import load_minidb
+
+minidb = load_minidb()
+
+
+def open_db(path, **options):
+    db = minidb.MiniDB(path, **options)
+    if 'bench' not in db.tables:
+        db.create_table('bench', [
+            minidb.Column('id', 'int', unique=True, primary_key=True, index='BTree'),
+            minidb.Column('name', 'str'),
+        ], storage='paged')
+        db.create_index('bench', 'id')
+    return db
+
+
+def remove(path):
+    for name in (path, path + '-wal'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+def run(path, num_rows, threads=1, wait=True, commit_every=None, **options):
+    remove(path)
+    db = open_db(path, **options)
+    fsyncs = db.wal.fsyncs
+
+    def work(first):
+        for i in range(first, num_rows, threads):
+            db.insert('bench', {'id': i, 'name': f'name{i}'}, wait=wait)
+            if commit_every and i % commit_every == 0:
+                db.commit()
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    db.commit()
+    elapsed = time.perf_counter() - start
+    fsyncs = db.wal.fsyncs - fsyncs
+    db.close()
+    return num_rows / elapsed, num_rows / max(fsyncs, 1)
+
+
+def main(num_rows=20000):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"{'mode':<34} {'inserts/s':>10} {'rows/fsync':>11}")
+    modes = [
+        ('fsync per insert', dict(num_rows=num_rows // 4)),
+        ('group commit, 16 threads', dict(num_rows=num_rows, threads=16)),
+        ('group commit, 16 threads, 1 ms', dict(num_rows=num_rows, threads=16, group_commit_delay=0.001)),
+        ('async, commit every 1000 rows', dict(num_rows=num_rows, wait=False, commit_every=1000)),
+    ]
+    for name, options in modes:
+        rate, per_fsync = run(path, **options)
+        print(f"{name:<34} {rate:>10,.0f} {per_fsync:>11.1f}")
+
+    # recovery: load without a checkpoint, leave the log behind as a crash would
+    remove(path)
+    db = open_db(path)
+    for i in range(num_rows):
+        db.insert('bench', {'id': i, 'name': f'name{i}'}, wait=False)
+    db.commit()
+    db.wal.close()
+    log_size = os.path.getsize(path + '-wal')
+    start = time.perf_counter()
+    db = minidb.MiniDB(path)
+    elapsed = time.perf_counter() - start
+    assert len(db.tables['bench'].rows) == num_rows
+    print(f"recovery of {num_rows:,} rows ({log_size / 2**20:.1f} MB of log): {elapsed:.2f} s")
+    db.close()
+    remove(path)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,164 @@
+# Deterministic generator of TPC-H-like data for the benchmarks.
+#
+# The tables follow the TPC-H schema, trimmed to the columns the benchmarks query. The
+# row counts scale with the scale factor: 1.0 gives 150k customers and about 6M lineitems.
+# Key columns keep the same name in every table (custkey, orderkey, ...), so JoinNode can
+# join on them. Foreign keys and a few attributes are drawn from a Zipf distribution whose
+# exponent is the skew; 0 gives uniform data. The same seed, scale factor and skew always
+# give the same rows.
+#
+#   python -m benchmarks.datagen [scale_factor] [skew]
+
+import bisect
+import itertools
+import random
+import sys
+
+# rows per unit of scale factor, region and nation are fixed
+BASE_ROWS = {
+    'supplier': 10000,
+    'part': 200000,
+    'customer': 150000,
+    'orders': 1500000,
+}
+MAX_LINES_PER_ORDER = 7  # lineitems per order are uniform in 1..7, 4 on average
+DAYS = 2557  # order dates are day numbers in 1992-01-01 .. 1998-12-31
+
+REGIONS = ['AFRICA', 'AMERICA', 'ASIA', 'EUROPE', 'MIDDLE EAST']
+NATIONS = [
+    ('ALGERIA', 0), ('ARGENTINA', 1), ('BRAZIL', 1), ('CANADA', 1), ('EGYPT', 4), ('ETHIOPIA', 0),
+    ('FRANCE', 3), ('GERMANY', 3), ('INDIA', 2), ('INDONESIA', 2), ('IRAN', 4), ('IRAQ', 4),
+    ('JAPAN', 2), ('JORDAN', 4), ('KENYA', 0), ('MOROCCO', 0), ('MOZAMBIQUE', 0), ('PERU', 1),
+    ('CHINA', 2), ('ROMANIA', 3), ('SAUDI ARABIA', 4), ('VIETNAM', 2), ('RUSSIA', 3),
+    ('UNITED KINGDOM', 3), ('UNITED STATES', 1),
+]
+SEGMENTS = ['AUTOMOBILE', 'BUILDING', 'FURNITURE', 'HOUSEHOLD', 'MACHINERY']
+PRIORITIES = ['1-URGENT', '2-HIGH', '3-MEDIUM', '4-NOT SPECIFIED', '5-LOW']
+TYPES = ['STANDARD', 'SMALL', 'MEDIUM', 'LARGE', 'ECONOMY', 'PROMO']
+MATERIALS = ['TIN', 'NICKEL', 'BRASS', 'STEEL', 'COPPER']
+
+# columns of every table as (name, data_type, primary key), the first column is the key
+SCHEMAS = {
+    'region': [('regionkey', 'int', True), ('r_name', 'str', False)],
+    'nation': [('nationkey', 'int', True), ('n_name', 'str', False), ('regionkey', 'int', False)],
+    'supplier': [('suppkey', 'int', True), ('s_name', 'str', False), ('nationkey', 'int', False),
+                 ('s_acctbal', 'float', False)],
+    'part': [('partkey', 'int', True), ('p_brand', 'str', False), ('p_type', 'str', False),
+             ('p_size', 'int', False), ('p_retailprice', 'float', False)],
+    'customer': [('custkey', 'int', True), ('c_name', 'str', False), ('nationkey', 'int', False),
+                 ('c_acctbal', 'float', False), ('c_mktsegment', 'str', False)],
+    'orders': [('orderkey', 'int', True), ('custkey', 'int', False), ('o_orderstatus', 'str', False),
+               ('o_totalprice', 'float', False), ('o_orderdate', 'int', False), ('o_orderpriority', 'str', False)],
+    'lineitem': [('l_id', 'int', True), ('orderkey', 'int', False), ('partkey', 'int', False),
+                 ('suppkey', 'int', False), ('l_linenumber', 'int', False), ('l_quantity', 'int', False),
+                 ('l_extendedprice', 'float', False), ('l_discount', 'float', False),
+                 ('l_shipdate', 'int', False), ('l_returnflag', 'str', False)],
+}
+
+
+class Zipf:
+    # sampler of 0 .. n - 1 where value i has a weight of 1 / (rank + 1) ** skew; ranks are
+    # shuffled with the seed so that frequent values are spread over the key range
+    def __init__(self, n, skew, rng):
+        self.n = n
+        self.rng = rng
+        ranks = list(range(n))
+        rng.shuffle(ranks)
+        self.values = ranks  # value of each rank, rank 0 being the most frequent
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+
+    def sample(self, count):
+        if count <= 0:
+            return []
+        total = self.cum_weights[-1]
+        values, cum_weights, random_ = self.values, self.cum_weights, self.rng.random
+        return [values[bisect.bisect(cum_weights, random_() * total)] for _ in range(count)]
+
+
+def table_rows(scale_factor):
+    # number of rows of every table at a scale factor, lineitem is about 4 per order
+    counts = {'region': len(REGIONS), 'nation': len(NATIONS)}
+    for name, base in BASE_ROWS.items():
+        counts[name] = max(1, round(base * scale_factor))
+    return counts
+
+
+def _rng(seed, name):
+    # independent stream per table, string seeds are hashed the same way in every process
+    return random.Random(f'{seed}:{name}')
+
+
+def generate(scale_factor=0.01, skew=0.0, seed=0):
+    # dictionary of table name -> list of row dicts
+    counts = table_rows(scale_factor)
+    data = {
+        'region': [{'regionkey': i, 'r_name': name} for i, name in enumerate(REGIONS)],
+        'nation': [{'nationkey': i, 'n_name': name, 'regionkey': region} for i, (name, region) in enumerate(NATIONS)],
+    }
+
+    rng = _rng(seed, 'supplier')
+    data['supplier'] = [{'suppkey': i, 's_name': f'Supplier#{i:09d}', 'nationkey': rng.randrange(len(NATIONS)),
+                         's_acctbal': round(rng.uniform(-999.99, 9999.99), 2)} for i in range(counts['supplier'])]
+
+    rng = _rng(seed, 'part')
+    data['part'] = [{'partkey': i, 'p_brand': f'Brand#{rng.randint(1, 5)}{rng.randint(1, 5)}',
+                     'p_type': f'{rng.choice(TYPES)} {rng.choice(MATERIALS)}', 'p_size': rng.randint(1, 50),
+                     'p_retailprice': round(900 + i % 1000 + (i % 20) / 10, 2)} for i in range(counts['part'])]
+
+    rng = _rng(seed, 'customer')
+    segments = Zipf(len(SEGMENTS), skew, rng)
+    segment_of = segments.sample(counts['customer'])
+    data['customer'] = [{'custkey': i, 'c_name': f'Customer#{i:09d}', 'nationkey': rng.randrange(len(NATIONS)),
+                         'c_acctbal': round(rng.uniform(-999.99, 9999.99), 2),
+                         'c_mktsegment': SEGMENTS[segment_of[i]]} for i in range(counts['customer'])]
+
+    rng = _rng(seed, 'orders')
+    custkeys = Zipf(counts['customer'], skew, rng).sample(counts['orders'])
+    data['orders'] = [{'orderkey': i, 'custkey': custkeys[i], 'o_orderstatus': rng.choice('FOP'),
+                       'o_totalprice': round(rng.uniform(850, 550000), 2), 'o_orderdate': rng.randrange(DAYS - 151),
+                       'o_orderpriority': rng.choice(PRIORITIES)} for i in range(counts['orders'])]
+
+    rng = _rng(seed, 'lineitem')
+    lines = [rng.randint(1, MAX_LINES_PER_ORDER) for _ in range(counts['orders'])]
+    num_lines = sum(lines)
+    partkeys = Zipf(counts['part'], skew, rng).sample(num_lines)
+    suppkeys = Zipf(counts['supplier'], skew, rng).sample(num_lines)
+    lineitem = []
+    for order, count in zip(data['orders'], lines):
+        for line in range(1, count + 1):
+            i = len(lineitem)
+            quantity = rng.randint(1, 50)
+            lineitem.append({'l_id': i, 'orderkey': order['orderkey'], 'partkey': partkeys[i], 'suppkey': suppkeys[i],
+                             'l_linenumber': line, 'l_quantity': quantity,
+                             'l_extendedprice': round(quantity * data['part'][partkeys[i]]['p_retailprice'], 2),
+                             'l_discount': rng.randint(0, 10) / 100,
+                             'l_shipdate': order['o_orderdate'] + rng.randint(1, 121),
+                             'l_returnflag': rng.choice('RAN')})
+    data['lineitem'] = lineitem
+    return data
+
+
+def make_columns(minidb, name):
+    # Column objects of a table for MiniDB.create_table
+    return [minidb.Column(column, data_type, unique=primary_key, primary_key=primary_key)
+            for column, data_type, primary_key in SCHEMAS[name]]
+
+
+def load_tables(minidb, data, storage='row', db=None):
+    # create a MiniDB table of the given storage for every generated table and bulk load it
+    if db is None:
+        db = minidb.MiniDB()
+    for name, rows in data.items():
+        db.create_table(name, make_columns(minidb, name), storage)
+        db.tables[name].insert_many(rows)
+    return db
+
+
+def main(scale_factor=0.01, skew=0.0):
+    data = generate(scale_factor, skew)
+    for name, rows in data.items():
+        print(f"{name:<10} {len(rows):>10,} rows  {rows[0] if rows else ''}")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.01, float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
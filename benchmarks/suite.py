@@ -0,0 +1,355 @@
+# Benchmark suite over the TPC-H-like data of benchmarks.datagen: micro-benchmarks of the
+# scans, indexes, joins, statistics and optimizer, and end-to-end query plans, each run at
+# several scale factors. A run writes its results as JSON; compare reads two runs and
+# flags every benchmark whose throughput dropped or whose peak memory grew by more than a
+# threshold, exiting with status 1 when it finds one.
+#
+#   python -m benchmarks.suite run [--scale 0.001 0.01] [--skew 1.0] [--only hash] [--output run.json]
+#   python -m benchmarks.suite compare base.json new.json [--threshold 0.1] [--memory-threshold 0.1]
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import best_of, load_query_engine
+from benchmarks import datagen
+
+engine = load_query_engine()
+minidb = sys.modules['database']
+
+DEFAULT_SCALES = [0.001, 0.01]
+DEFAULT_SKEW = 1.0
+DEFAULT_THRESHOLD = 0.1  # a 10% lower throughput or higher peak memory is a regression
+NUM_PROBES = 10000  # index lookups per lookup benchmark
+
+# every benchmark as (name, group, setup); setup takes a Context and returns the function
+# to time and the number of items (rows, lookups or plans) one call of it processes
+BENCHMARKS = []
+
+
+def benchmark(name, group):
+    def register(setup):
+        BENCHMARKS.append((name, group, setup))
+        return setup
+    return register
+
+
+class Context:
+    # the generated data of one scale factor and the MiniDB databases holding it, loaded
+    # once per storage and shared by the benchmarks
+    def __init__(self, scale_factor, skew, seed):
+        self.scale_factor = scale_factor
+        self.data = datagen.generate(scale_factor, skew, seed)
+        self.rng = random.Random(seed)
+        self.dbs = {}
+
+    def db(self, storage='row'):
+        if storage not in self.dbs:
+            db = datagen.load_tables(minidb, self.data, storage)
+            for table in db.tables.values():
+                table.analyze()
+            self.dbs[storage] = db
+        return self.dbs[storage]
+
+    def tables(self, storage='row'):
+        return self.db(storage).tables
+
+    def probes(self, values):
+        # NUM_PROBES values drawn uniformly from the distinct values of a column, hits only
+        distinct = sorted(set(values))
+        return [self.rng.choice(distinct) for _ in range(NUM_PROBES)]
+
+
+# micro-benchmarks
+
+SELECT_WHERE = (('l_quantity', '<', '25'), 'AND', ('l_discount', '>=', '0.05'))
+
+
+@benchmark('select_rows.row', 'scan')
+def select_rows_row(context):
+    table = context.tables('row')['lineitem']
+    return lambda: table.select_rows(SELECT_WHERE), len(table.rows)
+
+
+@benchmark('select_rows.columnar', 'scan')
+def select_rows_columnar(context):
+    table = context.tables('columnar')['lineitem']
+    return lambda: table.select_rows(SELECT_WHERE), len(table.rows)
+
+
+@benchmark('select_node.columnar', 'scan')
+def select_node_columnar(context):
+    tables = context.tables('columnar')
+    plan = engine.QueryPlan(engine.SelectNode(engine.parse_condition('l_shipdate < 1000'), engine.ScanNode('lineitem')))
+    return lambda: plan.execute(tables), len(tables['lineitem'].rows)
+
+
+@benchmark('hash_index.build', 'index')
+def hash_index_build(context):
+    table = context.tables('row')['lineitem']
+    index = minidb.HashIndex(table, table.get_column('orderkey'))
+    return index.build, len(table.rows)
+
+
+@benchmark('hash_index.lookup', 'index')
+def hash_index_lookup(context):
+    table = context.tables('row')['lineitem']
+    index = minidb.HashIndex(table, table.get_column('partkey'))
+    index.build()
+    probes = context.probes(table.get_column_values('partkey'))
+    return lambda: [index.lookup(value) for value in probes], len(probes)
+
+
+@benchmark('btree_index.build', 'index')
+def btree_index_build(context):
+    table = context.tables('row')['lineitem']
+
+    def build():
+        minidb.BTreeIndex(table, table.get_column('l_extendedprice')).build()
+    return build, len(table.rows)
+
+
+@benchmark('btree_index.lookup', 'index')
+def btree_index_lookup(context):
+    table = context.tables('row')['lineitem']
+    index = minidb.BTreeIndex(table, table.get_column('partkey'))
+    index.build()
+    probes = context.probes(table.get_column_values('partkey'))
+    return lambda: [index.lookup(value) for value in probes], len(probes)
+
+
+@benchmark('btree_index.range_lookup', 'index')
+def btree_index_range_lookup(context):
+    # ranges of about 10 days of ship dates
+    table = context.tables('row')['lineitem']
+    index = minidb.BTreeIndex(table, table.get_column('l_shipdate'))
+    index.build()
+    lows = context.probes(table.get_column_values('l_shipdate'))[:NUM_PROBES // 10]
+    return lambda: [index.range_lookup(low, low + 10) for low in lows], len(lows)
+
+
+@benchmark('hash_join', 'join')
+def hash_join(context):
+    orders, lineitem = context.data['orders'], context.data['lineitem']
+    return lambda: engine.hash_join(orders, lineitem, ['orderkey'], ['orderkey']), len(orders) + len(lineitem)
+
+
+@benchmark('sort_merge_join', 'join')
+def sort_merge_join(context):
+    # skewed keys on both sides: lineitems against the parts they reference
+    part, lineitem = context.data['part'], context.data['lineitem']
+    return lambda: engine.sort_merge_join(part, lineitem, ['partkey'], ['partkey']), len(part) + len(lineitem)
+
+
+@benchmark('index_nested_loop_join', 'join')
+def index_nested_loop_join(context):
+    customer, orders = context.tables('row')['customer'], context.tables('row')['orders']
+    index = minidb.HashIndex(orders, orders.get_column('custkey'))
+    index.build()
+    return lambda: engine.index_nested_loop_join(customer.rows, orders.rows, 'custkey', index), len(customer.rows)
+
+
+@benchmark('column_stats', 'stats')
+def column_stats(context):
+    lineitem = context.data['lineitem']
+    return lambda: engine.get_column_stats(lineitem, 'l_extendedprice'), len(lineitem)
+
+
+@benchmark('analyze', 'stats')
+def analyze(context):
+    table = context.tables('row')['orders']
+    return table.analyze, len(table.rows)
+
+
+@benchmark('optimize', 'optimizer')
+def optimize(context):
+    stats = context.db('row').get_stats()
+    root = q5_plan().root
+    return lambda: engine.QueryOptimizer(stats).optimize(root), 1
+
+
+# end-to-end queries, written in the join order of the text and reordered by the optimizer
+# with the statistics of the tables
+
+def scan(name, condition=None):
+    node = engine.ScanNode(name)
+    if condition is not None:
+        node = engine.SelectNode(engine.parse_condition(condition), node)
+    return node
+
+
+def join(left, right, *columns):
+    return engine.JoinNode(left, right, join_cols=list(columns))
+
+
+def q1_plan():
+    # pricing summary report: totals and averages of the lineitems shipped before a date
+    # per return flag
+    aggregates = ['sum(l_quantity)', 'sum(l_extendedprice)', 'avg(l_quantity)', 'avg(l_extendedprice)',
+                  'avg(l_discount)', 'count(*)']
+    node = scan('lineitem', f'l_shipdate <= {datagen.DAYS - 90}')
+    return engine.QueryPlan(engine.AggregateNode(node, ['l_returnflag'], aggregates))
+
+
+def q3_plan():
+    # shipping priority: lineitems of the orders of one market segment placed before a date
+    customer = scan('customer', "c_mktsegment = 'BUILDING'")
+    orders = scan('orders', 'o_orderdate < 1200')
+    lineitem = scan('lineitem', 'l_shipdate > 1200')
+    node = join(join(customer, orders, 'custkey'), lineitem, 'orderkey')
+    return engine.QueryPlan(engine.ProjectNode(node, ['orderkey', 'o_orderdate', 'l_extendedprice', 'l_discount']))
+
+
+def q5_plan():
+    # local supplier volume: the lineitems of the orders placed in one year by the customers
+    # of one region and supplied from the nation of the customer, per nation
+    region = scan('region', "r_name = 'ASIA'")
+    orders = scan('orders', 'o_orderdate >= 730 and o_orderdate < 1095')
+    node = join(join(join(join(region, scan('nation'), 'regionkey'), scan('customer'), 'nationkey'), orders, 'custkey'),
+                scan('lineitem'), 'orderkey')
+    # the supplier shares the nation of the customer
+    node = join(node, scan('supplier'), 'suppkey', 'nationkey')
+    return engine.QueryPlan(engine.AggregateNode(node, ['n_name'], ['sum(l_extendedprice)', 'avg(l_discount)']))
+
+
+QUERIES = {
+    'q1': (q1_plan, ['lineitem']),
+    'q3': (q3_plan, ['customer', 'orders', 'lineitem']),
+    'q5': (q5_plan, ['region', 'nation', 'customer', 'supplier', 'orders', 'lineitem']),
+}
+
+
+def register_query(name, storage):
+    make_plan, relations = QUERIES[name]
+
+    def setup(context):
+        tables = context.tables(storage)
+        plan = engine.QueryOptimizer(context.db(storage).get_stats()).optimize(make_plan().root)
+        # throughput is measured in rows of the scanned tables
+        return lambda: plan.execute(tables), sum(len(tables[relation].rows) for relation in relations)
+    BENCHMARKS.append((f'{name}.{storage}', 'query', setup))
+
+
+for query in QUERIES:
+    for storage in ('row', 'columnar'):
+        register_query(query, storage)
+
+
+# running and comparing
+
+def peak_memory(func):
+    # bytes allocated at the peak of one call, the result is kept alive until the end
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def run(scales=DEFAULT_SCALES, skew=DEFAULT_SKEW, seed=0, repeat=3, only=None):
+    results = []
+    for scale_factor in scales:
+        context = Context(scale_factor, skew, seed)
+        for name, group, setup in BENCHMARKS:
+            if only and not any(pattern in name for pattern in only):
+                continue
+            func, items = setup(context)
+            seconds = best_of(func, repeat)
+            result = {
+                'name': name,
+                'group': group,
+                'scale_factor': scale_factor,
+                'items': items,
+                'seconds': seconds,
+                'items_per_second': items / seconds if seconds else None,
+                'peak_bytes': peak_memory(func),
+            }
+            results.append(result)
+            print(f"{name:<26} sf {scale_factor:<6} {seconds * 1e3:>10.2f} ms {result['items_per_second'] or 0:>14,.0f} items/s"
+                  f" {result['peak_bytes'] / 2**20:>9.2f} MB", file=sys.stderr)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scales': list(scales),
+            'skew': skew,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(base, new, threshold=DEFAULT_THRESHOLD, memory_threshold=DEFAULT_THRESHOLD):
+    # list of (name, scale_factor, throughput change, memory change, regressed) of the
+    # benchmarks present in both runs; changes are fractions, positive means more
+    base_results = {(result['name'], result['scale_factor']): result for result in base['results']}
+    rows = []
+    for result in new['results']:
+        before = base_results.get((result['name'], result['scale_factor']))
+        if before is None:
+            continue
+        throughput = None
+        if before['items_per_second'] and result['items_per_second']:
+            throughput = result['items_per_second'] / before['items_per_second'] - 1
+        memory = None
+        if before['peak_bytes']:
+            memory = result['peak_bytes'] / before['peak_bytes'] - 1
+        regressed = (throughput is not None and throughput < -threshold) or (memory is not None and memory > memory_threshold)
+        rows.append((result['name'], result['scale_factor'], throughput, memory, regressed))
+    return rows
+
+
+def format_change(change):
+    return 'n/a' if change is None else f'{change:+.1%}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks and write their results as JSON')
+    run_parser.add_argument('--scale', type=float, nargs='+', default=DEFAULT_SCALES)
+    run_parser.add_argument('--skew', type=float, default=DEFAULT_SKEW)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--only', nargs='+', help='run the benchmarks whose name contains one of these')
+    run_parser.add_argument('--output', help='file for the JSON results, standard output by default')
+    compare_parser = commands.add_parser('compare', help='flag the regressions of a run against a base run')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.add_argument('--memory-threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.scale, args.skew, args.seed, args.repeat, args.only)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        return 0
+
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    rows = compare(base, new, args.threshold, args.memory_threshold)
+    print(f"{'benchmark':<26} {'scale':>6} {'throughput':>11} {'peak memory':>12}")
+    for name, scale_factor, throughput, memory, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<26} {scale_factor:>6} {format_change(throughput):>11} {format_change(memory):>12}{flag}")
+    regressions = sum(regressed for *_, regressed in rows)
+    print(f"{regressions} regression(s) in {len(rows)} benchmarks")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
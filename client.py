@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import json
+
+from server import DEFAULT_HOST, DEFAULT_PORT, MAX_LINE_BYTES
+
+# asyncio client of server.py: a pool of connections shared by any number of coroutines
+# every connection pipelines the requests sent on it, a reader task hands each response
+# line to the request with its id, so a slow query does not hold up the ones behind it
+DEFAULT_POOL_SIZE = 4  # connections opened at most
+MAX_IN_FLIGHT = 16  # requests per connection before the pool opens another one
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count(1)
+        self.pending = {}  # request id -> queue of its response messages
+        self.closed = False
+        self.task = asyncio.create_task(self._read_responses())
+
+    async def _read_responses(self):
+        error = 'Connection closed by the server'
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                queue = self.pending.get(message.get('id'))
+                if queue is None:
+                    continue  # answer of a request given up on
+                if 'done' in message or 'error' in message:
+                    del self.pending[message['id']]
+                queue.put_nowait(message)
+        except (ConnectionError, ValueError) as exc:
+            error = f'Connection lost: {exc}'
+        finally:
+            self.closed = True
+            for request_id, queue in self.pending.items():
+                queue.put_nowait({'id': request_id, 'error': error})
+            self.pending.clear()
+
+    async def send(self, message):
+        # send a request, returns the queue its response messages arrive on
+        if self.closed:
+            raise ConnectionError('Connection is closed')
+        request_id = next(self.ids)
+        queue = asyncio.Queue()
+        self.pending[request_id] = queue
+        self.writer.write(json.dumps({'id': request_id, **message}, separators=(',', ':')).encode() + b'\n')
+        await self.writer.drain()
+        return queue
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.task
+
+
+class Client:
+    # requests go to the open connection with the fewest requests in flight, a new connection
+    # is opened while all of them are busy and the pool is not full
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, pool_size=DEFAULT_POOL_SIZE,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight
+        self.connections = []
+        self.lock = asyncio.Lock()  # one connection is opened at a time
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _connection(self):
+        self.connections = [connection for connection in self.connections if not connection.closed]
+        if self.connections:
+            connection = min(self.connections, key=lambda connection: len(connection.pending))
+            if len(connection.pending) < self.max_in_flight or len(self.connections) >= self.pool_size:
+                return connection
+        async with self.lock:
+            if len(self.connections) < self.pool_size:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_LINE_BYTES)
+                self.connections.append(Connection(reader, writer))
+            return min(self.connections, key=lambda connection: len(connection.pending))
+
+    async def request(self, op, **fields):
+        # the response messages of one request, raises RuntimeError with the message of the
+        # server when the request failed
+        connection = await self._connection()
+        queue = await connection.send({'op': op, **fields})
+        while True:
+            message = await queue.get()
+            if 'error' in message:
+                raise RuntimeError(message['error'])
+            yield message
+            if 'done' in message:
+                return
+
+    async def iter_batches(self, op, **fields):
+        # the rows of a select or query as they arrive, in lists of row dicts
+        async for message in self.request(op, **fields):
+            if 'rows' in message:
+                columns = message['columns']
+                yield [dict(zip(columns, row)) for row in message['rows']]
+
+    async def _rows(self, op, **fields):
+        rows = []
+        async for batch in self.iter_batches(op, **fields):
+            rows.extend(batch)
+        return rows
+
+    async def select(self, table_name, where_clause=None):
+        # MiniDB.execute_select on the server
+        return await self._rows('select', table=table_name, where=where_clause)
+
+    async def query(self, plan):
+        # run a plan described as in server.build_plan, optimized by the server
+        return await self._rows('query', plan=plan)
+
+    async def insert(self, table_name, row):
+        # returns the row id of the new row
+        async for message in self.request('insert', table=table_name, row=row):
+            return message['row_id']
+
+    async def insert_many(self, table_name, rows):
+        # returns the number of rows loaded
+        async for message in self.request('insert_many', table=table_name, rows=rows):
+            return message['count']
+
+    async def ping(self):
+        async for _ in self.request('ping'):
+            return True
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
+        self.connections = []
@@ -0,0 +1,231 @@
+import bisect
+import math
+import random
+
+# default size of the statistics kept for every column
+DEFAULT_NUM_BUCKETS = 32  # buckets of the equi-depth histogram
+DEFAULT_NUM_MCV = 16  # most common values reported
+DEFAULT_SAMPLE_SIZE = 10000  # rows kept in the reservoir sample, None keeps every value
+HLL_PRECISION = 12  # 2**12 registers, about 1.6% standard error on distinct counts
+
+
+def _mix_hash(value):
+    # spread the bits of hash(value): small ints hash to themselves, which HyperLogLog cannot use
+    h = hash(value) & 0xFFFFFFFFFFFFFFFF
+    h = (h ^ (h >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    h = (h ^ (h >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return h ^ (h >> 31)
+
+
+class HyperLogLog:
+    # approximate distinct counter using a fixed number of small registers
+    # string hashes are randomized per process, so only merge sketches built in the same process
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, value):
+        h = _mix_hash(value)
+        register = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 65 - self.precision if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def merge(self, other):
+        # combine with a sketch of another part of the same column
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small cardinalities are counted more precisely from the empty registers
+            return m * math.log(m / zeros)
+        return estimate
+
+
+class ColumnStats:
+    # statistics of one column, built in a single pass and kept up to date on every add():
+    # row count, min/max, approximate distinct count (HyperLogLog), most common values
+    # (Misra-Gries counters) and an equi-depth histogram taken from a reservoir sample
+    def __init__(self, num_rows=0, value_counts=None, num_buckets=DEFAULT_NUM_BUCKETS,
+                 num_mcv=DEFAULT_NUM_MCV, sample_size=DEFAULT_SAMPLE_SIZE, seed=0):
+        self.num_rows = 0
+        self.num_buckets = num_buckets
+        self.num_mcv = num_mcv
+        self.sample_size = sample_size
+        self.min_value = None
+        self.max_value = None
+        self.distinct = HyperLogLog()
+        self.counters = {}  # Misra-Gries counters, a lower bound of the count of frequent values
+        self.counter_capacity = 4 * num_mcv
+        self.sample = []
+        self.sorted_sample = None  # sorted copy of the sample, rebuilt after new rows arrive
+        self.rng = random.Random(seed)
+        for value, count in (value_counts or {}).items():
+            self.add(value, count)
+        # statistics of a whole relation may only carry its row count
+        self.num_rows = max(self.num_rows, num_rows)
+
+    def add(self, value, count=1):
+        # account for count new rows holding value
+        if value is None:
+            self.num_rows += count
+            return
+        # compared first, a value that cannot be ordered with the others changes nothing
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+        for _ in range(count):
+            self.num_rows += 1
+            self._add_to_sample(value)
+        self.distinct.add(value)
+        counters = self.counters
+        if value in counters:
+            counters[value] += count
+        elif len(counters) < self.counter_capacity:
+            counters[value] = count
+        else:
+            # no free counter: decrement all of them and drop the ones reaching zero
+            smallest = min(min(counters.values()), count)
+            for key in list(counters):
+                counters[key] -= smallest
+                if counters[key] == 0:
+                    del counters[key]
+            if count > smallest:
+                counters[value] = count - smallest
+
+    def _add_to_sample(self, value):
+        self.sorted_sample = None
+        if self.sample_size is None or len(self.sample) < self.sample_size:
+            self.sample.append(value)
+            return
+        # reservoir sampling: every row seen so far is in the sample with the same probability
+        i = self.rng.randrange(self.num_rows)
+        if i < self.sample_size:
+            self.sample[i] = value
+
+    def remove(self, value):
+        # account for a deleted row, the distinct count and the sample are left as they are
+        self.num_rows = max(self.num_rows - 1, 0)
+        if value in self.counters:
+            self.counters[value] -= 1
+            if self.counters[value] <= 0:
+                del self.counters[value]
+
+    def merge(self, other):
+        # combine with the statistics of another part of the same column, e.g. another partition
+        total = self.num_rows + other.num_rows
+        for value in (other.min_value, other.max_value):
+            if value is not None:
+                if self.min_value is None or value < self.min_value:
+                    self.min_value = value
+                if self.max_value is None or value > self.max_value:
+                    self.max_value = value
+        self.distinct.merge(other.distinct)
+        for value, count in other.counters.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        if len(self.counters) > self.counter_capacity:
+            kept = sorted(self.counters.items(), key=lambda item: item[1], reverse=True)
+            self.counters = dict(kept[:self.counter_capacity])
+        # keep sample values in proportion to the rows each side stands for
+        if self.sample_size is None or not total:
+            self.sample.extend(other.sample)
+        else:
+            own = round(self.sample_size * self.num_rows / total)
+            self.sample = (self.rng.sample(self.sample, min(own, len(self.sample)))
+                           + self.rng.sample(other.sample, min(self.sample_size - own, len(other.sample))))
+        self.sorted_sample = None
+        self.num_rows = total
+
+    @property
+    def num_distinct(self):
+        if not self.num_rows:
+            return 0
+        return max(1, min(round(self.distinct.count()), self.num_rows))
+
+    @property
+    def value_counts(self):
+        # counts of the most common values, bounded instead of one entry per distinct value
+        return dict(self.most_common_values())
+
+    def most_common_values(self, n=None):
+        # the n most common values with their (lower bound) counts, most common first
+        n = self.num_mcv if n is None else n
+        return sorted(self.counters.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def _sorted_sample(self):
+        if self.sorted_sample is None:
+            try:
+                self.sorted_sample = sorted(self.sample)
+            except TypeError:
+                # values of mixed types cannot be ordered
+                self.sorted_sample = []
+        return self.sorted_sample
+
+    @property
+    def histogram(self):
+        # bounds of the equi-depth histogram: each of the num_buckets buckets between two
+        # consecutive bounds holds about the same number of rows
+        values = self._sorted_sample()
+        if not values:
+            return []
+        last = len(values) - 1
+        return [values[round(i * last / self.num_buckets)] for i in range(self.num_buckets + 1)]
+
+    def eq_selectivity(self, value):
+        # estimated fraction of the rows equal to value
+        if not self.num_rows:
+            return 0.0
+        if self.min_value is not None and value is not None:
+            try:
+                if value < self.min_value or value > self.max_value:
+                    return 0.0
+            except TypeError:
+                return 0.0
+        mcv = self.most_common_values()
+        for mcv_value, count in mcv:
+            if mcv_value == value:
+                return count / self.num_rows
+        # the other values share the rows not covered by the most common values
+        mcv_rows = sum(count for _, count in mcv)
+        other_values = max(self.num_distinct - len(mcv), 1)
+        return max(self.num_rows - mcv_rows, 0) / self.num_rows / other_values
+
+    def range_selectivity(self, low=None, high=None, include_low=True, include_high=True):
+        # estimated fraction of the rows between low and high, None leaves that side open
+        values = self._sorted_sample()
+        if not values:
+            return 1 / 3
+        try:
+            if low is None:
+                start = 0
+            elif include_low:
+                start = bisect.bisect_left(values, low)
+            else:
+                start = bisect.bisect_right(values, low)
+            if high is None:
+                end = len(values)
+            elif include_high:
+                end = bisect.bisect_right(values, high)
+            else:
+                end = bisect.bisect_left(values, high)
+        except TypeError:
+            return 1 / 3
+        return max(end - start, 0) / len(values)
+
+    def summary(self):
+        # plain dictionary of the statistics, as returned by get_column_stats
+        return {
+            'num_rows': self.num_rows,
+            'distinct_values': self.num_distinct,
+            'min_value': self.min_value,
+            'max_value': self.max_value,
+            'most_common_values': self.most_common_values(),
+            'histogram': self.histogram,
+        }
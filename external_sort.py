@@ -0,0 +1,137 @@
+import heapq
+import pickle
+import re
+import sys
+import tempfile
+from itertools import islice
+
+# external merge sort of tuple rows for the ORDER BY of the 3rd issue: the input is cut into
+# runs that fit a memory budget, every run is sorted in memory and written to a temporary
+# file, and the sorted runs are merged back with a k-way heap merge as the rows are pulled;
+# an input that fits the budget is sorted in memory without touching the disk
+DEFAULT_SORT_BYTES = 64 * 2**20  # memory budget of the rows of one run
+SIZE_SAMPLE_ROWS = 8  # rows measured to estimate the size of a row
+MAX_MERGE_RUNS = 64  # files merged at once, more runs are first merged into longer ones
+RUN_BLOCK_ROWS = 1024  # rows pickled together in a run file
+
+ORDER_KEY_PATTERN = re.compile(r'\s*(?P<column>[A-Za-z_][A-Za-z0-9_.]*)(?:\s+(?P<direction>asc|desc))?\s*$',
+                               re.IGNORECASE)
+
+
+def parse_order_key(text):
+    # "o_totalprice desc" -> ('o_totalprice', True), the direction defaults to ascending
+    match = ORDER_KEY_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"Invalid sort key {text!r}, expected a column optionally followed by asc or desc")
+    direction = match.group('direction')
+    return match.group('column'), direction is not None and direction.lower() == 'desc'
+
+
+class Descending:
+    # wraps a value so that it orders before the smaller values, for keys mixing directions
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def mixed_key(ordinals, descending):
+    # key of a tuple row sorting the columns at ordinals ascending, or descending where
+    # descending is set
+    steps = list(zip(ordinals, descending))
+    return lambda row: tuple(Descending(row[i]) if desc else row[i] for i, desc in steps)
+
+
+def row_size(rows):
+    # approximate bytes held by a list of tuple rows per row, from its first rows
+    sample = rows[:SIZE_SAMPLE_ROWS]
+    if not sample:
+        return 0
+    sample_bytes = 0
+    for row in sample:
+        sample_bytes += 8 + sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+    return sample_bytes // len(sample)
+
+
+def top_n(rows, n, key=None, reverse=False):
+    # the first n rows in sorted order, kept in a heap of n rows instead of sorting them all
+    if reverse:
+        return heapq.nlargest(n, rows, key)
+    return heapq.nsmallest(n, rows, key)
+
+
+_MISSING = object()  # end of the input, None may be a row
+
+
+class ExternalSort:
+    # sort(rows) yields the rows ordered by key, the largest first with reverse, equal keys
+    # in input order; runs and spilled_rows count what the sorts wrote to disk
+    def __init__(self, key=None, reverse=False, max_bytes=DEFAULT_SORT_BYTES, temp_dir=None):
+        self.key = key
+        self.reverse = reverse
+        self.max_bytes = max_bytes
+        self.temp_dir = temp_dir  # directory of the run files, the system default when None
+        self.runs = 0
+        self.spilled_rows = 0
+
+    def sort(self, rows):
+        rows = iter(rows)
+        buffer = list(islice(rows, SIZE_SAMPLE_ROWS))
+        run_rows = max(SIZE_SAMPLE_ROWS, self.max_bytes // max(row_size(buffer), 1))
+        buffer.extend(islice(rows, run_rows - len(buffer)))
+        extra = next(rows, _MISSING)
+        if extra is _MISSING:
+            # the whole input fits the budget
+            buffer.sort(key=self.key, reverse=self.reverse)
+            yield from buffer
+            return
+        files = []
+        try:
+            while buffer:
+                buffer.sort(key=self.key, reverse=self.reverse)
+                files.append(self._write_run(buffer))
+                buffer = [] if extra is _MISSING else [extra]
+                extra = _MISSING
+                buffer.extend(islice(rows, run_rows - len(buffer)))
+            while len(files) > MAX_MERGE_RUNS:
+                # too many files to hold open and merge at once: merge the first of them
+                # into one longer run, they are still in input order
+                merged = self._write_run(self._merge(files[:MAX_MERGE_RUNS]))
+                for run in files[:MAX_MERGE_RUNS]:
+                    run.close()
+                files = [merged] + files[MAX_MERGE_RUNS:]
+            yield from self._merge(files)
+        finally:
+            for run in files:
+                run.close()  # temporary files are deleted once closed
+
+    def _write_run(self, rows):
+        run = tempfile.TemporaryFile(dir=self.temp_dir)
+        rows = iter(rows)
+        while True:
+            block = list(islice(rows, RUN_BLOCK_ROWS))
+            if not block:
+                break
+            pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+            self.spilled_rows += len(block)
+        run.seek(0)
+        self.runs += 1
+        return run
+
+    def _merge(self, runs):
+        return heapq.merge(*map(_read_run, runs), key=self.key, reverse=self.reverse)
+
+
+def _read_run(run):
+    while True:
+        try:
+            block = pickle.load(run)
+        except EOFError:
+            return
+        yield from block
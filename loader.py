@@ -0,0 +1,100 @@
+import csv
+import json
+from itertools import islice
+
+# streaming readers for bulk loads: records are parsed and converted to the data_type of
+# their column a batch at a time, one column of the batch at once, and yielded as lists of
+# row dicts
+DEFAULT_BATCH_ROWS = 10000  # records parsed and converted together
+
+# spellings of the bool values in text files
+TRUE_STRINGS = {'1', 'true', 't', 'yes', 'y'}
+FALSE_STRINGS = {'0', 'false', 'f', 'no', 'n'}
+# the common spellings and JSON values, converted with one dict lookup each
+BOOL_VALUES = {value: True for value in TRUE_STRINGS | {'True', 'TRUE', True}}
+BOOL_VALUES.update({value: False for value in FALSE_STRINGS | {'False', 'FALSE', False}})
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in TRUE_STRINGS:
+            return True
+        if lowered in FALSE_STRINGS:
+            return False
+        raise ValueError(f"invalid bool value: {value!r}")
+    return bool(value)
+
+
+# conversion of a parsed value to each data_type, other data_types keep the parsed value
+CONVERTERS = {
+    'int': int,
+    'float': float,
+    'bool': _to_bool,
+}
+
+
+def convert_column(data_type, values):
+    # convert the values of one column of a batch; empty fields and nulls become None
+    convert = CONVERTERS.get(data_type)
+    if convert is None:
+        return values
+    if data_type == 'bool':
+        try:
+            return list(map(BOOL_VALUES.__getitem__, values))
+        except (KeyError, TypeError):
+            pass  # other spellings, empty fields or nulls
+    if '' in values or None in values:
+        return [None if value == '' or value is None else convert(value) for value in values]
+    return list(map(convert, values))
+
+
+def convert_batch(columns, names, records):
+    # turn a batch of records (sequences of values in the order of names) into row dicts
+    # holding a value for every column, columns missing from names are None
+    positions = {name: i for i, name in enumerate(names)}
+    fields = list(zip(*records)) if records else []
+    converted = []
+    for column in columns:
+        i = positions.get(column.name)
+        if i is None:
+            converted.append([None] * len(records))
+        else:
+            converted.append(convert_column(column.data_type, list(fields[i])))
+    column_names = [column.name for column in columns]
+    return [dict(zip(column_names, values)) for values in zip(*converted)]
+
+
+def batches(records, batch_size):
+    # consecutive lists of at most batch_size items of an iterator
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_csv(path, columns, header=True, delimiter=',', batch_size=DEFAULT_BATCH_ROWS):
+    # batches of row dicts of a CSV file; with header the first line names the fields,
+    # otherwise the fields are in the order of columns
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        names = next(reader, []) if header else [column.name for column in columns]
+        first = 0  # number of the first record of the batch
+        for batch in batches(reader, batch_size):
+            for i, record in enumerate(batch):
+                if len(record) != len(names):
+                    raise ValueError(f"record {first + i + 1} has {len(record)} fields, expected {len(names)}")
+            yield convert_batch(columns, names, batch)
+            first += len(batch)
+
+
+def read_jsonl(path, columns, batch_size=DEFAULT_BATCH_ROWS):
+    # batches of row dicts of a file holding one JSON object per line, blank lines are skipped
+    names = [column.name for column in columns]
+    with open(path, encoding='utf-8') as file:
+        lines = (line for line in file if line.strip())
+        for batch in batches(lines, batch_size):
+            objects = [json.loads(line) for line in batch]
+            records = [[obj.get(name) for name in names] for obj in objects]
+            yield convert_batch(columns, names, records)
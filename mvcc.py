@@ -0,0 +1,172 @@
+import threading
+import weakref
+from collections.abc import Mapping
+from itertools import islice
+
+# multi-version concurrency control: tables only grow, so a version of a table is a prefix
+# of its rows. A writer appends rows and index entries and then commits by publishing the
+# new row count of the table; a snapshot keeps the committed row count of every table and
+# reads through bounded views that never see the rows past it, so readers take no lock and
+# never wait for writers. In-memory BTrees are copy-on-write, a snapshot keeps the root it
+# started with and the nodes replaced since are freed once the last snapshot using them
+# is released
+
+
+class RowsView:
+    # the first num_rows rows of a list that writers keep appending to
+    def __init__(self, rows, num_rows):
+        self.rows = rows
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return self.rows[slice(*row_id.indices(self.num_rows))]
+        if row_id < 0:
+            row_id += self.num_rows
+        if not 0 <= row_id < self.num_rows:
+            raise IndexError(f"Row id {row_id} out of range")
+        return self.rows[row_id]
+
+    def __iter__(self):
+        return islice(self.rows, self.num_rows)
+
+    def take(self, row_ids):
+        rows = self.rows
+        return [rows[row_id] for row_id in row_ids]
+
+
+class ColumnView:
+    # the first num_rows values of a column array that writers keep appending to
+    def __init__(self, data, num_rows):
+        self.data = data
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, row_id):
+        if isinstance(row_id, slice):
+            return self.data[slice(*row_id.indices(self.num_rows))]
+        if row_id < 0:
+            row_id += self.num_rows
+        if not 0 <= row_id < self.num_rows:
+            raise IndexError(f"Row id {row_id} out of range")
+        return self.data[row_id]
+
+    def __iter__(self):
+        return islice(self.data, self.num_rows)
+
+    def copy(self):
+        # the values as an array of their own, for code that needs a fixed buffer
+        return self.data[:self.num_rows]
+
+
+class ColumnSlices(Mapping):
+    # the first num_rows values of every column array of a columnar table, as views over
+    # the arrays so taking a snapshot copies nothing
+    def __init__(self, column_data, num_rows):
+        self.column_data = column_data
+        self.num_rows = num_rows
+
+    def __getitem__(self, name):
+        return ColumnView(self.column_data[name], self.num_rows)
+
+    def __iter__(self):
+        return iter(self.column_data)
+
+    def __len__(self):
+        return len(self.column_data)
+
+    def live(self, name):
+        # the array writers keep appending to, without the bounds checks of a view; only for
+        # reading row ids below num_rows, e.g. the ids an index of the snapshot returned
+        return self.column_data[name]
+
+
+class HeapView:
+    # the first num_rows rows of a heap file
+    def __init__(self, heap, num_rows):
+        self.heap = heap
+        self.num_rows = num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def get(self, row_id):
+        if not 0 <= row_id < self.num_rows:
+            raise IndexError(f"Row id {row_id} out of range")
+        return self.heap.get(row_id)
+
+    def scan(self):
+        return islice(self.heap.scan(), self.num_rows)
+
+
+class Snapshot(Mapping):
+    # read-only views of the tables of a MiniDB as of one moment, by table name; usable
+    # as the db of a QueryPlan and by MiniDB.execute_select
+    # release the snapshot (or use it in a with statement) once done reading
+    def __init__(self, manager, tables):
+        self.manager = manager
+        self.tables = tables  # table name -> read-only Table view
+
+    __hash__ = object.__hash__  # snapshots are tracked by identity, see SnapshotManager
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def num_rows(self, name):
+        # rows of a table visible to the snapshot
+        return len(self.tables[name].rows)
+
+    def release(self):
+        self.manager.release(self)
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SnapshotManager:
+    # hands out snapshots that are consistent across tables: writers bump commits after
+    # publishing each change, and a snapshot that saw commits move while it read the
+    # committed row counts of the tables reads them again
+    def __init__(self):
+        self.commits = 0
+        self.snapshots = weakref.WeakSet()  # snapshots not released yet
+        self.lock = threading.Lock()  # guards snapshots, readers never wait on writers for it
+
+    def begin(self, tables):
+        while True:
+            commits = self.commits
+            views = {name: table.snapshot() for name, table in list(tables.items())}
+            if self.commits == commits:
+                break
+        snapshot = Snapshot(self, views)
+        with self.lock:
+            self.snapshots.add(snapshot)
+        return snapshot
+
+    def committed(self):
+        # called by a writer, holding the write lock, once its change is visible
+        self.commits += 1
+
+    def release(self, snapshot):
+        with self.lock:
+            self.snapshots.discard(snapshot)
+
+    def active(self):
+        # number of snapshots still open
+        with self.lock:
+            return len(self.snapshots)
@@ -0,0 +1,104 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# cache of execute_select results: entries are keyed by table name and normalized
+# where_clause and remember the version of the table they were computed from, so any
+# change to the table makes them stale without scanning the cache
+DEFAULT_CACHE_BYTES = 64 * 2**20  # memory budget of the cached rows, 0 disables the cache
+SIZE_SAMPLE_ROWS = 8  # rows measured to estimate the size of a result
+
+
+def result_size(rows):
+    # approximate bytes held by a list of row dicts, from the size of its first rows
+    size = sys.getsizeof(rows)
+    if not rows:
+        return size
+    sample = rows[:SIZE_SAMPLE_ROWS]
+    sample_bytes = 0
+    for row in sample:
+        sample_bytes += sys.getsizeof(row) + sum(map(sys.getsizeof, row.values()))
+    return size + sample_bytes * len(rows) // len(sample)
+
+
+class CacheEntry:
+    def __init__(self, version, rows, size):
+        self.version = version  # version of the table the rows were selected from
+        self.rows = rows
+        self.size = size
+
+
+class ResultCache:
+    # least recently used entries are evicted once the cached rows exceed max_bytes
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # entries dropped to stay within max_bytes
+        self.invalidations = 0  # entries dropped because their table changed
+
+    def get(self, key, version):
+        # the cached rows of key if they were selected from this version of the table, else None
+        # an entry of a newer version is kept, the lookup comes from an older snapshot
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version > version:
+                self.misses += 1
+                return None
+            if entry is not None and entry.version != version:
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.rows
+
+    def put(self, key, version, rows):
+        size = result_size(rows)
+        if size > self.max_bytes:
+            return  # would evict everything else, and maybe not even fit
+        with self.lock:
+            if key in self.entries:
+                if self.entries[key].version > version:
+                    return  # selected from an older snapshot, keep the newer entry
+                self._remove(key)
+            self.entries[key] = CacheEntry(version, rows, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key).size
+
+    def invalidate(self, table_name):
+        # drop every entry of a table, e.g. when the table is replaced by a new one
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == table_name]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def summary(self):
+        # plain dictionary of the counters, to size the cache from the hit rate and evictions
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
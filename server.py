@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# network front-end of a MiniDB: an asyncio server speaking line-delimited JSON over TCP
+#
+# every request is one JSON object on its own line with an id chosen by the client and an op:
+#   {"id": 1, "op": "select", "table": "orders", "where": ["custkey", "=", 7]}
+#   {"id": 2, "op": "query", "plan": {"project": ["n_name"], "from": {"scan": "nation"}}}
+#   {"id": 3, "op": "insert", "table": "orders", "row": {...}}
+#   {"id": 4, "op": "insert_many", "table": "orders", "rows": [{...}, ...]}
+#   {"id": 5, "op": "ping"}
+# a client may send many requests without waiting for the answers (pipelining); the server
+# works on them concurrently and tags every response line with the id of its request, so
+# the answers of different requests may interleave. Results are streamed in chunks of rows
+#   {"id": 1, "columns": ["orderkey", ...], "rows": [[1, ...], ...]}
+# followed by {"id": 1, "done": true, "count": <rows sent>}, or {"id": 1, "error": "..."}
+#
+# selects and queries run in a pool of threads on MVCC snapshots, so the event loop keeps
+# accepting and answering requests while they scan; scans of partitioned tables fan out to
+# worker processes from there (see parallel.py). The threads share the GIL with the event
+# loop: plans that are CPU-bound in Python (joins, sorts, aggregates of row tables) only take
+# turns with it, so the loop answers later the more of them run at once. The plans need the
+# tables of this process and its MVCC snapshots, so they can't move to a process pool; bound
+# the damage with fewer workers, or partition the large tables so the scans run in worker
+# processes. benchmarks/bench_server.py --heavy shows the loop's latency under such a load
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7878
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 2)  # threads running the requests
+DEFAULT_CHUNK_ROWS = 1000  # rows per response line of a streamed result
+MAX_PIPELINE = 64  # requests of one connection in flight at once, reading waits beyond it
+MAX_LINE_BYTES = 64 * 2**20  # longest request line, bounds the rows of one insert_many
+
+
+def as_where_clause(value):
+    # JSON has no tuples: turn the lists of a decoded where_clause back into tuples
+    if isinstance(value, list):
+        return tuple(as_where_clause(item) for item in value)
+    return value
+
+
+def build_plan(engine, spec):
+    # the plan tree described by a JSON object, built with the node classes of the query
+    # engine; the keys name the operator:
+    #   {"scan": name}
+    #   {"select": condition, "from": spec}
+    #   {"join": [left spec, right spec], "on": [column, ...]}  (on is optional)
+    #   {"project": [column, ...], "from": spec}
+    #   {"limit": n, "offset": k, "from": spec}  (offset is optional)
+    #   {"aggregate": ["count(*)", "sum(col) as total", ...], "group_by": [column, ...], "from": spec}
+    #   (group_by is optional)
+    #   {"order_by": ["col", "col desc", ...], "from": spec}
+    if not isinstance(spec, dict):
+        raise ValueError(f"Plan node must be an object, got {spec!r}")
+    if 'scan' in spec:
+        return engine.ScanNode(spec['scan'])
+    if 'select' in spec:
+        return engine.SelectNode(engine.parse_condition(spec['select']), build_plan(engine, spec['from']))
+    if 'join' in spec:
+        left, right = spec['join']
+        return engine.JoinNode(build_plan(engine, left), build_plan(engine, right), join_cols=spec.get('on'))
+    if 'project' in spec:
+        return engine.ProjectNode(build_plan(engine, spec['from']), spec['project'])
+    if 'limit' in spec:
+        return engine.LimitNode(build_plan(engine, spec['from']), spec['limit'], spec.get('offset', 0))
+    if 'aggregate' in spec:
+        return engine.AggregateNode(build_plan(engine, spec['from']), spec.get('group_by', []), spec['aggregate'])
+    if 'order_by' in spec:
+        return engine.SortNode(build_plan(engine, spec['from']), spec['order_by'])
+    raise ValueError(f"Unknown plan node {spec!r}")
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class Server:
+    # serves one MiniDB; engine is the query engine module (the 3rd issue) that plans the
+    # query requests, without it only selects and inserts are served
+    def __init__(self, db, engine=None, workers=DEFAULT_WORKERS, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 max_pipeline=MAX_PIPELINE):
+        self.db = db
+        self.engine = engine
+        self.chunk_rows = chunk_rows
+        self.max_pipeline = max_pipeline
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='minidb-server')
+        self.server = None
+        self.handlers = {
+            'ping': self.ping,
+            'select': self.select,
+            'query': self.query,
+            'insert': self.insert,
+            'insert_many': self.insert_many,
+        }
+        self.open_connections = {}  # handle() task of every open connection -> its writer
+        self.requests = 0  # requests answered
+        self.errors = 0  # requests answered with an error
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        # listen on host and port, returns the port, useful with port 0
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE_BYTES)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        if self.server is None:
+            await self.start(host, port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        # stop listening and close the open connections, requests still running are dropped
+        if self.server is not None:
+            self.server.close()
+            for writer in self.open_connections.values():
+                writer.close()  # ends the read the handler waits on
+            await asyncio.gather(*self.open_connections, return_exceptions=True)
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+    async def handle(self, reader, writer):
+        # read the requests of one connection and answer each in its own task
+        self.open_connections[asyncio.current_task()] = writer
+        slots = asyncio.Semaphore(self.max_pipeline)
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    break  # connection reset, or a line longer than MAX_LINE_BYTES
+                if not line:
+                    break
+                await slots.acquire()
+                task = asyncio.create_task(self.respond(writer, line, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.open_connections.pop(asyncio.current_task(), None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def respond(self, writer, line, slots):
+        loop = asyncio.get_running_loop()
+        request_id = None
+        lines = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            handler = self.handlers.get(request.get('op'))
+            if handler is None:
+                raise ValueError(f"Unknown op {request.get('op')!r}")
+            # handlers are generators of response lines, each line is computed and encoded by
+            # a worker thread; a ping is answered on the event loop itself, so its latency is
+            # the time the loop takes to get to a request
+            lines = handler(request_id, request)
+            while True:
+                if handler == self.ping:
+                    data = next(lines, None)
+                else:
+                    data = await loop.run_in_executor(self.executor, next, lines, None)
+                if data is None:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass  # the client is gone, nobody to answer
+        except Exception as error:
+            self.errors += 1
+            writer.write(encode({'id': request_id, 'error': f'{type(error).__name__}: {error}'}))
+        finally:
+            if lines is not None:
+                lines.close()  # releases the snapshot of a result that was not sent to the end
+            self.requests += 1
+            slots.release()
+
+    def stream(self, request_id, columns, rows):
+        # response lines of a result: chunks of rows as lists of values, then the row count
+        count = 0
+        while True:
+            chunk = [list(row) for row in islice(rows, self.chunk_rows)]
+            if not chunk:
+                break
+            count += len(chunk)
+            yield encode({'id': request_id, 'columns': columns, 'rows': chunk})
+        yield encode({'id': request_id, 'done': True, 'count': count})
+
+    def ping(self, request_id, request):
+        yield encode({'id': request_id, 'done': True})
+
+    def select(self, request_id, request):
+        # MiniDB.iter_select on a snapshot of the table: the rows are selected one chunk at a
+        # time as they are sent, a cached result of execute_select is sent when there is one
+        table_name = request['table']
+        rows = self.db.iter_select(table_name, as_where_clause(request.get('where')))
+        columns = [column.name for column in self.db.tables[table_name].columns]
+        yield from self.stream(request_id, columns, ([row[name] for name in columns] for row in rows))
+
+    def query(self, request_id, request):
+        # plan the query with the statistics of the database and run it on a snapshot, the
+        # rows are pulled from the plan one chunk at a time
+        if self.engine is None:
+            raise ValueError("This server has no query engine")
+        root = build_plan(self.engine, request['plan'])
+        plan = self.engine.QueryOptimizer(self.db.get_stats()).optimize(root)
+        with self.db.snapshot() as snapshot:
+            schema, rows = plan.iter_tuples(snapshot)
+            yield from self.stream(request_id, list(schema.names), rows)
+
+    def insert(self, request_id, request):
+        row_id = self.db.insert(request['table'], request['row'])
+        yield encode({'id': request_id, 'done': True, 'row_id': row_id})
+
+    def insert_many(self, request_id, request):
+        row_ids = self.db.insert_many(request['table'], request['rows'])
+        if row_ids is None:
+            raise ValueError(f"Load of {len(request['rows'])} rows into {request['table']} was rejected")
+        yield encode({'id': request_id, 'done': True, 'count': len(row_ids)})
@@ -0,0 +1,629 @@
+import array
+import bisect
+import marshal
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+# on-disk layout: the database file is an array of fixed-size pages read through mmap
+# page 0 holds the file header, the other pages hold table rows, BTree nodes and the catalog
+PAGE_SIZE = 4096
+DEFAULT_POOL_PAGES = 4096  # pages cached by the buffer pool, 16 MB with 4 KB pages
+MIN_POOL_PAGES = 8  # a BTree insert touches a handful of pages at once
+INITIAL_PAGES = 16
+MAGIC = b'MINIDB01'
+
+HEADER = struct.Struct('<8sIIQ')  # magic, page size, first catalog page, number of pages
+CATALOG_HEADER = struct.Struct('<II')  # next catalog page (0 ends the chain), bytes in this page
+HEAP_HEADER = struct.Struct('<HH')  # records in the page, offset where the record data starts
+SLOT = struct.Struct('<H')  # offset of one record, slots grow forward and records backward
+NODE_HEADER = struct.Struct('<I')  # length of the marshalled BTree node
+NODE_OVERHEAD = 32  # bytes of a marshalled node that are not keys or values
+
+
+class Pager:
+    # reads and writes whole pages of the database file through a memory map
+    def __init__(self, path, page_size=PAGE_SIZE):
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        self.free_pages = []  # pages released by dropped BTree nodes, reused before growing the file
+        if exists:
+            magic, page_size, self.catalog_page, self.num_pages = HEADER.unpack(self.file.read(HEADER.size))
+            if magic != MAGIC:
+                self.file.close()
+                raise ValueError(f"{path} is not a database file")
+        else:
+            if not 512 <= page_size <= 32768:
+                raise ValueError(f"Page size {page_size} must be between 512 and 32768 bytes")
+            self.catalog_page = 0
+            self.num_pages = 1  # the header page
+            self.file.truncate(page_size * INITIAL_PAGES)
+        self.page_size = page_size
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = len(self.map) // page_size
+        if not exists:
+            self.write_header()
+
+    def read(self, page_no):
+        start = page_no * self.page_size
+        return bytearray(self.map[start:start + self.page_size])
+
+    def write(self, page_no, data):
+        start = page_no * self.page_size
+        self.map[start:start + self.page_size] = data
+
+    def allocate(self):
+        # return the number of an unused page, growing the file geometrically when it is full
+        if self.free_pages:
+            return self.free_pages.pop()
+        page_no = self.num_pages
+        self.num_pages += 1
+        if self.num_pages > self.capacity:
+            self._grow(max(2 * self.capacity, self.num_pages))
+        return page_no
+
+    def _grow(self, capacity):
+        # a memory map cannot be extended on every platform, so map the longer file again
+        self.map.close()
+        self.file.truncate(capacity * self.page_size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = capacity
+
+    def write_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, self.page_size, self.catalog_page, self.num_pages)
+
+    def flush(self):
+        self.write_header()
+        self.map.flush()
+
+    def close(self):
+        self.flush()
+        self.map.close()
+        self.file.close()
+
+
+class Page:
+    def __init__(self, page_no, data):
+        self.page_no = page_no
+        self.data = data  # bytearray holding the page
+        self.dirty = False  # modified since it was read, written back on eviction or flush
+        self.cached = None  # decoded contents (rows or a BTree node) kept while the page is in the pool
+        self.serialize = None  # encodes cached into data before a write, for pages updated lazily
+
+
+class BufferPool:
+    # bounded LRU cache of pages: hot pages stay in memory, dirty pages are written back
+    # to the file when they are evicted or flushed
+    # never keep a Page across another call to the pool, it may have been evicted meanwhile
+    # snapshot readers share the pool with the writer, lock serializes their page accesses
+    def __init__(self, pager, capacity=DEFAULT_POOL_PAGES):
+        self.pager = pager
+        self.lock = threading.RLock()
+        self.capacity = max(capacity, MIN_POOL_PAGES)
+        self.pages = OrderedDict()  # page number -> Page, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # with a write-ahead log dirty pages stay in the pool until the next checkpoint;
+        # when only dirty pages are left the pool grows past capacity and asks for one
+        self.no_steal = False
+        self.needs_checkpoint = False
+
+    def get(self, page_no, sequential=False):
+        # get a page, reading it from the file on a miss
+        # pages read by sequential scans enter at the cold end of the LRU order, so a scan
+        # of a large table does not push the hot pages out of the pool
+        with self.lock:
+            page = self.pages.get(page_no)
+            if page is not None:
+                self.hits += 1
+                if not sequential:
+                    self.pages.move_to_end(page_no)
+                return page
+            self.misses += 1
+            page = Page(page_no, self.pager.read(page_no))
+            self._add(page)
+            if sequential:
+                self.pages.move_to_end(page_no, last=False)
+            return page
+
+    def new_page(self):
+        # allocate a zeroed page in the file
+        with self.lock:
+            page = Page(self.pager.allocate(), bytearray(self.pager.page_size))
+            page.dirty = True
+            self.pages.pop(page.page_no, None)  # a freed page may still be cached
+            self._add(page)
+            return page
+
+    def free(self, page_no):
+        # release a page so that new_page() can reuse it
+        with self.lock:
+            self.pages.pop(page_no, None)
+            self.pager.free_pages.append(page_no)
+
+    def mark_dirty(self, page):
+        page.dirty = True
+
+    def _add(self, page):
+        skipped = 0
+        while len(self.pages) >= self.capacity:
+            if self.no_steal:
+                # once a full pass found only dirty pages, the pool grows until the checkpoint
+                # instead of passing over all of them again on every add
+                if self.needs_checkpoint or skipped >= len(self.pages):
+                    self.needs_checkpoint = True
+                    break
+                page_no, victim = next(iter(self.pages.items()))
+                if victim.dirty:
+                    # cannot be written before the checkpoint, move it out of the way
+                    self.pages.move_to_end(page_no)
+                    skipped += 1
+                    continue
+            _, victim = self.pages.popitem(last=False)
+            self.evictions += 1
+            if victim.dirty:
+                self._write_back(victim)
+        self.pages[page.page_no] = page
+
+    def _write_back(self, page):
+        self.sync(page)
+        self.pager.write(page.page_no, page.data)
+
+    def sync(self, page):
+        # bring the bytes of a lazily updated page up to date with its decoded contents
+        if page.serialize is not None:
+            page.serialize(page)
+            page.serialize = None
+
+    def dirty_pages(self):
+        # the modified pages, with their bytes up to date
+        with self.lock:
+            dirty = [page for page in self.pages.values() if page.dirty]
+            for page in dirty:
+                self.sync(page)
+            return dirty
+
+    def flush(self):
+        # write every dirty page back and flush the memory map to disk
+        with self.lock:
+            for page in self.pages.values():
+                if page.dirty:
+                    self._write_back(page)
+                    page.dirty = False
+            self.pager.flush()
+            self.needs_checkpoint = False
+
+
+class HeapFile:
+    # table rows stored as marshalled tuples in slotted pages, in row id order
+    # page_nos and first_row_ids locate the page of a row id with one bisect
+    def __init__(self, pool, page_nos=b'', first_row_ids=b'', num_rows=0):
+        self.pool = pool
+        self.page_nos = array.array('q', page_nos)
+        self.first_row_ids = array.array('q', first_row_ids)  # row id of the first row of each page
+        self.num_rows = num_rows
+
+    def state(self):
+        # what the catalog stores to open the heap again
+        return self.page_nos.tobytes(), self.first_row_ids.tobytes(), self.num_rows
+
+    def __len__(self):
+        return self.num_rows
+
+    def append(self, values):
+        # store a tuple of column values and return its row id
+        record = marshal.dumps(values)
+        page_size = self.pool.pager.page_size
+        if len(record) > page_size - HEAP_HEADER.size - SLOT.size:
+            raise ValueError(f"Row of {len(record)} bytes does not fit in a {page_size} byte page")
+        page = self.pool.get(self.page_nos[-1]) if self.page_nos else None
+        if page is None or not self._fits(page, record):
+            page = self.pool.new_page()
+            HEAP_HEADER.pack_into(page.data, 0, 0, page_size)
+            page.cached = []
+            self.page_nos.append(page.page_no)
+            self.first_row_ids.append(self.num_rows)
+        count, free_end = HEAP_HEADER.unpack_from(page.data, 0)
+        start = free_end - len(record)
+        page.data[start:free_end] = record
+        SLOT.pack_into(page.data, HEAP_HEADER.size + SLOT.size * count, start)
+        HEAP_HEADER.pack_into(page.data, 0, count + 1, start)
+        if page.cached is not None:
+            page.cached.append(values)
+        self.pool.mark_dirty(page)
+        self.num_rows += 1
+        return self.num_rows - 1
+
+    def truncate(self, num_rows):
+        # drop the rows from row id num_rows on, freeing the pages left empty
+        if num_rows >= self.num_rows:
+            return
+        last = bisect.bisect_right(self.first_row_ids, num_rows - 1) - 1 if num_rows else -1
+        for page_no in self.page_nos[last + 1:]:
+            self.pool.free(page_no)
+        del self.page_nos[last + 1:]
+        del self.first_row_ids[last + 1:]
+        if last >= 0:
+            page = self.pool.get(self.page_nos[last])
+            keep = num_rows - self.first_row_ids[last]
+            free_end, = SLOT.unpack_from(page.data, HEAP_HEADER.size + SLOT.size * (keep - 1))
+            HEAP_HEADER.pack_into(page.data, 0, keep, free_end)
+            if page.cached is not None:
+                del page.cached[keep:]
+            self.pool.mark_dirty(page)
+        self.num_rows = num_rows
+
+    def _fits(self, page, record):
+        count, free_end = HEAP_HEADER.unpack_from(page.data, 0)
+        return free_end - len(record) >= HEAP_HEADER.size + SLOT.size * (count + 1)
+
+    def _records(self, page):
+        # every row of a page, decoded once while the page stays in the pool
+        if page.cached is None:
+            count, _ = HEAP_HEADER.unpack_from(page.data, 0)
+            starts = struct.unpack_from(f'<{count}H', page.data, HEAP_HEADER.size)
+            ends = (len(page.data),) + starts[:-1]
+            data = memoryview(page.data)
+            page.cached = [marshal.loads(data[start:end]) for start, end in zip(starts, ends)]
+        return page.cached
+
+    def get(self, row_id):
+        if not 0 <= row_id < self.num_rows:
+            raise IndexError(f"Row id {row_id} out of range")
+        i = bisect.bisect_right(self.first_row_ids, row_id) - 1
+        page = self.pool.get(self.page_nos[i])
+        slot = row_id - self.first_row_ids[i]
+        if page.cached is not None:
+            return page.cached[slot]
+        # random reads decode only the requested record, scans decode whole pages
+        start, = SLOT.unpack_from(page.data, HEAP_HEADER.size + SLOT.size * slot)
+        end = SLOT.unpack_from(page.data, HEAP_HEADER.size + SLOT.size * (slot - 1))[0] if slot else len(page.data)
+        return marshal.loads(memoryview(page.data)[start:end])
+
+    def scan(self):
+        # yield every row in row id order, one page in memory at a time
+        for page_no in self.page_nos:
+            yield from self._records(self.pool.get(page_no, sequential=True))
+
+
+class PageNode:
+    # BTree node decoded from a page, children and next are page numbers (0 means none)
+    def __init__(self, page_no, leaf=True, keys=None, values=None, next=0):
+        self.page_no = page_no
+        self.leaf = leaf
+        self.keys = keys if keys is not None else []
+        self.values = values if values is not None else []  # row ids in leaves, child pages otherwise
+        self.next = next
+        self.size = 0  # upper bound of the marshalled size, exact after a read or write
+
+
+class PagedBTree:
+    # B+-tree with one node per page, same interface as the in-memory BTree
+    # nodes split when their marshalled form outgrows a page; deletes leave underfull nodes
+    # in place instead of rebalancing, so the tree never has to rewrite its neighbours
+    # nodes change in place, so changes and lookups hold the lock of the buffer pool; a
+    # snapshot shares the tree and hides later entries by their row ids
+    def __init__(self, pool, root=None, size=0):
+        self.pool = pool
+        self.size = size
+        if root is None:
+            root = self._new_node(leaf=True).page_no
+        self.root = root
+
+    def __len__(self):
+        return self.size
+
+    def _new_node(self, leaf):
+        node = PageNode(self.pool.new_page().page_no, leaf)
+        self._write(node)
+        return node
+
+    def _read(self, page_no):
+        page = self.pool.get(page_no)
+        if page.cached is None:
+            length, = NODE_HEADER.unpack_from(page.data, 0)
+            leaf, keys, values, next_page = marshal.loads(memoryview(page.data)[NODE_HEADER.size:NODE_HEADER.size + length])
+            page.cached = PageNode(page_no, leaf, keys, values, next_page)
+            page.cached.size = length
+        return page.cached
+
+    def _encode(self, node):
+        # the marshalled node, or None when it does not fit in a page
+        payload = marshal.dumps((node.leaf, node.keys, node.values, node.next))
+        if len(payload) > self.pool.pager.page_size - NODE_HEADER.size:
+            return None
+        return payload
+
+    def _write(self, node, payload=None):
+        if payload is None:
+            payload = self._encode(node)
+        node.size = len(payload)
+        page = self.pool.get(node.page_no)
+        NODE_HEADER.pack_into(page.data, 0, len(payload))
+        page.data[NODE_HEADER.size:NODE_HEADER.size + len(payload)] = payload
+        page.cached = node
+        page.serialize = None
+        self.pool.mark_dirty(page)
+
+    def _touch(self, node):
+        # the node changed but still fits in its page: marshal it only when the page is
+        # written back, instead of on every insert
+        page = self.pool.get(node.page_no)
+        page.cached = node
+        page.serialize = self._serialize
+        self.pool.mark_dirty(page)
+
+    def _serialize(self, page):
+        payload = self._encode(page.cached)
+        if payload is None:
+            raise ValueError(f"BTree node of page {page.page_no} outgrew its page")
+        NODE_HEADER.pack_into(page.data, 0, len(payload))
+        page.data[NODE_HEADER.size:NODE_HEADER.size + len(payload)] = payload
+
+    def insert(self, key, value):
+        with self.pool.lock:
+            split = self._insert(self.root, key, value)
+            if split is not None:
+                separator, right = split
+                root = PageNode(self.pool.new_page().page_no, leaf=False, keys=[separator], values=[self.root, right])
+                self._write(root)
+                self.root = root.page_no
+            self.size += 1
+
+    def _insert(self, page_no, key, value):
+        node = self._read(page_no)
+        i = bisect.bisect_right(node.keys, key)
+        if node.leaf:
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+            node.size += _entry_size(key) + _entry_size(value)
+        else:
+            split = self._insert(node.values[i], key, value)
+            if split is None:
+                return None
+            node = self._read(page_no)  # reading the child may have evicted this page
+            separator, right = split
+            node.keys.insert(i, separator)
+            node.values.insert(i + 1, right)
+            node.size += _entry_size(separator) + _entry_size(right)
+        return self._store(node)
+
+    def _store(self, node):
+        # write a modified node, splitting it in two when it no longer fits in its page
+        if node.size <= self.pool.pager.page_size - NODE_HEADER.size:
+            self._touch(node)
+            return None
+        payload = self._encode(node)
+        if payload is not None:
+            self._write(node, payload)
+            return None
+        middle = len(node.keys) // 2
+        right = PageNode(self.pool.new_page().page_no, node.leaf)
+        if node.leaf:
+            separator = node.keys[middle]
+            right.keys, node.keys = node.keys[middle:], node.keys[:middle]
+            right.values, node.values = node.values[middle:], node.values[:middle]
+            right.next, node.next = node.next, right.page_no
+        else:
+            separator = node.keys[middle]
+            right.keys, node.keys = node.keys[middle + 1:], node.keys[:middle]
+            right.values, node.values = node.values[middle + 1:], node.values[:middle + 1]
+        for half in (node, right):
+            payload = self._encode(half)
+            if payload is None:
+                raise ValueError("BTree keys too large for a page")
+            self._write(half, payload)
+        return separator, right.page_no
+
+    def delete(self, key, value=None):
+        # delete one entry with the given key (and value, when given)
+        # returns False when no such entry exists
+        with self.pool.lock:
+            node = self._leaf_for(key)
+            i = bisect.bisect_left(node.keys, key)
+            while node is not None:
+                while i < len(node.keys) and node.keys[i] == key:
+                    if value is None or node.values[i] == value:
+                        del node.keys[i]
+                        del node.values[i]
+                        self._touch(node)
+                        self.size -= 1
+                        return True
+                    i += 1
+                if i < len(node.keys) or not node.next:
+                    return False
+                # equal keys may continue in the next leaf
+                node = self._read(node.next)
+                i = 0
+            return False
+
+    def _leaf_for(self, low):
+        node = self._read(self.root)
+        while not node.leaf:
+            node = self._read(node.values[0] if low is None else node.values[bisect.bisect_left(node.keys, low)])
+        return node
+
+    def _page_numbers(self):
+        # every page of the tree, found through the internal nodes
+        page_nos = [self.root]
+        level = [self.root]
+        while level and not self._read(level[0]).leaf:
+            level = [child for page_no in level for child in self._read(page_no).values]
+            page_nos.extend(level)
+        return page_nos
+
+    def bulk_load(self, items, fill=1.0):
+        # build the tree bottom-up from (key, value) pairs that are already sorted by key,
+        # filling each page up to fill of its size; this replaces the current contents
+        with self.pool.lock:
+            self._bulk_load(items, fill)
+
+    def _bulk_load(self, items, fill):
+        for page_no in self._page_numbers():
+            self.pool.free(page_no)
+        budget = (self.pool.pager.page_size - NODE_HEADER.size - NODE_OVERHEAD) * fill
+        self.size = 0
+        level = []  # (smallest key, page number) of every node of the level being built
+        previous = None
+        for chunk in _chunks_by_size(items, budget):
+            leaf = PageNode(self.pool.new_page().page_no, True, [key for key, _ in chunk], [value for _, value in chunk])
+            if previous is not None:
+                previous.next = leaf.page_no
+                self._write(previous)
+            previous = leaf
+            level.append((leaf.keys[0], leaf.page_no))
+            self.size += len(chunk)
+        if previous is None:
+            self.root = self._new_node(leaf=True).page_no
+            return
+        self._write(previous)
+        while len(level) > 1:
+            parents = []
+            for chunk in _chunks_by_size(level, budget):
+                node = PageNode(self.pool.new_page().page_no, False, [low for low, _ in chunk[1:]], [child for _, child in chunk])
+                self._write(node)
+                parents.append((chunk[0][0], node.page_no))
+            level = parents
+        self.root = level[0][1]
+
+    def search(self, key):
+        # return the values stored under key
+        with self.pool.lock:
+            return [value for _, value in self.items(key, key)]
+
+    def range_search(self, low=None, high=None, include_low=True, include_high=True):
+        # return the values whose keys lie between low and high, in key order
+        with self.pool.lock:
+            return [value for _, value in self.items(low, high, include_low, include_high)]
+
+    def snapshot(self):
+        # nodes are not versioned, see the class comment
+        return self
+
+    def reversed_items(self, page_no=None):
+        # iterate the (key, value) pairs in descending key order, through the internal nodes
+        # since leaves only link to the next one; the caller holds the lock of the pool
+        node = self._read(self.root if page_no is None else page_no)
+        if node.leaf:
+            return zip(reversed(node.keys[:]), reversed(node.values[:]))
+        return chain.from_iterable(map(self.reversed_items, reversed(node.values[:])))
+
+    def first_key(self, reverse=False, accept=None):
+        # the smallest key (the largest with reverse) whose value passes accept, or None
+        with self.pool.lock:
+            for key, value in self.reversed_items() if reverse else self.items():
+                if accept is None or accept(value):
+                    return key
+            return None
+
+    def items(self, low=None, high=None, include_low=True, include_high=True):
+        # iterate the (key, value) pairs between low and high in key order
+        # a bound of None leaves that side of the range open
+        # the caller holds the lock of the pool while a writer may run, see range_search()
+        node = self._leaf_for(low)
+        if low is None:
+            i = 0
+        elif include_low:
+            i = bisect.bisect_left(node.keys, low)
+        else:
+            i = bisect.bisect_right(node.keys, low)
+        while True:
+            keys, values = node.keys, node.values
+            while i < len(keys):
+                key = keys[i]
+                if high is not None and (key > high or (key == high and not include_high)):
+                    return
+                if include_low or key != low:
+                    yield key, values[i]
+                i += 1
+            if not node.next:
+                return
+            node = self._read(node.next)
+            i = 0
+
+
+def _entry_size(value):
+    # upper bound of the bytes value adds to a marshalled node, a repeated object may be
+    # written as a 5 byte reference instead of its own encoding
+    return max(len(marshal.dumps(value)), 5)
+
+
+def _chunks_by_size(entries, budget):
+    # group entries into consecutive chunks whose marshalled size stays within budget bytes
+    chunk = []
+    used = 0
+    for entry in entries:
+        size = len(marshal.dumps(entry))
+        if chunk and used + size > budget:
+            yield chunk
+            chunk = []
+            used = 0
+        chunk.append(entry)
+        used += size
+    if chunk:
+        yield chunk
+
+
+class DataFile:
+    # a database file: pager, buffer pool and the catalog describing the tables stored in it
+    def __init__(self, path, pool_pages=DEFAULT_POOL_PAGES, page_size=PAGE_SIZE, wal=None):
+        self.path = path
+        self.pager = Pager(path, page_size)
+        if wal is not None:
+            wal.restore_pages(self.pager)
+        self.pool = BufferPool(self.pager, pool_pages)
+        self.catalog_pages = []  # pages holding the catalog, reused when it is saved again
+        self.catalog = self._read_catalog()
+        self.pager.free_pages = self.catalog.pop('free_pages', [])
+
+    def new_heap(self):
+        return HeapFile(self.pool)
+
+    def open_heap(self, state):
+        return HeapFile(self.pool, *state)
+
+    def new_btree(self):
+        return PagedBTree(self.pool)
+
+    def open_btree(self, root, size):
+        return PagedBTree(self.pool, root, size)
+
+    def _read_catalog(self):
+        payload = bytearray()
+        page_no = self.pager.catalog_page
+        while page_no:
+            self.catalog_pages.append(page_no)
+            data = self.pager.read(page_no)
+            next_page, length = CATALOG_HEADER.unpack_from(data, 0)
+            payload += data[CATALOG_HEADER.size:CATALOG_HEADER.size + length]
+            page_no = next_page
+        return marshal.loads(payload) if payload else {}
+
+    def save_catalog(self, catalog):
+        # store the catalog in a chain of pages, together with the free page list
+        room = self.pager.page_size - CATALOG_HEADER.size
+        payload = marshal.dumps(dict(catalog, free_pages=self.pager.free_pages))
+        while len(self.catalog_pages) * room < len(payload):
+            self.catalog_pages.append(self.pool.new_page().page_no)
+        # allocating pages only shrinks the free page list, so the payload still fits
+        payload = marshal.dumps(dict(catalog, free_pages=self.pager.free_pages))
+        for i, page_no in enumerate(self.catalog_pages):
+            page = self.pool.get(page_no)
+            chunk = payload[i * room:(i + 1) * room]
+            next_page = self.catalog_pages[i + 1] if i + 1 < len(self.catalog_pages) else 0
+            CATALOG_HEADER.pack_into(page.data, 0, next_page, len(chunk))
+            page.data[CATALOG_HEADER.size:CATALOG_HEADER.size + len(chunk)] = chunk
+            self.pool.mark_dirty(page)
+        self.pager.catalog_page = self.catalog_pages[0] if self.catalog_pages else 0
+        self.catalog = catalog
+
+    def flush(self):
+        self.pool.flush()
+
+    def close(self):
+        self.pool.flush()
+        self.pager.close()
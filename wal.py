@@ -0,0 +1,210 @@
+import marshal
+import os
+import struct
+import threading
+import time
+import zlib
+
+# write-ahead log of a database file: every insert into a paged table is appended here
+# before the pages change, so the inserts since the last checkpoint can be replayed
+DEFAULT_CHECKPOINT_BYTES = 64 * 2**20  # log size that triggers a checkpoint, bounds recovery time
+DEFAULT_GROUP_COMMIT_DELAY = 0.0  # seconds a commit waits for others to join its fsync
+
+RECORD_HEADER = struct.Struct('<IBI')  # payload length, record type, crc32 of the payload
+PAGE_NUMBER = struct.Struct('<Q')
+
+# record types
+INSERT = 1  # (table name, tuple of column values)
+PAGE = 2  # page number followed by the page image written by a checkpoint
+CHECKPOINT = 3  # (number of pages, first catalog page) once every page image is logged
+
+_fsync = getattr(os, 'fdatasync', os.fsync)
+
+
+class WriteAheadLog:
+    # records are buffered in memory and made durable by commit(): the first committer
+    # becomes the leader and writes and fsyncs everything buffered so far, the commits
+    # arriving meanwhile wait and are covered by the next single fsync (group commit)
+    def __init__(self, path, group_commit_delay=DEFAULT_GROUP_COMMIT_DELAY,
+                 checkpoint_bytes=DEFAULT_CHECKPOINT_BYTES):
+        self.path = path
+        self.group_commit_delay = group_commit_delay
+        self.checkpoint_bytes = checkpoint_bytes
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        self.records, valid_end = self._read_records()
+        # drop a torn record at the end left by a crash in the middle of a write
+        os.ftruncate(self.fd, valid_end)
+        os.lseek(self.fd, valid_end, os.SEEK_SET)
+        self.buffer = bytearray()  # records appended but not written yet
+        self.lsn = valid_end  # log sequence number: bytes appended so far
+        self.durable_lsn = valid_end  # bytes known to be on disk
+        self.log_bytes = valid_end  # size of the log file, reset by checkpoints
+        self.flushing = False
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+        self.fsyncs = 0
+        self.pool = None  # buffer pool of the logged database file
+        self.checkpoint_hook = None  # called by maybe_checkpoint() to checkpoint the database
+
+    def _read_records(self):
+        # every complete record of the log file, and the offset where they end
+        size = os.fstat(self.fd).st_size
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        data = b''
+        while len(data) < size:
+            chunk = os.read(self.fd, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        records = []
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            length, record_type, crc = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            records.append((record_type, payload))
+            offset = start + length
+        return records, offset
+
+    def restore_pages(self, pager):
+        # finish a checkpoint that crashed after logging its page images: write the images
+        # to the data file; must run before the catalog of the file is read
+        checkpoint = None
+        for i, (record_type, _) in enumerate(self.records):
+            if record_type == CHECKPOINT:
+                checkpoint = i
+        if checkpoint is None:
+            return
+        num_pages, catalog_page = marshal.loads(self.records[checkpoint][1])
+        if num_pages > pager.capacity:
+            pager._grow(num_pages)
+        for record_type, payload in self.records[:checkpoint]:
+            if record_type == PAGE:
+                page_no, = PAGE_NUMBER.unpack_from(payload, 0)
+                pager.write(page_no, payload[PAGE_NUMBER.size:])
+        pager.num_pages = num_pages
+        pager.catalog_page = catalog_page
+        pager.flush()
+        # the inserts before the checkpoint are already in the restored pages
+        self.records = self.records[checkpoint + 1:]
+
+    def replay(self):
+        # the logged inserts that are not part of the data file yet, in log order
+        for record_type, payload in self.records:
+            if record_type == INSERT:
+                yield marshal.loads(payload)
+        self.records = []
+
+    def _append(self, record_type, payload):
+        self.buffer += RECORD_HEADER.pack(len(payload), record_type, zlib.crc32(payload))
+        self.buffer += payload
+        self.lsn += RECORD_HEADER.size + len(payload)
+        return self.lsn
+
+    def log_insert(self, table_name, values):
+        # append an insert record and return its lsn, durable once commit(lsn) returns
+        payload = marshal.dumps((table_name, values))
+        with self.lock:
+            return self._append(INSERT, payload)
+
+    def commit(self, lsn=None):
+        # wait until the log is durable up to lsn (everything appended so far by default)
+        with self.lock:
+            if lsn is None:
+                lsn = self.lsn
+            while self.durable_lsn < lsn:
+                if self.flushing:
+                    # another commit is the leader, its fsync or the next one covers this lsn
+                    self.flushed.wait()
+                    continue
+                self._flush_as_leader()
+
+    def _flush_as_leader(self):
+        # called with the lock held, releases it during the write and fsync
+        self.flushing = True
+        try:
+            if self.group_commit_delay:
+                self.lock.release()
+                try:
+                    time.sleep(self.group_commit_delay)
+                finally:
+                    self.lock.acquire()
+            data, self.buffer = bytes(self.buffer), bytearray()
+            end = self.lsn
+            self.lock.release()
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self.fd, view):]
+                _fsync(self.fd)
+            finally:
+                self.lock.acquire()
+            self.fsyncs += 1
+            self.log_bytes += len(data)
+            self.durable_lsn = end
+        finally:
+            self.flushing = False
+            self.flushed.notify_all()
+
+    def attach(self, pool, checkpoint_hook):
+        # the pages of pool are only written to the data file by checkpoints (no-steal),
+        # so that the file always holds the state of the last checkpoint
+        self.pool = pool
+        self.checkpoint_hook = checkpoint_hook
+        pool.no_steal = True
+
+    def maybe_checkpoint(self):
+        # checkpoint between two statements once the log or the dirty pages grew too large
+        if self.checkpoint_hook is None:
+            return
+        if self.log_bytes + len(self.buffer) >= self.checkpoint_bytes or self.pool.needs_checkpoint:
+            self.checkpoint_hook()
+
+    def checkpoint(self, pager):
+        # make the dirty pages of the pool durable and truncate the log:
+        # 1. log the image of every dirty page and fsync, a crash from here on is finished
+        #    by restore_pages()
+        # 2. write the pages to the data file and flush it
+        # 3. truncate the log, the data file now holds everything it described
+        dirty = self.pool.dirty_pages()
+        with self.lock:
+            for page in dirty:
+                self._append(PAGE, PAGE_NUMBER.pack(page.page_no) + bytes(page.data))
+            checkpoint_lsn = self._append(CHECKPOINT, marshal.dumps((pager.num_pages, pager.catalog_page)))
+        self.commit(checkpoint_lsn)
+        self.pool.flush()
+        with self.lock:
+            while self.flushing:
+                self.flushed.wait()
+            # records appended after the checkpoint record are kept: the ones already
+            # written are written again at the start of the truncated log, the others
+            # stay in the buffer
+            written_lsn = self.lsn - len(self.buffer)
+            tail = self._read_back(checkpoint_lsn, written_lsn)
+            os.ftruncate(self.fd, 0)
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            view = memoryview(tail)
+            while view:
+                view = view[os.write(self.fd, view):]
+            _fsync(self.fd)
+            self.log_bytes = len(tail)
+
+    def _read_back(self, start_lsn, end_lsn):
+        # the written records between two lsns, read from the log file; called with the
+        # lock held and no flush running, the file then ends at the lsn of the buffer start
+        if end_lsn <= start_lsn:
+            return b''
+        os.lseek(self.fd, self.log_bytes - (end_lsn - start_lsn), os.SEEK_SET)
+        data = b''
+        while len(data) < end_lsn - start_lsn:
+            chunk = os.read(self.fd, end_lsn - start_lsn - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def close(self):
+        self.commit()
+        os.close(self.fd)